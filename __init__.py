@@ -1,11 +1,33 @@
 #!/usr/bin/env python2.6
 # -*- coding: utf-8 -*-
 
-from milky.api import API, DATE_FORMAT, \
-        PERMS_READ, PERMS_WRITE, PERMS_DELETE, \
-        HAS_DUE_TIME, HAS_NOT_DUE_TIME, \
-        FREQ_YEARLY, FREQ_MONTHLY, FREQ_WEEKLY, FREQ_DAILY, \
-        PRIORITY_HIGH, PRIORITY_MEDIUM, PRIORITY_LOW, PRIORITY_NONE
-from milky.error import MilkyError, RTMSystemError, RTMRequestError, \
-        ERRCODE_UNKNOWN, ERRCODE_NETWORK, ERRCODE_JSON, ERRCODE_LOGIN_FAILED
+# Names are imported from their module on first access, so that importing
+# milky alone stays cheap (asyncapi pulls in asyncio, for instance).
+_EXPORTS = {
+    'milky.api': ('API', 'DATE_FORMAT',
+        'PERMS_READ', 'PERMS_WRITE', 'PERMS_DELETE',
+        'HAS_DUE_TIME', 'HAS_NOT_DUE_TIME',
+        'FREQ_YEARLY', 'FREQ_MONTHLY', 'FREQ_WEEKLY', 'FREQ_DAILY',
+        'PRIORITY_HIGH', 'PRIORITY_MEDIUM', 'PRIORITY_LOW', 'PRIORITY_NONE', ),
+    'milky.asyncapi': ('AsyncAPI', ),
+    'milky.pool': ('ClientPool', ),
+    'milky.error': ('MilkyError', 'RTMSystemError', 'RTMRequestError',
+        'ERRCODE_UNKNOWN', 'ERRCODE_NETWORK', 'ERRCODE_JSON',
+        'ERRCODE_LOGIN_FAILED', ), }
 
+_MODULES = dict((name, module)
+        for (module, names) in _EXPORTS.items() for name in names)
+
+__all__ = sorted(_MODULES)
+
+def __getattr__(name):
+    module = _MODULES.get(name)
+    if module is None:
+        raise AttributeError('module %r has no attribute %r' % (__name__, name))
+    import importlib
+    value = getattr(importlib.import_module(module), name)
+    globals()[name] = value
+    return value
+
+def __dir__():
+    return sorted(set(globals()) | set(_MODULES))
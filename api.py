@@ -1,9 +1,9 @@
 # -*- coding: utf-8 -*-
 
+import codecs
 import logging
 import types
-import urllib
-import hashlib
+import urllib.parse
 from collections import OrderedDict
 
 try:
@@ -14,14 +14,33 @@ except ImportError:
     except ImportError:
         from django.utils import json
 
-from milky.error import RTMSystemError, RTMRequestError, \
+from milky.error import MilkyError, RTMSystemError, RTMRequestError, \
         ERRCODE_NETWORK, ERRCODE_JSON, ERRCODE_UNKNOWN
-from milky import request
+from milky import request, models
+from milky.batch import Batch, DEFAULT_BATCH_WORKERS
+from milky.instrument import CallEvent, PHASE_SIGN, PHASE_WAIT, \
+        PHASE_DECODE, PHASE_PARSE
+from milky.signing import Signer, encode_query
+from milky.stream import ArraySplitter, TASKS_LIST_PATH
+from milky.transport import PooledTransport
+from milky.cache import MISSING, request_key
+from milky.credentials import covers
+from milky.ratelimit import PRIORITY_INTERACTIVE, PRIORITY_BULK
+from milky.singleflight import SingleFlight, coalescable
 
 API_URL = 'http://api.rememberthemilk.com/services/rest/'
 AUTH_URL = 'http://www.rememberthemilk.com/services/auth/'
 
 CHARSET = 'utf-8'
+CHUNK_SIZE = 64 * 1024
+
+# When to send the signed parameters as a form-encoded POST body
+POST_NEVER = u'never'
+POST_AUTO = u'auto'
+POST_ALWAYS = u'always'
+# POST_AUTO threshold for the encoded parameters, in bytes
+POST_THRESHOLD = 2048
+
 DATE_FORMAT = '%Y-%m-%dT%H:%M:%SZ'
 PERMS_READ = u'read'
 PERMS_WRITE = u'write'
@@ -55,6 +74,31 @@ class API(object):
         shared_secret - RTM shared secret.
         perms - Access permissions (Default: "read")
         token - token for granted access (Optional)
+        transport - HTTP transport (Default: a keep-alive PooledTransport
+            asking for compressed responses). A transport with validators
+            revalidates reads; answers of 304 Not Modified give the models
+            of the kept response: do not change them in place (sync.Replica
+            does).
+        api_url - REST endpoint, e.g. a local stand-in server in tests.
+        scheduler - ratelimit.Scheduler to pace requests; share one
+            (e.g. ratelimit.shared_scheduler()) between instances.
+        retry - retry.RetryPolicy for transient failures (Optional)
+        cache - cache.ResponseCache for read-only methods (Optional)
+        post - POST_NEVER, POST_ALWAYS or POST_AUTO to POST requests
+            whose parameters exceed post_threshold bytes (Default: never,
+            every request is a GET). POST_AUTO avoids URLs too long for
+            proxies with large notes.
+        instrument - instrument.Instrument receiving a CallEvent per call,
+            e.g. instrument.Histograms() (Optional)
+        credentials - credentials.Credentials keeping the token and frob
+            of user across restarts (Optional)
+        user - key of this account in credentials (Default: '')
+        parse_pool - parallel.ParsePool decoding and parsing large
+            tasks.getList responses in worker processes (Optional)
+        singleflight - True, or a singleflight.SingleFlight shared
+            between instances, to let concurrent identical reads share one
+            request (Default: off). Coalesced callers get the same model
+            objects: do not change them in place (sync.Replica does).
 
     Permissions:
         read - gives the ability to read task, contact, group and list 
@@ -66,56 +110,109 @@ class API(object):
     """
 
     def __init__(self, api_key, shared_secret, perms=PERMS_READ, 
-            frob=None, token=None, user_agent=None):
+            frob=None, token=None, user_agent=None, transport=None,
+            api_url=API_URL, scheduler=None, retry=None, cache=None,
+            post=POST_NEVER, post_threshold=POST_THRESHOLD, instrument=None,
+            credentials=None, user=u'', parse_pool=None, singleflight=None):
 
         """Create RTM instance."""
 
         self.api_key = api_key
         self.shared_secret = shared_secret
+        self._signer = Signer(shared_secret)
         self.perms = perms
         self.frob = frob
         self.token = token
         self.user_agent = user_agent
-
-        if user_agent:
-            class RTMURLopener(urllib.FancyURLopener):
-                version = user_agent
-            urllib._urlopener = RTMURLopener()
-
-        for prefix, methods in request.METHODS.items():
-            setattr(self, prefix, Request(self, prefix, methods))
+        self.api_url = api_url
+
+        if transport is None:
+            transport = PooledTransport(
+                    headers=user_agent and {'User-Agent': user_agent} or None)
+        self.transport = transport
+        self.scheduler = scheduler
+        self.retry = retry
+        self.cache = cache
+        self.post = post
+        self.post_threshold = post_threshold
+        self.instrument = instrument
+        self.credentials = credentials
+        self.user = user
+        self.parse_pool = parse_pool
+        if singleflight is True:
+            singleflight = SingleFlight()
+        self.singleflight = singleflight or None
+
+    def __getattr__(self, prefix):
+        # Method proxies are built on first use and kept as attributes.
+        methods = request.METHODS.get(prefix)
+        if methods is None:
+            raise AttributeError('No such attribute %s' % prefix)
+        proxy = Request(self, prefix, methods)
+        setattr(self, prefix, proxy)
+        return proxy
 
     def __sign(self, params):
         """Generate sign with MD5 hash."""
 
-        sortedkeys = sorted(params, key=str.lower)
-        pairs=""
-        for keyItem in sortedkeys:
-            pairs=pairs+"{}{}".format(keyItem,params[keyItem])        
-        pairs = pairs.encode(CHARSET)
-        return hashlib.md5(self.shared_secret.encode(CHARSET)+pairs).hexdigest()
-
-    def __call(self, url, params):
-        if params:
-            url = '%s?%s' % (url, urllib.parse.urlencode(OrderedDict(
-                [(k, v.encode(CHARSET) if type(v) is str else v) \
-                        for (k, v) in params.items()])))
+        return self._signer.sign(params)
+
+    def __call(self, params):
+        response = self.transport.request(*self._http_request(params),
+                **self._conditional(params))
+        if response.status != 200:
+            raise IOError('HTTP %d %s' % (response.status, response.reason))
+        return response
+
+    def _http_request(self, params):
+        """Return (method, url, body, headers) for signed params."""
+
+        query = encode_query(params.items())
+        if self.post == POST_ALWAYS or (self.post == POST_AUTO
+                and len(query) > self.post_threshold):
+            logging.debug('POST %s %s (%d bytes)', self.api_url,
+                    params['method'], len(query))
+            return 'POST', self.api_url, query.encode('ascii'), \
+                    {'Content-Type': 'application/x-www-form-urlencoded'}
+
+        url = '%s?%s' % (self.api_url, query)
         logging.debug(url)
-        return urllib.request.urlopen(url)
+        return 'GET', url, None, None
 
-    def get(self, method, auth_required, model_cls, **params):
-        params = OrderedDict(params)
+    def _conditional(self, params):
+        """Extra transport.request() arguments: the request key of a read
+        when the transport keeps validators."""
+
+        if getattr(self.transport, 'validators', None) is not None \
+                and coalescable(params):
+            return {'conditional': request_key(params)}
+        return {}
+
+    def _prepare(self, method, params, token=None):
+        """Add the common parameters and the signature.
+
+        The result is in signature order with api_sig last, so the query
+        string is built from it as is.
+        """
+
+        params = dict(params)
         params['method'] = method
         params['api_key'] = self.api_key
         params['format'] = 'json'
-        if auth_required:
-            params['auth_token'] = self.get_token()
-        params['api_sig'] = self.__sign(params)
+        if token:
+            params['auth_token'] = token
+        return OrderedDict(self._signer.signed(params))
+
+    def _priority(self, params):
+        """Scheduler lane: reads go ahead of timeline writes."""
+
+        if 'timeline' in params:
+            return PRIORITY_BULK
+        return PRIORITY_INTERACTIVE
+
+    def _decode(self, row):
+        """Decode a raw response body and check its status."""
 
-        try:
-            row = self.__call(API_URL, params).read()
-        except Exception as e:
-            raise RTMSystemError('Cannot connect RTM.', ERRCODE_NETWORK)
         logging.debug(row)
 
         try:
@@ -123,11 +220,16 @@ class API(object):
         except Exception as e:
             raise RTMSystemError('Cannot parse response.', ERRCODE_JSON)
 
+        return self._check(rsp)
+
+    def _check(self, rsp):
+        """Raise the error of a failed response; return rsp."""
+
         if rsp['stat'] != 'ok':
             if rsp['err'] \
                     and rsp['err']['msg'] \
                     and rsp['err']['code']:
-                logging.debug(row)
+                logging.debug(rsp)
                 msg = rsp['err']['msg'].encode(CHARSET)
                 code = int(rsp['err']['code'])
                 logging.warn("%s (%d)" % (msg, code))
@@ -135,27 +237,267 @@ class API(object):
             else:
                 raise RTMSystemError('An unknown error has occurred.', ERRCODE_UNKNOWN)
 
-        return model_cls._parse(rsp)
+        return rsp
+
+    def _fetch(self, params, event=None):
+        """Send one signed request; return (checked rsp, transport
+        Response)."""
+
+        if self.scheduler is not None:
+            self.scheduler.acquire(self, self._priority(params))
+        if event is not None:
+            event.lap(PHASE_WAIT)
+            event.attempts += 1
+
+        try:
+            response = self.__call(params)
+        except Exception as e:
+            raise RTMSystemError('Cannot connect RTM.', ERRCODE_NETWORK)
+
+        if event is not None:
+            event.response(response)
+        if response.not_modified and response.parsed is not None:
+            # Decoded when the kept response arrived.
+            rsp = response.parsed[0]
+        elif self.parse_pool is not None \
+                and self.parse_pool.accepts(params['method'], response.body):
+            try:
+                rsp = self.parse_pool.parse(response.body)
+            except Exception as e:
+                raise RTMSystemError('Cannot parse response.', ERRCODE_JSON)
+            rsp = self._check(rsp)
+        else:
+            rsp = self._decode(response.body)
+        if event is not None:
+            event.lap(PHASE_DECODE)
+        return rsp, response
+
+    def _result(self, model_cls, rsp, response):
+        """model_cls._parse(rsp), kept with the response: a 304 answer
+        served from it gives the same result."""
+
+        parsed = response.parsed
+        if parsed is not None and parsed[0] is rsp and parsed[1] is model_cls:
+            return parsed[2]
+        result = model_cls._parse(rsp)
+        response.parsed = (rsp, model_cls, result)
+        return result
+
+    def _cached(self, params):
+        if self.cache is None:
+            return MISSING
+        return self.cache.get(params)
+
+    def _store(self, params, result):
+        if self.cache is not None:
+            if 'timeline' in params:
+                self.cache.invalidate(params['method'])
+            else:
+                self.cache.set(params, result)
+
+    def _get(self, method, auth_required, model_cls, params):
+        """Return (result, rsp); rsp is None for cached results."""
+
+        token = auth_required and self.get_token() or None
+        if self.instrument is None:
+            return self._call(method, model_cls, params, token)
+
+        event = CallEvent(method)
+        try:
+            return self._call(method, model_cls, params, token, event)
+        except MilkyError as e:
+            event.error_code = e.no
+            raise
+        finally:
+            event.end()
+            self.instrument.record(event)
+
+    def _call(self, method, model_cls, params, token, event=None):
+        params = self._prepare(method, params, token)
+        if event is not None:
+            event.lap(PHASE_SIGN)
+
+        result = self._cached(params)
+        if result is not MISSING:
+            if event is not None:
+                event.cached = True
+            return result, None
+
+        if self.singleflight and coalescable(params):
+            (result, rsp), shared = self.singleflight.do(request_key(params),
+                    lambda: self._request(method, model_cls, params, event))
+            if shared and event is not None:
+                event.coalesced = True
+                event.lap(PHASE_WAIT)
+            return result, rsp
+        return self._request(method, model_cls, params, event)
+
+    def _request(self, method, model_cls, params, event=None):
+        """Fetch, parse and cache a signed request; return (result, rsp)."""
+
+        if self.retry is None:
+            rsp, response = self._fetch(params, event)
+        else:
+            rsp, response = self.retry.call(method, 'timeline' in params,
+                    lambda: self._fetch(params, event))
+
+        result = self._result(model_cls, rsp, response)
+        if event is not None:
+            event.lap(PHASE_PARSE)
+        self._store(params, result)
+        return result, rsp
+
+    def get(self, method, auth_required, model_cls, **params):
+        return self._get(method, auth_required, model_cls, params)[0]
+
+    def batch(self, timeline=None, max_workers=DEFAULT_BATCH_WORKERS,
+            rollback=False):
+        """Collect timeline writes and send them together, see batch.Batch."""
+
+        return Batch(self, timeline=timeline, max_workers=max_workers,
+                rollback=rollback)
+
+    def _stream(self, method, path, chunk_size, params):
+        """Yield the decoded elements of the array at path while the
+        response downloads."""
+
+        params = self._prepare(method, params, self.get_token())
+
+        if self.scheduler is not None:
+            self.scheduler.acquire(self, self._priority(params))
+
+        try:
+            response = self.transport.stream(*self._http_request(params))
+            if response.status != 200:
+                response.close()
+                raise IOError('HTTP %d %s' % (response.status, response.reason))
+        except Exception as e:
+            raise RTMSystemError('Cannot connect RTM.', ERRCODE_NETWORK)
+
+        splitter = ArraySplitter(path)
+        decoder = codecs.getincrementaldecoder(CHARSET)()
+        with response:
+            while True:
+                try:
+                    chunk = response.read(chunk_size)
+                except Exception as e:
+                    raise RTMSystemError('Cannot connect RTM.', ERRCODE_NETWORK)
+                for element in self._elements(splitter, decoder, chunk):
+                    yield element
+                if not chunk:
+                    break
+        splitter.close()
+        self._decode(splitter.skeleton)
+
+    def _elements(self, splitter, decoder, chunk):
+        """Yield the decoded elements completed by a chunk of a streamed
+        body; an empty chunk ends it."""
+
+        try:
+            text = decoder.decode(chunk, not chunk)
+        except UnicodeDecodeError as e:
+            raise RTMSystemError('Cannot parse response.', ERRCODE_JSON)
+        for element in splitter.feed(text):
+            try:
+                yield json.loads(element)
+            except ValueError as e:
+                raise RTMSystemError('Cannot parse response.', ERRCODE_JSON)
+
+    def _records(self, element):
+        """Yield the TaskRecords of a streamed tasks.getList list."""
+
+        taskseries = element.pop(u'taskseries', None)
+        tasklist = models.TaskList._parse(element)
+        if type(taskseries) is not list:
+            taskseries = taskseries and [taskseries, ] or []
+        for obj in taskseries:
+            series = models.LazyTaskSeries._parse(obj)
+            for task in series.task:
+                yield models.TaskRecord(tasklist, series, task)
+
+    def stream_tasks(self, chunk_size=CHUNK_SIZE, **params):
+        """Yield the TaskList objects of rtm.tasks.getList while the
+        response downloads.
+
+        Takes the tasks.getList parameters. Only one list is held in memory
+        at a time instead of the raw body and the whole decoded response.
+        Streamed responses are neither cached nor retried.
+        """
+
+        for element in self._stream('rtm.tasks.getList', TASKS_LIST_PATH,
+                chunk_size, params):
+            yield models.TaskList._parse(element)
+
+    def iter_tasks(self, chunk_size=CHUNK_SIZE, **params):
+        """Yield a TaskRecord(list, taskseries, task) per task of
+        rtm.tasks.getList, e.g. iter_tasks(list_id=..., filter=...).
+
+        Records are produced while the response downloads and task series
+        are built one at a time; their notes, participants and rrule are
+        parsed on first access (see models.LazyTaskSeries). The list of
+        a record has no taskseries.
+        """
+
+        for element in self._stream('rtm.tasks.getList', TASKS_LIST_PATH,
+                chunk_size, params):
+            for record in self._records(element):
+                yield record
 
     def get_frob(self):
+        if not self.frob and self.credentials is not None:
+            self.frob = self.credentials.frob(self.api_key, self.user)
         if not self.frob:
             self.frob = self.auth.getFrob()
+            if self.credentials is not None:
+                self.credentials.save_frob(self.api_key, self.user, self.frob)
         return self.frob
 
     def get_auth_url(self):
+        return self._auth_url(self.get_frob())
+
+    def _auth_url(self, frob):
         params = OrderedDict([
                 ('api_key', self.api_key),
                 ('perms', self.perms),
-                ('frob', self.get_frob()), ])
+                ('frob', frob), ])
         params['api_sig'] = self.__sign(params)
         return '%s?%s' % (AUTH_URL, urllib.parse.urlencode(params))
 
     def get_token(self):
+        if not self.token and self.credentials is not None:
+            self.token = self._stored_token()
         if not self.token:
             auth = self.auth.getToken(frob=self.get_frob())
             self.token = auth.token
+            if self.credentials is not None:
+                self.credentials.save_auth(self.api_key, self.user, auth)
         return self.token
 
+    def _stored_token(self):
+        """Token of user in credentials, checked with auth.checkToken once
+        its last check is older than the credentials ttl. A token with
+        weaker permissions than perms is None: the frob flow asks for a
+        new one."""
+
+        token, fresh = self.credentials.token(self.api_key, self.user,
+                self.perms)
+        if token is None or fresh:
+            return token
+        try:
+            auth = self.auth.checkToken(auth_token=token)
+        except RTMRequestError as e:
+            self.credentials.invalidate(self.api_key, self.user)
+            return None
+        except RTMSystemError as e:
+            # Keep the token; it is checked again on the next start.
+            logging.warn('Cannot check stored token: %s' % e)
+            return token
+        self.credentials.save_auth(self.api_key, self.user, auth)
+        if not covers(auth.perms, self.perms):
+            # Permissions were lowered since the token was stored.
+            return None
+        return token
+
 class Request(object):
     """API request creator."""
 
@@ -169,23 +511,16 @@ class Request(object):
             raise AttributeError('No such attribute %s' % attr)
         auth_required, required_args, optional_args, \
                 model_cls = self.methods[attr]
-        if self.prefix == 'tasksnotes':
-            method = 'rtm.tasks.notes.%s' % attr
-        else:
-            method = 'rtm.%s.%s' % (self.prefix, attr)
-
-        return lambda **params: self.__call(
-                method, auth_required, required_args, optional_args, 
-                model_cls, **params)
-
-    def __call(self, method, auth_required, required_args, optional_args, 
-            model_cls, **params):
+        method = request.method_name(self.prefix, attr)
 
-        for required_arg in required_args:
-            if required_arg not in params:
-                raise TypeError('Missing required parameter %s' % required_arg)
+        def call(**params):
+            for required_arg in required_args:
+                if required_arg not in params:
+                    raise TypeError('Missing required parameter %s' % required_arg)
+            return self.rtm.get(method, auth_required, model_cls, **params)
 
-        return self.rtm.get(method, auth_required, model_cls, **params)
+        setattr(self, attr, call)
+        return call
 
 def test_rtm():
     from milky import test_configs as configs
@@ -0,0 +1,555 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+import codecs
+import logging
+import time
+from collections import deque
+from urllib.parse import urlsplit
+
+from milky import models
+from milky.api import API, CHARSET, CHUNK_SIZE, PERMS_READ
+from milky.cache import MISSING, request_key
+from milky.credentials import covers
+from milky.error import MilkyError, RTMSystemError, RTMRequestError, \
+        ERRCODE_NETWORK, ERRCODE_JSON
+from milky.instrument import CallEvent, PHASE_SIGN, PHASE_WAIT, \
+        PHASE_DECODE, PHASE_PARSE
+from milky.singleflight import coalescable
+from milky.stream import ArraySplitter, TASKS_LIST_PATH
+from milky.transport import Response, TransportStats, Validators, \
+        StaleConnection, decompressor, resendable, DEFAULT_POOL_SIZE, \
+        DEFAULT_IDLE_TIMEOUT, DEFAULT_TIMEOUT, ACCEPT_ENCODING, READ_SIZE
+
+class AsyncTransport(object):
+    """Non-blocking keep-alive HTTP/1.1 transport for AsyncAPI.
+
+    Connections are pooled per host and shared by all coroutines of the
+    event loop that uses the transport.
+
+    Args:
+        pool_size - Maximum idle connections kept per host.
+        idle_timeout - Seconds an idle connection may be reused.
+        timeout - Timeout of one request, in seconds.
+        headers - Headers sent with every request.
+        compress - Ask for gzip or deflate responses (Default: True)
+        validators - transport.Validators revalidating reads the server
+            sent an ETag or Last-Modified for, or True for one per
+            transport (Default: off)
+    """
+
+    def __init__(self, pool_size=DEFAULT_POOL_SIZE,
+            idle_timeout=DEFAULT_IDLE_TIMEOUT, timeout=DEFAULT_TIMEOUT,
+            headers=None, compress=True, validators=None):
+        self.pool_size = pool_size
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout
+        self.headers = dict(headers or {})
+        if compress:
+            self.headers.setdefault('Accept-Encoding', ACCEPT_ENCODING)
+        if validators is True:
+            validators = Validators()
+        self.validators = validators or None
+        self.stats = TransportStats()
+        self._pools = {}
+
+    async def _connect(self, key):
+        scheme, host, port = key
+        return await asyncio.open_connection(host, port,
+                ssl=(scheme == 'https') or None)
+
+    async def _acquire(self, key):
+        """Return (connection, reused) for the host key."""
+
+        self.stats.requests += 1
+        now = time.monotonic()
+        pool = self._pools.get(key)
+        while pool:
+            conn, last_used = pool.pop()
+            if now - last_used <= self.idle_timeout \
+                    and not conn[0].at_eof():
+                self.stats.reused += 1
+                return conn, True
+            conn[1].close()
+            self.stats.expired += 1
+        self.stats.created += 1
+        return await self._connect(key), False
+
+    def _release(self, key, conn):
+        pool = self._pools.setdefault(key, deque())
+        if len(pool) < self.pool_size:
+            pool.append((conn, time.monotonic()))
+        else:
+            conn[1].close()
+
+    async def _send(self, conn, method, host, path, body, headers, read):
+        reader, writer = conn
+        lines = ['%s %s HTTP/1.1' % (method, path), 'Host: %s' % host]
+        for k, v in headers.items():
+            lines.append('%s: %s' % (k, v))
+        if body is not None:
+            lines.append('Content-Length: %d' % len(body))
+        try:
+            writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1'))
+            if body is not None:
+                writer.write(body)
+            await writer.drain()
+        except (ConnectionResetError, BrokenPipeError) as e:
+            raise StaleConnection(e)
+        return await read(reader)
+
+    async def _exchange(self, key, method, parts, path, body, headers, read):
+        """Send a request and read its response with read(reader); return
+        (connection, result).
+
+        Run under one timeout with connecting included.
+        """
+
+        conn, reused = await self._acquire(key)
+        try:
+            try:
+                return conn, await self._send(conn, method, parts.netloc,
+                        path, body, headers, read)
+            except StaleConnection as e:
+                conn[1].close()
+                if not reused or not resendable(method, parts.query):
+                    raise e.error
+            # The server closed the idle connection; send once more on a
+            # new one. Timeouts and other errors are never resent, the
+            # request may have been applied.
+            self.stats.created += 1
+            conn = await self._connect(key)
+            try:
+                return conn, await self._send(conn, method, parts.netloc,
+                        path, body, headers, read)
+            except StaleConnection as e:
+                raise e.error
+        except BaseException:
+            conn[1].close()
+            raise
+
+    def _target(self, url, headers):
+        """Return (key, parts, path, headers) of a request to url."""
+
+        parts = urlsplit(url)
+        key = (parts.scheme, parts.hostname,
+                parts.port or (parts.scheme == 'https' and 443 or 80))
+        path = parts.path or '/'
+        if parts.query:
+            path = '%s?%s' % (path, parts.query)
+        request_headers = dict(self.headers)
+        if headers:
+            request_headers.update(headers)
+        return key, parts, path, request_headers
+
+    async def request(self, method, url, body=None, headers=None,
+            conditional=None):
+        kept = None
+        if conditional is not None and self.validators is not None:
+            kept = self.validators.get(conditional)
+            if kept is not None:
+                headers = dict(headers or {})
+                headers.update(self.validators.conditions(kept))
+
+        key, parts, path, headers = self._target(url, headers)
+        started = time.perf_counter()
+        conn, (response, will_close) = await asyncio.wait_for(
+                self._exchange(key, method, parts, path, body, headers,
+                    lambda reader: _read_response(reader, method, started)),
+                self.timeout)
+
+        if will_close:
+            conn[1].close()
+        else:
+            self._release(key, conn)
+        if conditional is not None and self.validators is not None:
+            response = self.validators.update(conditional, kept, response)
+        self.stats.count(response.wire_bytes, len(response.body),
+                response.not_modified)
+        return response
+
+    async def stream(self, method, url, body=None, headers=None):
+        """Send a request and return an AsyncStreamResponse once the
+        response headers are read."""
+
+        key, parts, path, headers = self._target(url, headers)
+        started = time.perf_counter()
+        conn, head = await asyncio.wait_for(
+                self._exchange(key, method, parts, path, body, headers,
+                    lambda reader: _read_head(reader, method, started)),
+                self.timeout)
+        status, reason, headers, connect, will_close = head
+
+        def release(response, complete):
+            self.stats.count(response.wire_bytes, response.decoded_bytes)
+            if complete and not will_close:
+                self._release(key, conn)
+            else:
+                conn[1].close()
+
+        return AsyncStreamResponse(status, reason, headers,
+                _read_body(conn[0], method, status, headers),
+                self.timeout, release)
+
+    async def close(self):
+        pools, self._pools = self._pools, {}
+        for pool in pools.values():
+            for conn, last_used in pool:
+                conn[1].close()
+
+class AsyncStreamResponse(object):
+    """A response of AsyncTransport.stream() whose body is read
+    incrementally.
+
+    close() (or leaving the async with block) gives the connection back;
+    it is dropped when the body was not read to the end.
+    """
+
+    def __init__(self, status, reason, headers, body, timeout, release):
+        self.status = status
+        self.reason = reason
+        self.headers = headers
+        self.wire_bytes = 0
+        self.decoded_bytes = 0
+        self._body = body
+        self._decoder = decompressor(headers)
+        self._timeout = timeout
+        self._release = release
+        self._pending = b''
+        self._complete = False
+
+    async def _next(self):
+        try:
+            data = await asyncio.wait_for(self._body.__anext__(),
+                    self._timeout)
+        except StopAsyncIteration:
+            self._complete = True
+            return self._decoder is not None and self._decoder.flush() or b''
+        self.wire_bytes += len(data)
+        if self._decoder is not None:
+            data = self._decoder.decompress(data)
+        return data
+
+    async def read(self, size=None):
+        """Return up to size bytes of the decoded body (Default: the next
+        piece received); b'' at its end."""
+
+        while not self._pending and not self._complete:
+            self._pending = await self._next()
+        if size is None or size >= len(self._pending):
+            data, self._pending = self._pending, b''
+        else:
+            data, self._pending = self._pending[:size], self._pending[size:]
+        self.decoded_bytes += len(data)
+        return data
+
+    async def close(self):
+        release, self._release = self._release, None
+        if release is not None:
+            await self._body.aclose()
+            release(self, self._complete and not self._pending)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+async def _read_head(reader, method, started):
+    """Read the status line and headers of a response; return (status,
+    reason, headers, connect, will_close).
+
+    Raises StaleConnection when the connection closes before the status
+    line.
+    """
+
+    line = await reader.readline()
+    if not line:
+        # Nothing of a response arrived: the request was not read.
+        raise StaleConnection(EOFError('Connection closed by server.'))
+    version, status, reason = (line.decode('latin-1').rstrip('\r\n')
+            .split(' ', 2) + [''])[:3]
+    status = int(status)
+
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        k, _, v = line.decode('latin-1').partition(':')
+        headers[k.strip().lower()] = v.strip()
+    connect = time.perf_counter() - started
+
+    connection = headers.get('connection', '').lower()
+    will_close = connection == 'close' \
+            or (version == 'HTTP/1.0' and connection != 'keep-alive')
+    if _has_body(method, status) \
+            and headers.get('transfer-encoding', '').lower() != 'chunked' \
+            and 'content-length' not in headers:
+        # The body ends with the connection.
+        will_close = True
+    return status, reason, headers, connect, will_close
+
+def _has_body(method, status):
+    return not (method == 'HEAD' or status in (204, 304)
+            or 100 <= status < 200)
+
+async def _read_body(reader, method, status, headers):
+    """Yield the body of a response as received, still encoded."""
+
+    if not _has_body(method, status):
+        return
+    if headers.get('transfer-encoding', '').lower() == 'chunked':
+        while True:
+            size = int((await reader.readline()).split(b';')[0], 16)
+            if not size:
+                while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+                    pass
+                break
+            while size:
+                data = await reader.readexactly(min(size, READ_SIZE))
+                size -= len(data)
+                yield data
+            await reader.readexactly(2)
+    elif 'content-length' in headers:
+        size = int(headers['content-length'])
+        while size:
+            data = await reader.readexactly(min(size, READ_SIZE))
+            size -= len(data)
+            yield data
+    else:
+        while True:
+            data = await reader.read(READ_SIZE)
+            if not data:
+                break
+            yield data
+
+async def _read_response(reader, method, started):
+    """Read one response; return (Response, will_close).
+
+    Raises StaleConnection when the connection closes before the status
+    line.
+    """
+
+    status, reason, headers, connect, will_close = await _read_head(reader,
+            method, started)
+
+    # Compressed bodies are decoded piece by piece as they arrive.
+    decoder = _has_body(method, status) and decompressor(headers) or None
+    chunks = []
+    wire_bytes = 0
+    async for data in _read_body(reader, method, status, headers):
+        wire_bytes += len(data)
+        if decoder is not None:
+            data = decoder.decompress(data)
+        chunks.append(data)
+    if decoder is not None:
+        chunks.append(decoder.flush())
+
+    return Response(status, reason, headers, b''.join(chunks), connect,
+            wire_bytes), will_close
+
+class AsyncAPI(API):
+    """rememberthemilk.com API for asyncio.
+
+    Same arguments and method proxies as API, built from request.METHODS,
+    but every RTM method returns an awaitable:
+
+        rtm = AsyncAPI(api_key, shared_secret, token=token)
+        tasks = await rtm.tasks.getList(filter='status:incomplete')
+
+    stream_tasks() and iter_tasks() are async generators:
+
+        async for record in rtm.iter_tasks(filter='status:incomplete'):
+            ...
+    """
+
+    def __init__(self, api_key, shared_secret, perms=PERMS_READ,
+            frob=None, token=None, user_agent=None, transport=None,
+            **kwargs):
+
+        if transport is None:
+            transport = AsyncTransport(
+                    headers=user_agent and {'User-Agent': user_agent} or None)
+
+        super(AsyncAPI, self).__init__(api_key, shared_secret, perms, frob,
+                token, user_agent, transport, **kwargs)
+        self._auth_lock = None
+
+    async def _fetch(self, params, event=None):
+        if self.scheduler is not None:
+            await self.scheduler.acquire_async(self, self._priority(params))
+        if event is not None:
+            event.lap(PHASE_WAIT)
+            event.attempts += 1
+
+        try:
+            response = await self.transport.request(
+                    *self._http_request(params), **self._conditional(params))
+            if response.status != 200:
+                raise IOError('HTTP %d %s' % (response.status, response.reason))
+        except Exception:
+            raise RTMSystemError('Cannot connect RTM.', ERRCODE_NETWORK)
+
+        if event is not None:
+            event.response(response)
+        if response.not_modified and response.parsed is not None:
+            rsp = response.parsed[0]
+        elif self.parse_pool is not None \
+                and self.parse_pool.accepts(params['method'], response.body):
+            try:
+                rsp = await self.parse_pool.parse_async(response.body)
+            except Exception:
+                raise RTMSystemError('Cannot parse response.', ERRCODE_JSON)
+            rsp = self._check(rsp)
+        else:
+            rsp = self._decode(response.body)
+        if event is not None:
+            event.lap(PHASE_DECODE)
+        return rsp, response
+
+    async def _get(self, method, auth_required, model_cls, params):
+        token = auth_required and (await self.get_token()) or None
+        if self.instrument is None:
+            return await self._call(method, model_cls, params, token)
+
+        event = CallEvent(method)
+        try:
+            return await self._call(method, model_cls, params, token, event)
+        except MilkyError as e:
+            event.error_code = e.no
+            raise
+        finally:
+            event.end()
+            self.instrument.record(event)
+
+    async def _call(self, method, model_cls, params, token, event=None):
+        params = self._prepare(method, params, token)
+        if event is not None:
+            event.lap(PHASE_SIGN)
+
+        result = self._cached(params)
+        if result is not MISSING:
+            if event is not None:
+                event.cached = True
+            return result, None
+
+        if self.singleflight and coalescable(params):
+            (result, rsp), shared = await self.singleflight.do_async(
+                    request_key(params),
+                    lambda: self._request(method, model_cls, params, event))
+            if shared and event is not None:
+                event.coalesced = True
+                event.lap(PHASE_WAIT)
+            return result, rsp
+        return await self._request(method, model_cls, params, event)
+
+    async def _request(self, method, model_cls, params, event=None):
+        if self.retry is None:
+            rsp, response = await self._fetch(params, event)
+        else:
+            rsp, response = await self.retry.call_async(method,
+                    'timeline' in params, lambda: self._fetch(params, event))
+
+        result = self._result(model_cls, rsp, response)
+        if event is not None:
+            event.lap(PHASE_PARSE)
+        self._store(params, result)
+        return result, rsp
+
+    async def get(self, method, auth_required, model_cls, **params):
+        return (await self._get(method, auth_required, model_cls, params))[0]
+
+    async def get_frob(self):
+        if not self.frob and self.credentials is not None:
+            self.frob = self.credentials.frob(self.api_key, self.user)
+        if not self.frob:
+            self.frob = await self.auth.getFrob()
+            if self.credentials is not None:
+                self.credentials.save_frob(self.api_key, self.user, self.frob)
+        return self.frob
+
+    async def get_auth_url(self):
+        return self._auth_url(await self.get_frob())
+
+    async def _stream(self, method, path, chunk_size, params):
+        params = self._prepare(method, params, await self.get_token())
+
+        if self.scheduler is not None:
+            await self.scheduler.acquire_async(self, self._priority(params))
+
+        try:
+            response = await self.transport.stream(*self._http_request(params))
+            if response.status != 200:
+                await response.close()
+                raise IOError('HTTP %d %s' % (response.status, response.reason))
+        except Exception:
+            raise RTMSystemError('Cannot connect RTM.', ERRCODE_NETWORK)
+
+        splitter = ArraySplitter(path)
+        decoder = codecs.getincrementaldecoder(CHARSET)()
+        async with response:
+            while True:
+                try:
+                    chunk = await response.read(chunk_size)
+                except Exception:
+                    raise RTMSystemError('Cannot connect RTM.', ERRCODE_NETWORK)
+                for element in self._elements(splitter, decoder, chunk):
+                    yield element
+                if not chunk:
+                    break
+        splitter.close()
+        self._decode(splitter.skeleton)
+
+    async def stream_tasks(self, chunk_size=CHUNK_SIZE, **params):
+        """Async generator of API.stream_tasks()."""
+
+        async for element in self._stream('rtm.tasks.getList',
+                TASKS_LIST_PATH, chunk_size, params):
+            yield models.TaskList._parse(element)
+
+    async def iter_tasks(self, chunk_size=CHUNK_SIZE, **params):
+        """Async generator of API.iter_tasks()."""
+
+        async for element in self._stream('rtm.tasks.getList',
+                TASKS_LIST_PATH, chunk_size, params):
+            for record in self._records(element):
+                yield record
+
+    async def get_token(self):
+        if not self.token:
+            # Concurrent first calls share one auth round trip.
+            if self._auth_lock is None:
+                self._auth_lock = asyncio.Lock()
+            async with self._auth_lock:
+                if not self.token and self.credentials is not None:
+                    self.token = await self._stored_token()
+                if not self.token:
+                    auth = await self.auth.getToken(frob=await self.get_frob())
+                    self.token = auth.token
+                    if self.credentials is not None:
+                        self.credentials.save_auth(self.api_key, self.user,
+                                auth)
+        return self.token
+
+    async def _stored_token(self):
+        token, fresh = self.credentials.token(self.api_key, self.user,
+                self.perms)
+        if token is None or fresh:
+            return token
+        try:
+            auth = await self.auth.checkToken(auth_token=token)
+        except RTMRequestError:
+            self.credentials.invalidate(self.api_key, self.user)
+            return None
+        except RTMSystemError as e:
+            logging.warn('Cannot check stored token: %s' % e)
+            return token
+        self.credentials.save_auth(self.api_key, self.user, auth)
+        if not covers(auth.perms, self.perms):
+            # Permissions were lowered since the token was stored.
+            return None
+        return token
+
+    async def close(self):
+        await self.transport.close()
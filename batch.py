@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+
+import logging
+
+from milky import request
+from milky.error import MilkyError
+
+DEFAULT_BATCH_WORKERS = 4
+
+class BatchItem(object):
+    """One write of a batch and its outcome.
+
+    result - parsed response (None until sent or on error).
+    error - MilkyError raised by the write, or None.
+    transaction_id - RTM transaction of the write, for transactions.undo.
+    undoable - whether RTM can undo the transaction.
+    sent - set once the write was sent.
+    undone - set when the write was rolled back.
+    """
+
+    def __init__(self, method, auth_required, model_cls, params):
+        self.method = method
+        self.auth_required = auth_required
+        self.model_cls = model_cls
+        self.params = params
+        self.result = None
+        self.error = None
+        self.transaction_id = None
+        self.undoable = False
+        self.sent = False
+        self.undone = False
+
+    @property
+    def ok(self):
+        return self.error is None
+
+    def __repr__(self):
+        return '<BatchItem - %s %s>' % (self.method,
+                self.error is None and (self.transaction_id or '') or self.error)
+
+class _BatchPrefix(object):
+    def __init__(self, batch, prefix, methods):
+        self.batch = batch
+        self.prefix = prefix
+        self.methods = methods
+
+    def __getattr__(self, attr):
+        if attr not in self.methods:
+            raise AttributeError('No such attribute %s' % attr)
+        return lambda **params: self.batch.add(self.prefix, attr, **params)
+
+class Batch(object):
+    """Timeline writes collected and sent together on one timeline.
+
+        batch = rtm.batch()
+        for task in tasks:
+            batch.tasks.complete(list_id=..., taskseries_id=..., task_id=...)
+        items = batch.run()
+
+    Writes are added with the same names and arguments as on API, without
+    timeline. run() creates the timeline (unless one is given) and sends
+    the writes on up to max_workers threads; the API scheduler, if any,
+    keeps them under the rate limit. With rollback=True, a failed write
+    undoes the successful ones through transactions.undo.
+    """
+
+    def __init__(self, api, timeline=None, max_workers=DEFAULT_BATCH_WORKERS,
+            rollback=False):
+        self.api = api
+        self.timeline = timeline
+        self.max_workers = max_workers
+        self.rollback_on_error = rollback
+        self.items = []
+
+    def __getattr__(self, prefix):
+        methods = request.METHODS.get(prefix)
+        if methods is None:
+            raise AttributeError('No such attribute %s' % prefix)
+        return _BatchPrefix(self, prefix, dict(
+            (name, spec) for (name, spec) in methods.items()
+            if 'timeline' in spec[1]))
+
+    def __len__(self):
+        return len(self.items)
+
+    def add(self, prefix, name, **params):
+        """Queue METHODS[prefix][name]; return its BatchItem."""
+
+        auth_required, required_args, optional_args, model_cls = \
+                request.METHODS[prefix][name]
+        for required_arg in required_args:
+            if required_arg != 'timeline' and required_arg not in params:
+                raise TypeError('Missing required parameter %s' % required_arg)
+
+        item = BatchItem(request.method_name(prefix, name), auth_required,
+                model_cls, params)
+        self.items.append(item)
+        return item
+
+    def _params(self, item):
+        params = dict(item.params)
+        params['timeline'] = self.timeline
+        return params
+
+    def _done(self, item, result, rsp):
+        item.sent = True
+        item.result = result
+        transaction = rsp and rsp.get('transaction')
+        if transaction:
+            item.transaction_id = transaction.get('id')
+            item.undoable = transaction.get('undoable') == '1'
+
+    def _send(self, item):
+        try:
+            result, rsp = self.api._get(item.method, item.auth_required,
+                    item.model_cls, self._params(item))
+        except MilkyError as e:
+            item.sent = True
+            item.error = e
+        else:
+            self._done(item, result, rsp)
+        return item
+
+    def run(self):
+        """Send the queued writes; return the BatchItems in order."""
+
+        from concurrent.futures import ThreadPoolExecutor
+
+        if self.timeline is None:
+            self.timeline = self.api.timelines.create()
+
+        pending = [item for item in self.items if not item.sent]
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            list(pool.map(self._send, pending))
+
+        if self.rollback_on_error and any(not item.ok for item in pending):
+            self.rollback()
+        return self.items
+
+    def _undoable(self):
+        return [item for item in reversed(self.items)
+                if item.ok and item.undoable and not item.undone]
+
+    def rollback(self):
+        """Undo the successful writes, newest first."""
+
+        for item in self._undoable():
+            try:
+                self.api.transactions.undo(timeline=self.timeline,
+                        transaction_id=item.transaction_id)
+            except MilkyError as e:
+                logging.warn('Cannot undo %s: %s' % (item.transaction_id, e))
+            else:
+                item.undone = True
+
+    async def run_async(self):
+        """run() for AsyncAPI: writes are sent as concurrent coroutines."""
+
+        import asyncio
+
+        if self.timeline is None:
+            self.timeline = await self.api.timelines.create()
+
+        semaphore = asyncio.Semaphore(self.max_workers)
+
+        async def send(item):
+            async with semaphore:
+                try:
+                    result, rsp = await self.api._get(item.method,
+                            item.auth_required, item.model_cls,
+                            self._params(item))
+                except MilkyError as e:
+                    item.sent = True
+                    item.error = e
+                else:
+                    self._done(item, result, rsp)
+
+        pending = [item for item in self.items if not item.sent]
+        await asyncio.gather(*[send(item) for item in pending])
+
+        if self.rollback_on_error and any(not item.ok for item in pending):
+            await self.rollback_async()
+        return self.items
+
+    async def rollback_async(self):
+        for item in self._undoable():
+            try:
+                await self.api.transactions.undo(timeline=self.timeline,
+                        transaction_id=item.transaction_id)
+            except MilkyError as e:
+                logging.warn('Cannot undo %s: %s' % (item.transaction_id, e))
+            else:
+                item.undone = True
@@ -0,0 +1,711 @@
+# -*- coding: utf-8 -*-
+
+"""Benchmarks for milky.
+
+    python -m milky.benchmarks [name ...]
+
+Each benchmark prints its timings and returns them as a dict.
+"""
+
+import datetime
+import hashlib
+import json
+import os
+import pickle
+import random
+import re
+import subprocess
+import sys
+import time
+import tracemalloc
+import urllib.parse
+from collections import OrderedDict
+
+from milky import models
+from milky.api import API
+from milky.fakertm import FakeRTM, synthetic_tasks
+from milky.signing import Signer, encode_query
+from milky.sync import SyncEngine
+from milky.transport import PooledTransport
+
+DATE_FORMAT = '%Y-%m-%dT%H:%M:%SZ'
+
+def _timestamp(r, base=datetime.datetime(2010, 1, 1)):
+    return (base + datetime.timedelta(seconds=r.randint(0, 10 ** 8))) \
+            .strftime(DATE_FORMAT)
+
+def _best(fn, repeat=3):
+    """Best wall time of fn() over repeat runs, in seconds."""
+
+    best = None
+    for i in range(repeat):
+        started = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - started
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+def _percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100.0))]
+
+def _latencies(name, calls, elapsed, latencies):
+    """Requests per second and p50/p99 latency, prefixed with name."""
+
+    return OrderedDict([
+        ('%s_rps' % name, '%.1f' % (calls / elapsed)),
+        ('%s_p50' % name, _percentile(latencies, 50)),
+        ('%s_p99' % name, _percentile(latencies, 99)), ])
+
+def _timed(fn, repeat):
+    """(latencies, total seconds) of repeat sequential calls of fn()."""
+
+    latencies = []
+    for i in range(repeat):
+        started = time.perf_counter()
+        fn()
+        latencies.append(time.perf_counter() - started)
+    return latencies, sum(latencies)
+
+def _peak_memory(fn):
+    """Peak memory allocated by fn(), in KiB.
+
+    Everything the process allocates counts, so serve the requests of fn
+    from a _ChildServer rather than an in-process FakeRTM.
+    """
+
+    tracemalloc.start()
+    try:
+        fn()
+        return tracemalloc.get_traced_memory()[1] // 1024
+    finally:
+        tracemalloc.stop()
+
+def _serve(pipe, kwargs):
+    with FakeRTM(**kwargs) as server:
+        pipe.send((server.url, server.api_key, server.shared_secret,
+            server.token))
+        pipe.recv()
+
+class _ChildServer(object):
+    """FakeRTM in a child process, for benchmarks measuring the memory of
+    the client only. Takes the FakeRTM arguments; the account is not
+    reachable from the benchmark."""
+
+    def __init__(self, **kwargs):
+        self.kwargs = kwargs
+
+    def __enter__(self):
+        import multiprocessing
+
+        self._pipe, child = multiprocessing.Pipe()
+        self._process = multiprocessing.Process(target=_serve,
+                args=(child, self.kwargs))
+        self._process.daemon = True
+        self._process.start()
+        self.url, self.api_key, self.shared_secret, self.token = \
+                self._pipe.recv()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._pipe.send(None)
+        self._process.join()
+
+def _client(server, **kwargs):
+    return API(server.api_key, server.shared_secret, token=server.token,
+            api_url=server.url, **kwargs)
+
+def _report(name, results):
+    for key, value in results.items():
+        if type(value) is float:
+            print('%-32s %12.3f ms' % ('%s.%s' % (name, key), value * 1000))
+        else:
+            print('%-32s %12s' % ('%s.%s' % (name, key), value))
+
+# Reference parsers as they were before the schema tables: an if/elif
+# chain per key with list literals and strptime.
+
+class _Legacy(object):
+    pass
+
+def _legacy_task(json):
+    task = _Legacy()
+    for k, v in json.items():
+        if k == u'priority':
+            if v == u'N':
+                setattr(task, k, None)
+            else:
+                setattr(task, k, v and int(v) or None)
+        elif k in [u'has_due_time', ]:
+            setattr(task, k, v==u'1' and True or False)
+        elif k in [u'added', u'completed', u'deleted', u'due']:
+            setattr(task, k, v and datetime.datetime.strptime(
+                v, '%Y-%m-%dT%H:%M:%SZ') or None)
+        elif k in [u'postponed', ]:
+            setattr(task, k, int(v))
+        elif k in [u'estimate', ]:
+            setattr(task, k, models._estimate(v))
+        else:
+            setattr(task, k, v and v or None)
+    return task
+
+def _legacy_note(json):
+    note = _Legacy()
+    for k, v in json.items():
+        if k == u'$t':
+            setattr(note, u'text', v)
+        elif k in [u'id', ]:
+            setattr(note, k, int(v))
+        else:
+            setattr(note, k, v and v or None)
+    return note
+
+def _legacy_list(parse, v):
+    if not v:
+        return []
+    if type(v) is not list:
+        v = [v, ]
+    return [parse(obj) for obj in v if obj]
+
+def _legacy_taskseries(json):
+    taskseries = _Legacy()
+    taskseries.task = []
+    taskseries.rrule = None
+    taskseries.tags = []
+    taskseries.notes = []
+    taskseries.participants = []
+    for k, v in json.items():
+        if k == u'task':
+            taskseries.task = _legacy_list(_legacy_task, v)
+        elif k == u'rrule':
+            taskseries.rrule = models.Recurrence._parse(v)
+        elif k == u'tags':
+            if v and 'tag' in v:
+                taskseries.tags = v[u'tag']
+        elif k == u'notes':
+            if v and 'note' in v:
+                taskseries.notes = _legacy_list(_legacy_note, v[u'note'])
+        elif k == u'participants':
+            pass
+        elif k in [u'created', u'modified', ]:
+            setattr(taskseries, k, v and datetime.datetime.strptime(
+                v, '%Y-%m-%dT%H:%M:%SZ') or None)
+        elif k in [u'location_id', ]:
+            setattr(taskseries, k, v and int(v) or None)
+        else:
+            setattr(taskseries, k, v and v or None)
+    return taskseries
+
+def _legacy_tasks(rsp):
+    lists = []
+    for obj in rsp[u'tasks'][u'list']:
+        _list = _Legacy()
+        for k, v in obj.items():
+            if k == 'taskseries':
+                _list.taskseries = _legacy_list(_legacy_taskseries, v)
+            elif k in ['id', ]:
+                setattr(_list, k, int(v))
+            else:
+                setattr(_list, k, v and v or None)
+        lists.append(_list)
+    return lists
+
+def bench_parse(lists=10, taskseries=2000):
+    """tasks.getList decode and parse: schema tables vs. the if/elif chain."""
+
+    text = json.dumps({'rsp': synthetic_tasks(lists, taskseries)})
+    rsp = json.loads(text)['rsp']
+    stamps = [_timestamp(random.Random(i)) for i in range(10000)]
+
+    results = {
+        'tasks': lists * taskseries,
+        'bytes': len(text),
+        'decode': _best(lambda: json.loads(text)),
+        'parse_legacy': _best(lambda: _legacy_tasks(rsp)),
+        'parse': _best(lambda: models.Tasks._parse(rsp)),
+        'timestamp_strptime_10k': _best(lambda: [
+            datetime.datetime.strptime(v, DATE_FORMAT) for v in stamps]),
+        'timestamp_10k': _best(lambda: [
+            models._timestamp(v) for v in stamps]), }
+    _report('parse', results)
+    return results
+
+# Reference request signing and URL building as they were before Signer.
+
+def _legacy_sign(shared_secret, params):
+    sortedkeys = sorted(params, key=str.lower)
+    pairs=""
+    for keyItem in sortedkeys:
+        pairs=pairs+"{}{}".format(keyItem,params[keyItem])
+    pairs = pairs.encode('utf-8')
+    return hashlib.md5(shared_secret.encode('utf-8')+pairs).hexdigest()
+
+def _legacy_prepare(shared_secret, params):
+    params = OrderedDict(params)
+    params['api_sig'] = _legacy_sign(shared_secret, params)
+    return urllib.parse.urlencode(OrderedDict(
+        [(k, v.encode('utf-8') if type(v) is str else v) \
+                for (k, v) in params.items()]))
+
+def _signed_query(signer, params):
+    return encode_query(signer.signed(params))
+
+def bench_sign(note_size=64 * 1024, repeat=200):
+    """Per-request signing and query string cost with a large note."""
+
+    secret = 'shared-secret'
+    params = {
+        'method': 'rtm.tasks.notes.add',
+        'api_key': 'api-key',
+        'format': 'json',
+        'auth_token': 'token',
+        'timeline': '12345',
+        'list_id': '1',
+        'taskseries_id': '2',
+        'task_id': '3',
+        'note_title': 'Title',
+        'note_text': u'Ünïcode note text. ' * (note_size // 20),
+        'tags': ','.join('tag%d' % i for i in range(200)), }
+    signer = Signer(secret)
+    assert signer.sign(params) == _legacy_sign(secret, params)
+    assert sorted(urllib.parse.parse_qsl(_signed_query(signer, params))) \
+            == sorted(urllib.parse.parse_qsl(_legacy_prepare(secret, params)))
+
+    results = {
+        'note_bytes': note_size,
+        'sign_legacy': _best(lambda: [
+            _legacy_sign(secret, params) for i in range(repeat)]) / repeat,
+        'sign': _best(lambda: [
+            signer.sign(params) for i in range(repeat)]) / repeat,
+        'request_legacy': _best(lambda: [
+            _legacy_prepare(secret, params) for i in range(repeat)]) / repeat,
+        'request': _best(lambda: [
+            _signed_query(signer, params) for i in range(repeat)]) / repeat, }
+    _report('sign', results)
+    return results
+
+# End-to-end benchmarks against a local fakertm.FakeRTM.
+
+def bench_getlist(lists=10, taskseries=500, repeat=20, latency=0):
+    """tasks.getList of a whole account: round trips, parse and memory."""
+
+    with _ChildServer(lists=lists, taskseries=taskseries, latency=latency) \
+            as server:
+        rtm = _client(server)
+        latencies, elapsed = _timed(lambda: rtm.tasks.getList(), repeat)
+        rsp = rtm._fetch(rtm._prepare('rtm.tasks.getList', {}, rtm.token))[0]
+
+        results = OrderedDict([('tasks', lists * taskseries)])
+        results.update(_latencies('getlist', repeat, elapsed, latencies))
+        results['parse'] = _best(lambda: models.Tasks._parse(rsp))
+        results['memory_kib'] = _peak_memory(lambda: rtm.tasks.getList())
+        results['iter_memory_kib'] = _peak_memory(
+                lambda: sum(1 for record in rtm.iter_tasks()))
+        rtm.transport.close()
+    _report('getlist', results)
+    return results
+
+def bench_writes(writes=200, workers=4, latency=0.002):
+    """Bulk tasks.setPriority: one by one and through a Batch."""
+
+    with FakeRTM(lists=1, taskseries=writes, latency=latency) as server:
+        rtm = _client(server)
+        targets = [(list_id, series) for (list_id, all_series)
+                in server.account.taskseries.items()
+                for series in all_series.values()]
+        timeline = rtm.timelines.create()
+        pending = iter(targets)
+
+        def write():
+            list_id, series = next(pending)
+            rtm.tasks.setPriority(timeline=timeline, list_id=list_id,
+                    taskseries_id=series['id'],
+                    task_id=series['task'][0]['id'], priority=1)
+
+        latencies, elapsed = _timed(write, len(targets))
+        results = OrderedDict([('writes', len(targets))])
+        results.update(_latencies('write', len(targets), elapsed, latencies))
+
+        batch = rtm.batch(timeline=timeline, max_workers=workers)
+        for list_id, series in targets:
+            batch.tasks.setPriority(list_id=list_id,
+                    taskseries_id=series['id'],
+                    task_id=series['task'][0]['id'], priority=2)
+        started = time.perf_counter()
+        items = batch.run()
+        elapsed = time.perf_counter() - started
+        results['batch_rps'] = '%.1f' % (len(items) / elapsed)
+        results['batch_errors'] = sum(1 for item in items if not item.ok)
+        rtm.transport.close()
+    _report('writes', results)
+    return results
+
+def bench_singleflight(threads=16, rounds=20, latency=0.02):
+    """Threads reading lists.getList at once, with and without
+    single-flight coalescing."""
+
+    from concurrent.futures import ThreadPoolExecutor
+
+    results = OrderedDict([('calls', threads * rounds)])
+    with FakeRTM(lists=10, taskseries=10, latency=latency) as server:
+        for name, singleflight in (('separate', None), ('coalesced', True)):
+            rtm = _client(server, singleflight=singleflight)
+            server.calls.clear()
+            with ThreadPoolExecutor(max_workers=threads) as executor:
+                started = time.perf_counter()
+                for i in range(rounds):
+                    list(executor.map(lambda i: rtm.lists.getList(),
+                        range(threads)))
+                elapsed = time.perf_counter() - started
+            results['%s_requests' % name] = \
+                    server.calls.get('rtm.lists.getList', 0)
+            results['%s_rps' % name] = '%.1f' % (threads * rounds / elapsed)
+            rtm.transport.close()
+    _report('singleflight', results)
+    return results
+
+def bench_transfer(lists=10, taskseries=2000, repeat=5, latency=0.005):
+    """Repeated tasks.getList over a gzip and ETag serving server: plain,
+    compressed, and compressed with revalidation."""
+
+    results = OrderedDict()
+    with FakeRTM(lists=lists, taskseries=taskseries, latency=latency,
+            compress=6, etags=True) as server:
+        for name, compress, validators in (('plain', False, False),
+                ('gzip', True, False), ('conditional', True, True)):
+            transport = PooledTransport(compress=compress,
+                    validators=validators)
+            rtm = _client(server, transport=transport)
+            latencies, elapsed = _timed(rtm.tasks.getList, repeat)
+            results['%s_p50' % name] = _percentile(latencies, 50)
+            results['%s_wire_kib' % name] = \
+                    transport.stats.wire_bytes // 1024
+            results['%s_decoded_kib' % name] = \
+                    transport.stats.decoded_bytes // 1024
+            results['%s_not_modified' % name] = transport.stats.not_modified
+            transport.close()
+    _report('transfer', results)
+    return results
+
+def bench_journal(writes=1000, tasks=50, latency=0.002):
+    """OfflineWriter: submit latency, then one replay of the journal with
+    compaction."""
+
+    import shutil
+    import tempfile
+    from milky.journal import FileJournal, OfflineWriter
+
+    directory = tempfile.mkdtemp()
+    r = random.Random(0)
+    try:
+        with FakeRTM(lists=1, taskseries=tasks, latency=latency) as server:
+            rtm = _client(server)
+            targets = [(list_id, series) for (list_id, all_series)
+                    in server.account.taskseries.items()
+                    for series in all_series.values()]
+            writer = OfflineWriter(rtm, FileJournal(
+                os.path.join(directory, 'journal')))
+
+            def submit():
+                list_id, series = r.choice(targets)
+                writer.tasks.setPriority(list_id=list_id,
+                        taskseries_id=series['id'],
+                        task_id=series['task'][0]['id'],
+                        priority=r.randint(1, 3))
+
+            latencies, elapsed = _timed(submit, writes)
+            results = OrderedDict([('writes', writes)])
+            results.update(_latencies('submit', writes, elapsed, latencies))
+            started = time.perf_counter()
+            replayed = writer.replay()
+            results['replay'] = time.perf_counter() - started
+            results['sent'] = len(replayed.sent)
+            results['dropped'] = len(replayed.dropped)
+            writer.journal.close()
+            rtm.transport.close()
+    finally:
+        shutil.rmtree(directory)
+    _report('journal', results)
+    return results
+
+def bench_sync(lists=10, taskseries=500, changes=100):
+    """SyncEngine: first full sync, then a delta after changes writes."""
+
+    with _ChildServer(lists=lists, taskseries=taskseries) as server:
+        rtm = _client(server)
+        engine = SyncEngine(rtm)
+        results = OrderedDict([('tasks', lists * taskseries)])
+
+        started = time.perf_counter()
+        full = [None]
+        results['memory_kib'] = _peak_memory(
+                lambda: full.__setitem__(0, engine.sync()))
+        results['full_sync'] = time.perf_counter() - started
+        results['full_added'] = full[0].added
+
+        timeline = rtm.timelines.create()
+        batch = rtm.batch(timeline=timeline)
+        per_list = {}
+        for series in engine.replica.taskseries.values():
+            if per_list.get(series.list_id, 0) < changes // lists:
+                per_list[series.list_id] = per_list.get(series.list_id, 0) + 1
+                batch.tasks.complete(list_id=series.list_id,
+                        taskseries_id=series.id, task_id=series.task[0].id)
+        batch.run()
+
+        started = time.perf_counter()
+        delta = engine.sync()
+        results['delta_sync'] = time.perf_counter() - started
+        results['delta_modified'] = delta.modified
+        rtm.transport.close()
+    _report('sync', results)
+    return results
+
+def bench_parse_pool(lists=10, taskseries=2000, threads=4, responses=8):
+    """Responses per second parsed by threads, inline and through a
+    parallel.ParsePool."""
+
+    from concurrent.futures import ThreadPoolExecutor
+    from milky.parallel import ParsePool
+
+    body = json.dumps({'rsp': synthetic_tasks(lists, taskseries)}) \
+            .encode('utf-8')
+    pool = ParsePool(max_workers=os.cpu_count())
+
+    def inline():
+        return models.Tasks._parse(json.loads(body)['rsp'])
+
+    def pooled():
+        return models.Tasks._parse(pool.parse(body))
+
+    def run(fn):
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            for result in executor.map(lambda i: fn(), range(responses)):
+                pass
+
+    # The calling thread's share of a pooled parse is the unpickling.
+    pickled = pickle.dumps(inline().lists, pickle.HIGHEST_PROTOCOL)
+    try:
+        assert len(pooled().lists) == lists
+        results = OrderedDict([
+            ('bytes', len(body)),
+            ('cpus', os.cpu_count()),
+            ('inline_rps', '%.2f' % (responses / _best(lambda: run(inline)))),
+            ('pool_rps', '%.2f' % (responses / _best(lambda: run(pooled)))),
+            ('parse', _best(inline)),
+            ('unpickle', _best(lambda: pickle.loads(pickled))), ])
+    finally:
+        pool.close()
+    _report('parse_pool', results)
+    return results
+
+_DASHBOARD = (
+    'status:incomplete AND dueBefore:tomorrow',
+    'tag:work AND (priority:1 OR priority:2) AND NOT status:completed',
+    'list:105 AND due:never',
+    'completedAfter:2012-01-01', )
+
+def bench_query(lists=10, taskseries=2000, repeat=1000):
+    """query.TaskStore: index build, then dashboard filters."""
+
+    from milky.query import TaskStore
+
+    tasks = models.Tasks._parse(synthetic_tasks(lists, taskseries))
+    store = [None]
+
+    def build():
+        store[0] = TaskStore.from_tasks(tasks)
+
+    results = OrderedDict([
+        ('tasks', lists * taskseries),
+        ('build', _best(build)), ])
+    store = store[0]
+    for text in _DASHBOARD:
+        store.count(text)
+    results['count'] = _best(lambda: [store.count(text)
+        for i in range(repeat) for text in _DASHBOARD]) \
+                / (repeat * len(_DASHBOARD))
+    results['query'] = _best(lambda: [store.query(text)
+        for text in _DASHBOARD]) / len(_DASHBOARD)
+    _report('query', results)
+    return results
+
+def _legacy_overdue_per_list(tasks, now):
+    counts = {}
+    for tasklist in tasks.lists:
+        for series in tasklist.taskseries:
+            for task in series.task:
+                if task.due and not task.completed and task.due < now:
+                    counts[tasklist.id] = counts.get(tasklist.id, 0) + 1
+    return counts
+
+def bench_export(lists=10, taskseries=2000):
+    """export.to_columns and a vectorized overdue count per list."""
+
+    from milky import export
+
+    if export.numpy is None:
+        print('export: numpy is not installed')
+        return {}
+    numpy = export.numpy
+
+    tasks = models.Tasks._parse(synthetic_tasks(lists, taskseries))
+    now = datetime.datetime(2012, 6, 1)
+    cols = export.to_columns(tasks)
+
+    def overdue():
+        mask = numpy.isnat(cols.completed) & (cols.due < numpy.datetime64(now))
+        return numpy.unique(cols.list_id[mask], return_counts=True)
+
+    list_ids, counts = overdue()
+    assert dict(zip(list_ids.tolist(), counts.tolist())) \
+            == _legacy_overdue_per_list(tasks, now)
+
+    results = OrderedDict([
+        ('tasks', len(cols)),
+        ('to_columns', _best(lambda: export.to_columns(tasks))),
+        ('iter_tasks_to_columns', _best(lambda: export.to_columns(
+            models.TaskRecord(l, s, t) for l in tasks.lists
+            for s in l.taskseries for t in s.task))),
+        ('overdue_legacy', _best(
+            lambda: _legacy_overdue_per_list(tasks, now))),
+        ('overdue', _best(overdue)),
+        ('estimate_work', _best(lambda: cols.estimate[
+            cols.has_tag('work')].sum())), ])
+    _report('export', results)
+    return results
+
+_RRULES = (
+    'FREQ=DAILY;INTERVAL=1',
+    'FREQ=DAILY;INTERVAL=3',
+    'FREQ=WEEKLY;INTERVAL=1',
+    'FREQ=WEEKLY;INTERVAL=1;BYDAY=MO,WE,FR',
+    'FREQ=WEEKLY;INTERVAL=2;BYDAY=TU',
+    'FREQ=MONTHLY;INTERVAL=1;BYMONTHDAY=15',
+    'FREQ=MONTHLY;INTERVAL=1;BYDAY=2TU',
+    'FREQ=MONTHLY;INTERVAL=1;BYDAY=-1FR',
+    'FREQ=YEARLY;INTERVAL=1',
+    'FREQ=DAILY;INTERVAL=1;COUNT=30',
+    'FREQ=WEEKLY;INTERVAL=1;BYDAY=SA;UNTIL=20121231T000000', )
+
+_LEGACY_RRULE_RES = [re.compile(pattern, re.I) for pattern in (
+    r"FREQ=(?P<freq>[a-z]+)", r"INTERVAL=(?P<interval>[\d]+)",
+    r"BYDAY=(?P<byday>[a-z,]+)", r"BYDAY=(?P<byday>[-\w]+)",
+    r"BYMONTHDAY=(?P<bymonthday>[\d]+)", r"UNTIL=(?P<until>[\w]+)",
+    r"COUNT=(?P<count>[\d]+)", )]
+
+def _legacy_recurrence(json):
+    """The seven searches per rule of the regex parser."""
+
+    recurrence = _Legacy()
+    v = json[u'$t']
+    for regex in _LEGACY_RRULE_RES:
+        m = regex.search(v)
+        if m:
+            setattr(recurrence, list(m.groupdict())[0], m.group(1))
+    recurrence.every = int(json[u'every'])
+    return recurrence
+
+def bench_recurrence(series=100000, days=90):
+    """Parse series rrules and expand each in a days window."""
+
+    from milky.recurrence import expand
+
+    r = random.Random(0)
+    rrules = [{u'every': u'1', u'$t': r.choice(_RRULES)}
+            for i in range(series)]
+    now = datetime.datetime(2012, 6, 1)
+    end = now + datetime.timedelta(days=days)
+    records = []
+    for rrule in rrules:
+        taskseries = models.TaskSeries()
+        taskseries.rrule = models.Recurrence._parse(rrule)
+        task = models.Task()
+        task.due = now - datetime.timedelta(days=r.randint(0, 2000),
+                hours=r.randint(0, 23))
+        records.append(models.TaskRecord(None, taskseries, task))
+    occurrences = [0]
+
+    def expand_all():
+        occurrences[0] = sum(1 for record in expand(records, now, end))
+
+    results = OrderedDict([
+        ('series', series),
+        ('parse_legacy', _best(lambda: [_legacy_recurrence(rrule)
+            for rrule in rrules])),
+        ('parse', _best(lambda: [models.Recurrence._parse(rrule)
+            for rrule in rrules])),
+        ('expand', _best(expand_all)),
+        ('occurrences', occurrences[0]), ])
+    _report('recurrence', results)
+    return results
+
+# Import and first call in a fresh interpreter, in seconds. Short-lived
+# jobs pay both on every run.
+STARTUP_BUDGET = {
+    'import': 0.02,
+    'first_call': 0.2, }
+
+_STARTUP = '''
+import sys, time
+started = time.perf_counter()
+import milky
+imported = time.perf_counter()
+rtm = milky.API(sys.argv[1], sys.argv[2], token=sys.argv[3],
+        api_url=sys.argv[4])
+rtm.test.login()
+print('%r %r' % (imported - started, time.perf_counter() - started))
+'''
+
+def bench_startup(repeat=5, budget=STARTUP_BUDGET):
+    """import milky and a first call in a subprocess, against a budget."""
+
+    import milky
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join([os.path.dirname(os.path.dirname(
+        os.path.abspath(milky.__file__))), env.get('PYTHONPATH', '')])
+
+    with FakeRTM() as server:
+        runs = []
+        for i in range(repeat):
+            out = subprocess.check_output([sys.executable, '-c', _STARTUP,
+                server.api_key, server.shared_secret, server.token,
+                server.url], env=env)
+            runs.append([float(v) for v in out.split()])
+
+    results = OrderedDict([
+        ('import', min(run[0] for run in runs)),
+        ('first_call', min(run[1] for run in runs)), ])
+    _report('startup', results)
+    over = ['%s %.1f ms > %.1f ms' % (key, results[key] * 1000,
+        budget[key] * 1000) for key in budget if results[key] > budget[key]]
+    if over:
+        sys.exit('startup over budget: %s' % ', '.join(over))
+    return results
+
+BENCHMARKS = {
+    'export': bench_export,
+    'getlist': bench_getlist,
+    'journal': bench_journal,
+    'parse': bench_parse,
+    'parse_pool': bench_parse_pool,
+    'query': bench_query,
+    'recurrence': bench_recurrence,
+    'sign': bench_sign,
+    'singleflight': bench_singleflight,
+    'startup': bench_startup,
+    'sync': bench_sync,
+    'transfer': bench_transfer,
+    'writes': bench_writes, }
+
+def main(argv):
+    names = argv or sorted(BENCHMARKS)
+    for name in names:
+        if name not in BENCHMARKS:
+            sys.exit('Unknown benchmark %s (%s)' % (
+                name, ', '.join(sorted(BENCHMARKS))))
+        BENCHMARKS[name]()
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
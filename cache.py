@@ -0,0 +1,207 @@
+# -*- coding: utf-8 -*-
+
+import hashlib
+import os
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+from milky.fileutil import replace_file
+
+"""Seconds a read-only response stays valid, per RTM method.
+
+Only methods listed here (or in the ttls passed to ResponseCache) are
+cached.
+"""
+DEFAULT_TTLS = {
+    'rtm.contacts.getList': 300,
+    'rtm.groups.getList': 300,
+    'rtm.lists.getList': 300,
+    'rtm.locations.getList': 3600,
+    'rtm.reflection.getMethodInfo': 86400,
+    'rtm.reflection.getMethods': 86400,
+    'rtm.settings.getList': 3600,
+    'rtm.timezones.getList': 86400, }
+
+MISSING = object()
+
+def request_key(params):
+    """Cache key of a signed request: the method plus the sorted params
+    without api_sig."""
+
+    return (params['method'], tuple(sorted(
+        (k, '%s' % v) for (k, v) in params.items() if k != 'api_sig')))
+
+class MemoryBackend(object):
+    """In-process LRU storage bounded to maxsize entries."""
+
+    def __init__(self, maxsize=256):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return (expires, value) or None."""
+
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                self._data.move_to_end(key)
+            return entry
+
+    def set(self, key, value, expires):
+        with self._lock:
+            self._data[key] = (expires, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def delete_prefix(self, prefix):
+        with self._lock:
+            for key in [k for k in self._data if k[0].startswith(prefix)]:
+                del self._data[key]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+class DiskBackend(object):
+    """On-disk storage, one pickle file per entry.
+
+    The least recently used entries (by file mtime) are removed beyond
+    maxsize entries. Cached models are pickled as their slot values.
+    Processes may share the directory: entries are written to temporary
+    files and renamed into place.
+    """
+
+    SUFFIX = '.cache'
+
+    def __init__(self, path, maxsize=1024):
+        self.path = path
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        if not os.path.isdir(path):
+            os.makedirs(path)
+
+    def _filename(self, key):
+        digest = hashlib.sha1(repr(key).encode('utf-8')).hexdigest()
+        return os.path.join(self.path, '%s-%s%s' % (key[0], digest, self.SUFFIX))
+
+    def _files(self):
+        return [os.path.join(self.path, f) for f in os.listdir(self.path)
+                if f.endswith(self.SUFFIX)]
+
+    def get(self, key):
+        filename = self._filename(key)
+        try:
+            with open(filename, 'rb') as f:
+                stored_key, expires, value = pickle.load(f)
+            os.utime(filename, None)
+        except (IOError, OSError, EOFError, pickle.UnpicklingError):
+            return None
+        if stored_key != key:
+            return None
+        return expires, value
+
+    def set(self, key, value, expires):
+        replace_file(self._filename(key), lambda f: pickle.dump(
+            (key, expires, value), f, pickle.HIGHEST_PROTOCOL), binary=True)
+
+        with self._lock:
+            files = self._files()
+            if len(files) > self.maxsize:
+                files.sort(key=self._mtime)
+                for f in files[:len(files) - self.maxsize]:
+                    self._remove(f)
+
+    def _mtime(self, filename):
+        try:
+            return os.path.getmtime(filename)
+        except OSError:
+            # Removed by another process.
+            return 0
+
+    def _remove(self, filename):
+        try:
+            os.remove(filename)
+        except OSError:
+            pass
+
+    def delete(self, key):
+        self._remove(self._filename(key))
+
+    def delete_prefix(self, prefix):
+        for f in self._files():
+            if os.path.basename(f).startswith(prefix):
+                self._remove(f)
+
+    def clear(self):
+        for f in self._files():
+            self._remove(f)
+
+class CacheStats(object):
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def __repr__(self):
+        return '<CacheStats - hits=%d, misses=%d, invalidations=%d>' % (
+                self.hits, self.misses, self.invalidations)
+
+class ResponseCache(object):
+    """Cache of parsed responses for read-only RTM methods.
+
+    A successful timeline write invalidates every cached method of the
+    same prefix (rtm.lists.setName drops rtm.lists.getList), and
+    rtm.transactions.undo drops everything.
+
+    Cached models are shared between callers; do not modify them.
+
+    Args:
+        backend - MemoryBackend (Default) or DiskBackend.
+        ttls - {method: seconds} merged over DEFAULT_TTLS; a ttl of 0 or
+            None disables caching of that method.
+    """
+
+    def __init__(self, backend=None, ttls=None, clock=time.time):
+        self.backend = backend is None and MemoryBackend() or backend
+        self.ttls = dict(DEFAULT_TTLS)
+        if ttls:
+            self.ttls.update(ttls)
+        self.clock = clock
+        self.stats = CacheStats()
+
+    def get(self, params):
+        """Return the cached value for the request or MISSING."""
+
+        if not self.ttls.get(params['method']):
+            return MISSING
+        entry = self.backend.get(request_key(params))
+        if entry is None or entry[0] <= self.clock():
+            self.stats.misses += 1
+            return MISSING
+        self.stats.hits += 1
+        return entry[1]
+
+    def set(self, params, value):
+        ttl = self.ttls.get(params['method'])
+        if ttl:
+            self.backend.set(request_key(params), value, self.clock() + ttl)
+
+    def invalidate(self, method):
+        """Drop what a successful write with method may have changed."""
+
+        self.stats.invalidations += 1
+        if method == 'rtm.transactions.undo':
+            self.backend.clear()
+        else:
+            self.backend.delete_prefix('.'.join(method.split('.')[:2]) + '.')
+
+    def clear(self):
+        self.backend.clear()
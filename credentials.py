@@ -0,0 +1,222 @@
+# -*- coding: utf-8 -*-
+
+"""Persistent tokens and frobs.
+
+    credentials = Credentials(FileStore('~/.milky/credentials.json'))
+    rtm = API(api_key, shared_secret, credentials=credentials, user='alice')
+    rtm.tasks.getList()
+
+API looks the token of user up in the store before going through the
+frob flow, and stores new tokens and pending frobs. A stored token is
+validated with auth.checkToken at most once per ttl seconds; the result
+is stored with it so that restarted workers skip the round trip.
+"""
+
+import json
+import os
+import threading
+import time
+
+from milky.fileutil import FileLock, replace_file
+
+# Seconds a successful auth.checkToken is trusted
+DEFAULT_CHECK_TTL = 24 * 60 * 60
+# RTM frobs are valid for 60 minutes
+FROB_TTL = 60 * 60
+# Permissions by strength; each includes the ones before it
+PERMS = (u'read', u'write', u'delete', )
+
+def covers(granted, perms):
+    """Whether a token with granted permissions allows perms."""
+
+    if perms is None:
+        return True
+    if granted not in PERMS or perms not in PERMS:
+        return granted == perms
+    return PERMS.index(granted) >= PERMS.index(perms)
+
+class Credential(object):
+    """Stored authorization of one user of an API key.
+
+    token, perms - auth token and its permissions, or None.
+    user_id, username - RTM user of the token.
+    checked - time of the last successful getToken or checkToken.
+    frob, frob_time - frob of a pending authorization and its time.
+    """
+
+    FIELDS = ('token', 'perms', 'user_id', 'username', 'checked', 'frob',
+            'frob_time', )
+
+    __slots__ = FIELDS
+
+    def __init__(self, **fields):
+        for field in self.FIELDS:
+            setattr(self, field, fields.get(field))
+
+    def as_dict(self):
+        return dict((field, getattr(self, field)) for field in self.FIELDS)
+
+    def __repr__(self):
+        return '<Credential - %s %s>' % (self.username or self.user_id,
+                self.perms)
+
+class MemoryStore(object):
+    """Credentials of the running process only."""
+
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def get(self, api_key, user):
+        with self._lock:
+            fields = self._data.get((api_key, user))
+        return fields and Credential(**fields) or None
+
+    def set(self, api_key, user, credential):
+        with self._lock:
+            self._data[(api_key, user)] = credential.as_dict()
+
+    def delete(self, api_key, user):
+        with self._lock:
+            self._data.pop((api_key, user), None)
+
+class FileStore(object):
+    """Credentials in a JSON file readable by its owner only.
+
+    {api_key: {user: {field: value}}}; writes replace the whole file.
+    Processes sharing the file take turns through a lock file next to it
+    (path + '.lock'); on systems without fcntl only the threads of one
+    process do, use SQLiteStore there.
+    """
+
+    def __init__(self, path):
+        self.path = os.path.expanduser(path)
+        self._lock = FileLock(self.path)
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory, 0o700)
+
+    def _load(self):
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except (IOError, OSError, ValueError):
+            return {}
+
+    def _save(self, data):
+        # mkstemp creates the file readable by its owner only.
+        replace_file(self.path,
+                lambda f: json.dump(data, f, indent=1, sort_keys=True))
+
+    def get(self, api_key, user):
+        fields = self._load().get(api_key, {}).get(user)
+        return fields and Credential(**fields) or None
+
+    def set(self, api_key, user, credential):
+        with self._lock:
+            data = self._load()
+            data.setdefault(api_key, {})[user] = credential.as_dict()
+            self._save(data)
+
+    def delete(self, api_key, user):
+        with self._lock:
+            data = self._load()
+            if data.get(api_key, {}).pop(user, None) is not None:
+                self._save(data)
+
+class SQLiteStore(object):
+    """Credentials in an SQLite database, shared by worker processes."""
+
+    def __init__(self, path):
+        import sqlite3
+
+        self.path = os.path.expanduser(path)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self.path, check_same_thread=False,
+                isolation_level=None)
+        self._db.execute('CREATE TABLE IF NOT EXISTS credentials ('
+                'api_key TEXT, user TEXT, %s, PRIMARY KEY (api_key, user))'
+                % ', '.join(Credential.FIELDS))
+
+    def get(self, api_key, user):
+        with self._lock:
+            row = self._db.execute('SELECT %s FROM credentials '
+                    'WHERE api_key = ? AND user = ?'
+                    % ', '.join(Credential.FIELDS), (api_key, user)).fetchone()
+        return row and Credential(**dict(zip(Credential.FIELDS, row))) or None
+
+    def set(self, api_key, user, credential):
+        values = credential.as_dict()
+        with self._lock:
+            self._db.execute('INSERT OR REPLACE INTO credentials '
+                    'VALUES (?, ?, %s)' % ', '.join(
+                        '?' for field in Credential.FIELDS),
+                    [api_key, user] + [values[f] for f in Credential.FIELDS])
+
+    def delete(self, api_key, user):
+        with self._lock:
+            self._db.execute('DELETE FROM credentials '
+                    'WHERE api_key = ? AND user = ?', (api_key, user))
+
+    def close(self):
+        self._db.close()
+
+class Credentials(object):
+    """A credential store with checkToken validation caching.
+
+    Args:
+        store - MemoryStore, FileStore, SQLiteStore or any object with
+            get(api_key, user), set(api_key, user, credential) and
+            delete(api_key, user).
+        ttl - Seconds a checkToken result is trusted.
+    """
+
+    def __init__(self, store, ttl=DEFAULT_CHECK_TTL, clock=time.time):
+        self.store = store
+        self.ttl = ttl
+        self.clock = clock
+
+    def token(self, api_key, user, perms=None):
+        """(token, fresh): the stored token or None, and whether it was
+        checked less than ttl seconds ago.
+
+        A token without perms (e.g. 'write' for a 'delete' API) is None;
+        it stays stored until a new one replaces it.
+        """
+
+        credential = self.store.get(api_key, user)
+        if credential is None or not credential.token \
+                or not covers(credential.perms, perms):
+            return None, False
+        return credential.token, credential.checked is not None \
+                and self.clock() - credential.checked < self.ttl
+
+    def save_auth(self, api_key, user, auth):
+        """Store the models.Auth of getToken or checkToken as checked now."""
+
+        credential = Credential(token=auth.token, perms=auth.perms,
+                checked=self.clock())
+        if getattr(auth, 'user', None) is not None:
+            credential.user_id = auth.user.id
+            credential.username = auth.user.username
+        self.store.set(api_key, user, credential)
+
+    def frob(self, api_key, user):
+        """Pending frob of user, unless RTM has expired it."""
+
+        credential = self.store.get(api_key, user)
+        if credential is None or not credential.frob \
+                or self.clock() - (credential.frob_time or 0) >= FROB_TTL:
+            return None
+        return credential.frob
+
+    def save_frob(self, api_key, user, frob):
+        credential = self.store.get(api_key, user) or Credential()
+        credential.frob = frob
+        credential.frob_time = self.clock()
+        self.store.set(api_key, user, credential)
+
+    def invalidate(self, api_key, user):
+        """Forget the token of user, e.g. after checkToken rejected it."""
+
+        self.store.delete(api_key, user)
@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+
+"""Columnar export of tasks for analytics (requires numpy).
+
+    cols = to_columns(rtm.tasks.getList())      # or rtm.iter_tasks()
+    open_ = numpy.isnat(cols.completed)
+    overdue = open_ & (cols.due < numpy.datetime64('now'))
+    list_ids, counts = numpy.unique(cols.list_id[overdue],
+            return_counts=True)
+    work_estimate = cols.estimate[cols.has_tag('work') & open_].sum()
+
+Every column has one entry per task. Missing dates and estimates are
+NaT, a missing priority or location is 0.
+"""
+
+import datetime
+from array import array
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+_EPOCH = datetime.datetime(1970, 1, 1)
+# int64 value of NaT
+_NAT = -2 ** 63
+
+def _seconds_since_epoch(v):
+    if v is None:
+        return _NAT
+    return int((v - _EPOCH).total_seconds())
+
+def _seconds(v):
+    if v is None:
+        return _NAT
+    return int(v.total_seconds())
+
+class TaskColumns(object):
+    """numpy arrays of task attributes, one entry per task.
+
+    task_id, taskseries_id, list_id, location_id - int64
+    name - object (str)
+    priority - int8 (1 high to 3 low, 0 none)
+    postponed - int32
+    has_due_time - bool
+    due, completed, added - datetime64[s] (UTC)
+    estimate - timedelta64[s]
+    tag_names - object, every tag once
+    tag_offsets, tag_codes - int64: the tags of task i are
+        tag_names[tag_codes[tag_offsets[i]:tag_offsets[i + 1]]]
+    """
+
+    COLUMNS = ('task_id', 'taskseries_id', 'list_id', 'location_id', 'name',
+            'priority', 'postponed', 'has_due_time', 'due', 'completed',
+            'added', 'estimate', )
+
+    def __init__(self, **columns):
+        for name in self.COLUMNS + ('tag_names', 'tag_offsets', 'tag_codes'):
+            setattr(self, name, columns[name])
+
+    def __len__(self):
+        return len(self.task_id)
+
+    def __repr__(self):
+        return '<TaskColumns - %d tasks, %d tags>' % (len(self),
+                len(self.tag_names))
+
+    def as_dict(self):
+        return dict((name, getattr(self, name)) for name in self.COLUMNS)
+
+    def has_tag(self, tag):
+        """Boolean mask of the tasks tagged with tag."""
+
+        mask = numpy.zeros(len(self), dtype=bool)
+        codes = numpy.flatnonzero(self.tag_names == tag)
+        if len(codes):
+            hits = numpy.flatnonzero(self.tag_codes == codes[0])
+            mask[numpy.searchsorted(self.tag_offsets, hits, side='right')
+                    - 1] = True
+        return mask
+
+def _records(source):
+    """(list, taskseries, task) of a Tasks or of an iterable of records."""
+
+    if hasattr(source, 'lists'):
+        return ((tasklist, series, task) for tasklist in source.lists
+                for series in tasklist.taskseries for task in series.task)
+    return source
+
+def to_columns(source):
+    """TaskColumns of a models.Tasks or of (list, taskseries, task)
+    records, e.g. API.iter_tasks() or sync.Replica.iter_tasks().
+
+    Records are consumed one at a time into compact typed buffers, so a
+    streaming source is never held in memory as models.
+    """
+
+    if numpy is None:
+        raise ImportError('milky.export requires numpy')
+
+    ints = dict((name, array('q')) for name in ('task_id', 'taskseries_id',
+        'list_id', 'location_id', 'due', 'completed', 'added', 'estimate',
+        'tag_offsets', 'tag_codes'))
+    priority = array('b')
+    postponed = array('l')
+    has_due_time = array('b')
+    name = []
+    tag_codes = {}
+
+    task_id = ints['task_id'].append
+    taskseries_id = ints['taskseries_id'].append
+    list_id = ints['list_id'].append
+    location_id = ints['location_id'].append
+    due = ints['due'].append
+    completed = ints['completed'].append
+    added = ints['added'].append
+    estimate = ints['estimate'].append
+    tag_offsets = ints['tag_offsets']
+    codes = ints['tag_codes']
+
+    for tasklist, series, task in _records(source):
+        task_id(int(task.id))
+        taskseries_id(int(series.id))
+        series_list_id = getattr(series, 'list_id', None)
+        if series_list_id is None:
+            series_list_id = tasklist.id
+        list_id(int(series_list_id))
+        location_id(series.location_id or 0)
+        name.append(series.name)
+        priority.append(task.priority or 0)
+        postponed.append(task.postponed or 0)
+        has_due_time.append(task.has_due_time and 1 or 0)
+        due(_seconds_since_epoch(task.due))
+        completed(_seconds_since_epoch(task.completed))
+        added(_seconds_since_epoch(task.added))
+        estimate(_seconds(task.estimate))
+        tag_offsets.append(len(codes))
+        for tag in series.tags or ():
+            code = tag_codes.get(tag)
+            if code is None:
+                code = tag_codes[tag] = len(tag_codes)
+            codes.append(code)
+    tag_offsets.append(len(codes))
+
+    columns = dict((k, numpy.array(v, dtype=numpy.int64))
+            for (k, v) in ints.items())
+    for k in ('due', 'completed', 'added'):
+        columns[k] = columns[k].view('datetime64[s]')
+    columns['estimate'] = columns['estimate'].view('timedelta64[s]')
+    columns['priority'] = numpy.array(priority, dtype=numpy.int8)
+    columns['postponed'] = numpy.array(postponed, dtype=numpy.int32)
+    columns['has_due_time'] = numpy.array(has_due_time, dtype=bool)
+    columns['name'] = numpy.array(name, dtype=object)
+    tag_names = numpy.empty(len(tag_codes), dtype=object)
+    for tag, code in tag_codes.items():
+        tag_names[code] = tag
+    columns['tag_names'] = tag_names
+    return TaskColumns(**columns)
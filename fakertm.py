@@ -0,0 +1,588 @@
+# -*- coding: utf-8 -*-
+
+"""Local stand-in for the RTM REST API.
+
+    with FakeRTM(lists=10, taskseries=1000, latency=0.005) as server:
+        rtm = API(server.api_key, server.shared_secret,
+                token=server.token, api_url=server.url)
+        tasks = rtm.tasks.getList()
+
+The server keeps an in-memory account, checks API keys, signatures,
+tokens and timelines like RTM does and answers in the JSON shapes of the
+REST API (including a single object in place of a one element array).
+Only the methods needed by tests and benchmarks are implemented; the
+others fail with "Method not found".
+
+Latency, jitter and injected failures (RTM errors and HTTP 503) make it
+usable for retry and load tests.
+"""
+
+import copy
+import datetime
+import gzip
+import hashlib
+import json
+import random
+import threading
+import time
+import urllib.parse
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from milky import request
+
+DATE_FORMAT = '%Y-%m-%dT%H:%M:%SZ'
+
+# RTM error codes
+ERRCODE_INVALID_SIGNATURE = 96
+ERRCODE_MISSING_SIGNATURE = 97
+ERRCODE_LOGIN_FAILED = 98
+ERRCODE_INVALID_API_KEY = 100
+ERRCODE_INVALID_FROB = 101
+ERRCODE_SERVICE_UNAVAILABLE = 105
+ERRCODE_METHOD_NOT_FOUND = 112
+ERRCODE_TIMELINE_INVALID = 300
+ERRCODE_TASK_INVALID = 340
+ERRCODE_TRANSACTION_INVALID = 360
+
+_AUTH_REQUIRED = dict(
+        (request.method_name(prefix, name), spec[0])
+        for (prefix, methods) in request.METHODS.items()
+        for (name, spec) in methods.items())
+
+def _timestamp(r, base=datetime.datetime(2010, 1, 1)):
+    return (base + datetime.timedelta(seconds=r.randint(0, 10 ** 8))) \
+            .strftime(DATE_FORMAT)
+
+def _signature(shared_secret, params):
+    """RTM's api_sig, computed apart from milky.signing."""
+
+    text = shared_secret + ''.join(k + params[k] for k in sorted(params))
+    return hashlib.md5(text.encode('utf-8')).hexdigest()
+
+def _now():
+    return datetime.datetime.now(datetime.timezone.utc).strftime(DATE_FORMAT)
+
+def _one_or_many(items):
+    """A single object in place of a one element array, as RTM does."""
+
+    if len(items) == 1:
+        return items[0]
+    return items
+
+def synthetic_tasks(lists=10, taskseries=1000, seed=0):
+    """A tasks.getList 'rsp' with lists * taskseries task series."""
+
+    r = random.Random(seed)
+    task_id = 0
+    rsp_lists = []
+    for list_id in range(lists):
+        series = []
+        for i in range(taskseries):
+            task_id += 1
+            obj = {
+                'id': str(task_id),
+                'created': _timestamp(r),
+                'modified': _timestamp(r),
+                'name': 'Task %d' % task_id,
+                'source': 'api',
+                'url': '',
+                'location_id': '',
+                'tags': i % 3 and {'tag': ['tag%d' % (i % 7), 'work']} or [],
+                'participants': [],
+                'notes': i % 5 == 0 and {'note': [{'id': str(task_id),
+                    'created': _timestamp(r), 'modified': _timestamp(r),
+                    'title': 'Note', '$t': 'Some text ' * 10}]} or [],
+                'task': {
+                    'id': str(task_id),
+                    'due': i % 2 and _timestamp(r) or '',
+                    'has_due_time': str(i % 2),
+                    'added': _timestamp(r),
+                    'completed': i % 4 == 0 and _timestamp(r) or '',
+                    'deleted': '',
+                    'priority': r.choice(['N', '1', '2', '3']),
+                    'postponed': '0',
+                    'estimate': i % 6 == 0 and '1 hour 30 minutes' or '', },
+                }
+            if i % 10 == 0:
+                obj['rrule'] = {'every': '1',
+                        '$t': 'FREQ=WEEKLY;INTERVAL=1;BYDAY=MO,WE'}
+            series.append(obj)
+        rsp_lists.append({'id': str(100 + list_id), 'taskseries': series})
+    return {'stat': 'ok', 'tasks': {'rev': 'abc', 'list': rsp_lists}}
+
+class Fault(Exception):
+    """RTM error answered with stat="fail"."""
+
+    def __init__(self, code, msg):
+        super(Fault, self).__init__(msg)
+        self.code = code
+        self.msg = msg
+
+class Account(object):
+    """Lists and task series of the fake account, in REST JSON shapes.
+
+    lists - {list_id: list attributes}
+    taskseries - {list_id: {taskseries_id: taskseries}}, 'task' is a list.
+    deleted - [(list_id, taskseries_id, task_id, deleted)]
+    """
+
+    def __init__(self, lists=10, taskseries=100, seed=0):
+        self.lists = OrderedDict()
+        self.taskseries = OrderedDict()
+        self.deleted = []
+        self._next_id = 0
+
+        rsp = synthetic_tasks(lists, taskseries, seed)
+        for i, obj in enumerate(rsp['tasks']['list']):
+            list_id = obj['id']
+            self.lists[list_id] = {'id': list_id, 'name': 'List %d' % i,
+                    'deleted': '0', 'locked': i == 0 and '1' or '0',
+                    'archived': '0', 'position': str(i), 'smart': '0',
+                    'sort_order': '0'}
+            series = self.taskseries[list_id] = OrderedDict()
+            for s in obj['taskseries']:
+                s['task'] = [s['task'], ]
+                series[s['id']] = s
+                self._next_id = max(self._next_id, int(s['id']))
+
+    def next_id(self):
+        self._next_id += 1
+        return str(self._next_id)
+
+    def __len__(self):
+        return sum(len(s['task']) for series in self.taskseries.values()
+                for s in series.values())
+
+    def find(self, params):
+        """(list_id, taskseries, task) named by params or Fault."""
+
+        try:
+            series = self.taskseries[params['list_id']] \
+                    [params['taskseries_id']]
+        except KeyError:
+            raise Fault(ERRCODE_TASK_INVALID,
+                    'list_id/taskseries_id/task_id invalid or not provided')
+        for task in series['task']:
+            if task['id'] == params.get('task_id'):
+                return params['list_id'], series, task
+        raise Fault(ERRCODE_TASK_INVALID,
+                'list_id/taskseries_id/task_id invalid or not provided')
+
+    def tasks(self, list_id=None, status=None, last_sync=None):
+        """tasks.getList 'tasks' element."""
+
+        lists = []
+        for (lid, series) in self.taskseries.items():
+            if list_id is not None and lid != list_id:
+                continue
+            selected = []
+            for s in series.values():
+                if last_sync is not None and s['modified'] < last_sync:
+                    continue
+                tasks = [t for t in s['task'] if status is None
+                        or bool(t['completed']) == (status == 'completed')]
+                if tasks:
+                    s = dict(s)
+                    s['task'] = _one_or_many(tasks)
+                    selected.append(s)
+
+            obj = {'id': lid}
+            if selected:
+                obj['taskseries'] = _one_or_many(selected)
+            if last_sync is not None:
+                # RTM echoes the last_sync of the request.
+                obj['current'] = last_sync
+                deleted = [{'id': series_id, 'task': {'id': task_id,
+                    'deleted': when}}
+                    for (dlid, series_id, task_id, when) in self.deleted
+                    if dlid == lid and when >= last_sync]
+                if deleted:
+                    obj['deleted'] = {'taskseries': _one_or_many(deleted)}
+            if selected or last_sync is not None:
+                lists.append(obj)
+        return {'rev': str(self._next_id), 'list': lists}
+
+class FakeRTM(object):
+    """RTM REST server on a local port.
+
+    Args:
+        api_key, shared_secret - credentials the server accepts.
+        lists, taskseries - account size: lists * taskseries task series.
+        latency - seconds added to every response.
+        jitter - up to this many more seconds, at random.
+        error_rate - fraction of requests failing with error_code.
+        error_code - RTM error of injected failures (Default: 105,
+            "Service currently unavailable").
+        http_error_rate - fraction of requests answered with HTTP 503.
+        compress - gzip level of responses to clients accepting gzip,
+            0 for none.
+        etags - send an ETag with every response and answer 304 Not
+            Modified to a matching If-None-Match.
+        seed - seed of the account and of the injected failures.
+
+    Attributes:
+        url - api_url to give to API.
+        token - valid auth_token.
+        calls - {method: number of requests}
+    """
+
+    def __init__(self, api_key='api-key', shared_secret='shared-secret',
+            lists=10, taskseries=100, latency=0, jitter=0, error_rate=0,
+            error_code=ERRCODE_SERVICE_UNAVAILABLE, http_error_rate=0,
+            compress=0, etags=False, seed=0, host='127.0.0.1', port=0):
+        self.api_key = api_key
+        self.shared_secret = shared_secret
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_code = error_code
+        self.http_error_rate = http_error_rate
+        self.compress = compress
+        self.etags = etags
+        self.token = 'token-%s' % api_key
+        self.frob = 'frob-%s' % api_key
+        self.account = Account(lists, taskseries, seed)
+        self.calls = {}
+        self.timelines = set()
+        self.transactions = {}
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._address = (host, port)
+        self._server = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return 'http://%s:%d/services/rest/' % (host, port)
+
+    def start(self):
+        self._server = ThreadingHTTPServer(self._address, _Handler)
+        self._server.daemon_threads = True
+        self._server.fake = self
+        thread = threading.Thread(target=self._server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def handle(self, params):
+        """(HTTP status, body) for the request parameters."""
+
+        delay = self.latency
+        if self.jitter:
+            delay += self._random.uniform(0, self.jitter)
+        if delay:
+            time.sleep(delay)
+
+        with self._lock:
+            method = params.get('method', '')
+            self.calls[method] = self.calls.get(method, 0) + 1
+            if self.http_error_rate \
+                    and self._random.random() < self.http_error_rate:
+                return 503, b'Service Unavailable'
+            try:
+                if self.error_rate and self._random.random() < self.error_rate:
+                    raise Fault(self.error_code, 'Service currently unavailable')
+                rsp = self._dispatch(method, params)
+            except Fault as e:
+                rsp = {'stat': 'fail', 'err': {
+                    'code': str(e.code), 'msg': e.msg}}
+            else:
+                rsp['stat'] = 'ok'
+        return 200, json.dumps({'rsp': rsp}).encode('utf-8')
+
+    def _dispatch(self, method, params):
+        if params.get('api_key') != self.api_key:
+            raise Fault(ERRCODE_INVALID_API_KEY, 'Invalid API Key')
+        params = dict(params)
+        api_sig = params.pop('api_sig', None)
+        if not api_sig:
+            raise Fault(ERRCODE_MISSING_SIGNATURE, 'Missing signature')
+        if api_sig != _signature(self.shared_secret, params):
+            raise Fault(ERRCODE_INVALID_SIGNATURE, 'Invalid signature')
+
+        handler = _HANDLERS.get(method)
+        if handler is None:
+            raise Fault(ERRCODE_METHOD_NOT_FOUND, 'Method "%s" not found'
+                    % method)
+        if _AUTH_REQUIRED.get(method) \
+                and params.get('auth_token') != self.token:
+            raise Fault(ERRCODE_LOGIN_FAILED,
+                    'Login failed / Invalid auth token')
+        return handler(self, params)
+
+    # Timeline writes
+
+    def _write(self, params, undo):
+        """Check the timeline and record an undoable transaction."""
+
+        if params.get('timeline') not in self.timelines:
+            raise Fault(ERRCODE_TIMELINE_INVALID,
+                    'Timeline invalid or not provided')
+        transaction_id = self.account.next_id()
+        self.transactions[transaction_id] = undo
+        return {'id': transaction_id, 'undoable': '1'}
+
+    def _task_write(self, params, change):
+        """Apply change(series, task) to the task named by params."""
+
+        list_id, series, task = self.account.find(params)
+        old = copy.deepcopy(series)
+
+        def undo():
+            self.account.taskseries[list_id][series['id']] = old
+
+        transaction = self._write(params, undo)
+        change(series, task)
+        series['modified'] = _now()
+        return {'transaction': transaction, 'list': {'id': list_id,
+            'taskseries': dict(series, task=_one_or_many(series['task']))}}
+
+    def tasks_add(self, params):
+        list_id = params.get('list_id') or next(iter(self.account.lists))
+        if list_id not in self.account.taskseries:
+            raise Fault(ERRCODE_TASK_INVALID, 'list_id invalid')
+        now = _now()
+        series_id = self.account.next_id()
+        series = {'id': series_id, 'created': now, 'modified': now,
+                'name': params['name'], 'source': 'api', 'url': '',
+                'location_id': '', 'tags': [], 'participants': [],
+                'notes': [], 'task': [{'id': self.account.next_id(),
+                    'due': '', 'has_due_time': '0', 'added': now,
+                    'completed': '', 'deleted': '', 'priority': 'N',
+                    'postponed': '0', 'estimate': ''}]}
+
+        def undo():
+            del self.account.taskseries[list_id][series_id]
+
+        transaction = self._write(params, undo)
+        self.account.taskseries[list_id][series_id] = series
+        return {'transaction': transaction, 'list': {'id': list_id,
+            'taskseries': dict(series, task=series['task'][0])}}
+
+    def tasks_complete(self, params):
+        def change(series, task):
+            task['completed'] = _now()
+        return self._task_write(params, change)
+
+    def tasks_uncomplete(self, params):
+        def change(series, task):
+            task['completed'] = ''
+        return self._task_write(params, change)
+
+    def tasks_delete(self, params):
+        def change(series, task):
+            task['deleted'] = _now()
+            series['task'].remove(task)
+            self.account.deleted.append((params['list_id'], series['id'],
+                task['id'], task['deleted']))
+        return self._task_write(params, change)
+
+    def tasks_setName(self, params):
+        def change(series, task):
+            series['name'] = params['name']
+        return self._task_write(params, change)
+
+    def tasks_setPriority(self, params):
+        def change(series, task):
+            task['priority'] = params.get('priority') or 'N'
+        return self._task_write(params, change)
+
+    def tasks_setDueDate(self, params):
+        def change(series, task):
+            task['due'] = params.get('due', '')
+            task['has_due_time'] = params.get('has_due_time', '0')
+        return self._task_write(params, change)
+
+    def tasks_postpone(self, params):
+        def change(series, task):
+            task['postponed'] = str(int(task['postponed']) + 1)
+        return self._task_write(params, change)
+
+    def tasks_setTags(self, params):
+        def change(series, task):
+            tags = [t for t in params.get('tags', '').split(',') if t]
+            series['tags'] = tags and {'tag': _one_or_many(tags)} or []
+        return self._task_write(params, change)
+
+    def tasks_addTags(self, params):
+        def change(series, task):
+            tags = _tags(series)
+            tags.extend(t for t in params['tags'].split(',')
+                    if t and t not in tags)
+            series['tags'] = tags and {'tag': _one_or_many(tags)} or []
+        return self._task_write(params, change)
+
+    def tasks_removeTags(self, params):
+        def change(series, task):
+            removed = params['tags'].split(',')
+            tags = [t for t in _tags(series) if t not in removed]
+            series['tags'] = tags and {'tag': _one_or_many(tags)} or []
+        return self._task_write(params, change)
+
+    def tasks_notes_add(self, params):
+        note = {}
+
+        def change(series, task):
+            now = _now()
+            note.update({'id': self.account.next_id(), 'created': now,
+                'modified': now, 'title': params['note_title'],
+                '$t': params['note_text']})
+            notes = series['notes'] and series['notes']['note'] or []
+            if type(notes) is not list:
+                notes = [notes, ]
+            series['notes'] = {'note': notes + [note, ]}
+
+        rsp = self._task_write(params, change)
+        return {'transaction': rsp['transaction'], 'note': note}
+
+    def transactions_undo(self, params):
+        if params.get('timeline') not in self.timelines:
+            raise Fault(ERRCODE_TIMELINE_INVALID,
+                    'Timeline invalid or not provided')
+        undo = self.transactions.pop(params.get('transaction_id'), None)
+        if undo is None:
+            raise Fault(ERRCODE_TRANSACTION_INVALID,
+                    'transaction_id invalid or not provided')
+        undo()
+        return {}
+
+    # Reads
+
+    def auth_getFrob(self, params):
+        return {'frob': self.frob}
+
+    def _auth(self):
+        return {'auth': {'token': self.token, 'perms': 'delete',
+            'user': {'id': '1', 'username': 'fake', 'fullname': 'Fake RTM'}}}
+
+    def auth_getToken(self, params):
+        if params.get('frob') != self.frob:
+            raise Fault(ERRCODE_INVALID_FROB, 'Invalid frob')
+        return self._auth()
+
+    def auth_checkToken(self, params):
+        if params.get('auth_token') != self.token:
+            raise Fault(ERRCODE_LOGIN_FAILED,
+                    'Login failed / Invalid auth token')
+        return self._auth()
+
+    def test_echo(self, params):
+        return dict((k, v) for (k, v) in params.items()
+                if k not in ('api_key', 'auth_token'))
+
+    def test_login(self, params):
+        return {'user': {'id': '1', 'username': 'fake'}}
+
+    def timelines_create(self, params):
+        timeline = self.account.next_id()
+        self.timelines.add(timeline)
+        return {'timeline': timeline}
+
+    def lists_getList(self, params):
+        return {'lists': {'list': list(self.account.lists.values())}}
+
+    def tasks_getList(self, params):
+        status = None
+        for term in params.get('filter', '').split():
+            if term in ('status:completed', 'status:incomplete'):
+                status = term.split(':')[1]
+        return {'tasks': self.account.tasks(params.get('list_id'), status,
+            params.get('last_sync'))}
+
+def _tags(series):
+    tags = series['tags'] and series['tags']['tag'] or []
+    if type(tags) is not list:
+        tags = [tags, ]
+    return list(tags)
+
+_HANDLERS = {
+    'rtm.auth.checkToken': FakeRTM.auth_checkToken,
+    'rtm.auth.getFrob': FakeRTM.auth_getFrob,
+    'rtm.auth.getToken': FakeRTM.auth_getToken,
+    'rtm.lists.getList': FakeRTM.lists_getList,
+    'rtm.tasks.add': FakeRTM.tasks_add,
+    'rtm.tasks.addTags': FakeRTM.tasks_addTags,
+    'rtm.tasks.complete': FakeRTM.tasks_complete,
+    'rtm.tasks.delete': FakeRTM.tasks_delete,
+    'rtm.tasks.getList': FakeRTM.tasks_getList,
+    'rtm.tasks.notes.add': FakeRTM.tasks_notes_add,
+    'rtm.tasks.postpone': FakeRTM.tasks_postpone,
+    'rtm.tasks.removeTags': FakeRTM.tasks_removeTags,
+    'rtm.tasks.setDueDate': FakeRTM.tasks_setDueDate,
+    'rtm.tasks.setName': FakeRTM.tasks_setName,
+    'rtm.tasks.setPriority': FakeRTM.tasks_setPriority,
+    'rtm.tasks.setTags': FakeRTM.tasks_setTags,
+    'rtm.tasks.uncomplete': FakeRTM.tasks_uncomplete,
+    'rtm.test.echo': FakeRTM.test_echo,
+    'rtm.test.login': FakeRTM.test_login,
+    'rtm.timelines.create': FakeRTM.timelines_create,
+    'rtm.transactions.undo': FakeRTM.transactions_undo, }
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # headers and body in one segment, without waiting for delayed ACKs
+    wbufsize = -1
+    disable_nagle_algorithm = True
+
+    def _reply(self, query):
+        params = dict(urllib.parse.parse_qsl(query, keep_blank_values=True))
+        fake = self.server.fake
+        status, body = fake.handle(params)
+        if status == 200 and fake.etags:
+            etag = '"%s"' % hashlib.sha1(body).hexdigest()
+            if self.headers.get('If-None-Match') == etag:
+                self.send_response(304)
+                self.send_header('ETag', etag)
+                self.end_headers()
+                return
+        else:
+            etag = None
+        encoding = None
+        if fake.compress and 'gzip' in self.headers.get('Accept-Encoding', ''):
+            body = gzip.compress(body, fake.compress)
+            encoding = 'gzip'
+
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        if etag is not None:
+            self.send_header('ETag', etag)
+        if encoding is not None:
+            self.send_header('Content-Encoding', encoding)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        self._reply(urllib.parse.urlsplit(self.path).query)
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        self._reply(self.rfile.read(length).decode('ascii'))
+
+    def log_message(self, format, *args):
+        pass
+
+if __name__ == '__main__':
+    import sys
+    server = FakeRTM(port=len(sys.argv) > 1 and int(sys.argv[1]) or 0)
+    server.start()
+    print('%s api_key=%s shared_secret=%s token=%s' % (server.url,
+        server.api_key, server.shared_secret, server.token))
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.stop()
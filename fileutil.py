@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+
+"""Files shared between threads and processes."""
+
+import os
+import tempfile
+import threading
+
+try:
+    import fcntl
+except ImportError:
+    # Not on Windows: FileLock only excludes the threads of a process.
+    fcntl = None
+
+def replace_file(path, write, binary=False, fsync=False):
+    """Write path through write(f) on a new file in the same directory,
+    renamed over path once complete: readers see the old or the new
+    content, never a part.
+
+    Args:
+        path - file to replace.
+        write - function called with the open temporary file.
+        binary - open the temporary file in binary mode.
+        fsync - flush the content to disk before the rename.
+    """
+
+    directory, name = os.path.split(path)
+    fd, tmp = tempfile.mkstemp(prefix='.%s.' % name, suffix='.tmp',
+            dir=directory or '.')
+    try:
+        with os.fdopen(fd, binary and 'wb' or 'w') as f:
+            write(f)
+            if fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+
+class FileLock(object):
+    """Exclusive lock on path + '.lock' across threads and processes,
+    held in a with block around a read-modify-replace of path."""
+
+    def __init__(self, path):
+        self.path = path + '.lock'
+        self._lock = threading.Lock()
+        self._fd = None
+
+    def __enter__(self):
+        self._lock.acquire()
+        if fcntl is not None:
+            try:
+                fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX)
+                except BaseException:
+                    os.close(fd)
+                    raise
+            except BaseException:
+                self._lock.release()
+                raise
+            self._fd = fd
+        return self
+
+    def __exit__(self, *exc_info):
+        fd, self._fd = self._fd, None
+        if fd is not None:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+            os.close(fd)
+        self._lock.release()
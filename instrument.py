@@ -0,0 +1,216 @@
+# -*- coding: utf-8 -*-
+
+"""Per-call instrumentation of API.
+
+    histograms = Histograms()
+    rtm = API(api_key, shared_secret, token=token, instrument=histograms)
+    ...
+    print(histograms.report())
+
+API builds a CallEvent for every RTM call and gives it to
+instrument.record() once the call is over. Without an instrument
+(the default) no event is built and nothing is timed.
+"""
+
+import bisect
+import threading
+import time
+
+# Phases of a call, in order
+PHASE_SIGN = 'sign'
+PHASE_WAIT = 'wait'
+PHASE_CONNECT = 'connect'
+PHASE_TRANSFER = 'transfer'
+PHASE_DECODE = 'decode'
+PHASE_PARSE = 'parse'
+PHASES = (PHASE_SIGN, PHASE_WAIT, PHASE_CONNECT, PHASE_TRANSFER,
+        PHASE_DECODE, PHASE_PARSE, )
+
+clock = time.perf_counter
+
+class CallEvent(object):
+    """Timings and outcome of one RTM call.
+
+    Phase timings are in seconds and add up over retried attempts:
+        sign - parameters and signature.
+        wait - scheduler pacing and retry backoff.
+        connect - until the response headers arrived (connection, request
+            and server time).
+        transfer - response body.
+        decode - JSON decoding and status check.
+        parse - model_cls._parse.
+
+    bytes - size of the last response body.
+    wire_bytes - bytes of the last response body as received: less than
+        bytes when it came compressed, 0 when it was revalidated.
+    attempts - requests sent (0 for cached and coalesced results).
+    coalesced - whether the call shared the request of a concurrent
+        identical call (its wait is the time spent waiting for it).
+    error_code - MilkyError number of a failed call, otherwise None.
+    """
+
+    __slots__ = ('method', 'cached', 'coalesced', 'bytes', 'wire_bytes',
+            'attempts', 'error_code', 'started', 'ended', '_lap', ) + PHASES
+
+    def __init__(self, method):
+        self.method = method
+        self.cached = False
+        self.coalesced = False
+        self.bytes = 0
+        self.wire_bytes = 0
+        self.attempts = 0
+        self.error_code = None
+        self.started = self._lap = clock()
+        self.ended = None
+        for phase in PHASES:
+            setattr(self, phase, 0.0)
+
+    def lap(self, phase):
+        """Add the time since the previous lap to phase."""
+
+        now = clock()
+        setattr(self, phase, getattr(self, phase) + now - self._lap)
+        self._lap = now
+
+    def response(self, response):
+        """Split the transport time of response into connect and transfer."""
+
+        self.lap(PHASE_TRANSFER)
+        self.bytes = len(response.body)
+        self.wire_bytes = getattr(response, 'wire_bytes', self.bytes)
+        connect = getattr(response, 'connect', None)
+        if connect:
+            connect = min(connect, self.transfer)
+            self.transfer -= connect
+            self.connect += connect
+
+    def end(self):
+        self.ended = clock()
+
+    @property
+    def duration(self):
+        return (self.ended or self._lap) - self.started
+
+    def __repr__(self):
+        return '<CallEvent - %s %.1f ms%s>' % (self.method,
+                self.duration * 1000,
+                self.error_code is not None and ' error %d' % self.error_code
+                or self.cached and ' cached'
+                or self.coalesced and ' coalesced' or '')
+
+class Instrument(object):
+    """Receiver of CallEvents; subclasses override record()."""
+
+    def record(self, event):
+        pass
+
+# Histogram bucket upper bounds: 50us doubling up to about 52 seconds
+BOUNDS = tuple(0.00005 * 2 ** i for i in range(21))
+
+class Histogram(object):
+    """Log-scale histogram of durations in seconds."""
+
+    def __init__(self):
+        self.counts = [0] * (len(BOUNDS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, value):
+        self.counts[bisect.bisect_left(BOUNDS, value)] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    @property
+    def mean(self):
+        return self.count and self.total / self.count or 0.0
+
+    def percentile(self, p):
+        """Upper bound of the bucket holding the p-th percentile."""
+
+        if not self.count:
+            return 0.0
+        rank = self.count * p / 100.0
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank and n:
+                return i < len(BOUNDS) and min(BOUNDS[i], self.max) \
+                        or self.max
+        return self.max
+
+class MethodStats(object):
+    """Aggregated CallEvents of one RTM method."""
+
+    def __init__(self, method):
+        self.method = method
+        self.calls = 0
+        self.cached = 0
+        self.coalesced = 0
+        self.attempts = 0
+        self.bytes = 0
+        self.wire_bytes = 0
+        self.errors = {}
+        self.duration = Histogram()
+        self.phases = dict((phase, Histogram()) for phase in PHASES)
+
+    def add(self, event):
+        self.calls += 1
+        self.attempts += event.attempts
+        self.bytes += event.bytes
+        self.wire_bytes += event.wire_bytes
+        if event.cached:
+            self.cached += 1
+        if event.coalesced:
+            self.coalesced += 1
+        if event.error_code is not None:
+            self.errors[event.error_code] = \
+                    self.errors.get(event.error_code, 0) + 1
+        self.duration.add(event.duration)
+        for phase in PHASES:
+            self.phases[phase].add(getattr(event, phase))
+
+    def __repr__(self):
+        return '<MethodStats - %s calls=%d, p50=%.1f ms, p99=%.1f ms>' % (
+                self.method, self.calls, self.duration.percentile(50) * 1000,
+                self.duration.percentile(99) * 1000)
+
+class Histograms(Instrument):
+    """Instrument keeping a MethodStats per RTM method; thread-safe."""
+
+    def __init__(self):
+        self.methods = {}
+        self._lock = threading.Lock()
+
+    def record(self, event):
+        with self._lock:
+            stats = self.methods.get(event.method)
+            if stats is None:
+                stats = self.methods[event.method] = MethodStats(event.method)
+            stats.add(event)
+
+    def reset(self):
+        with self._lock:
+            self.methods = {}
+
+    def report(self):
+        """Text table: calls, latency percentiles, response sizes (decoded
+        and on the wire) and mean phase times."""
+
+        lines = ['%-28s %6s %6s %9s %9s %9s %9s  %s' % ('method', 'calls',
+            'errors', 'p50 ms', 'p99 ms', 'KiB/call', 'wire KiB', ' '.join(
+                '%8s' % phase for phase in PHASES))]
+        with self._lock:
+            methods = sorted(self.methods.values(), key=lambda s: s.method)
+        for stats in methods:
+            lines.append('%-28s %6d %6d %9.2f %9.2f %9.1f %9.1f  %s' % (
+                stats.method, stats.calls, sum(stats.errors.values()),
+                stats.duration.percentile(50) * 1000,
+                stats.duration.percentile(99) * 1000,
+                stats.bytes / 1024.0 / stats.calls,
+                stats.wire_bytes / 1024.0 / stats.calls,
+                ' '.join('%8.2f' % (stats.phases[phase].mean * 1000)
+                    for phase in PHASES)))
+        return '\n'.join(lines)
@@ -0,0 +1,517 @@
+# -*- coding: utf-8 -*-
+
+"""Offline timeline writes: a durable journal replayed when RTM is
+reachable.
+
+    writer = OfflineWriter(rtm, FileJournal('~/.milky/journal'))
+    writer.tasks.setPriority(list_id=..., taskseries_id=..., task_id=...,
+            priority=1)     # returns at once
+    writer.replay()         # or writer.start() to replay in the background
+
+Writes take the same names and arguments as on API, without timeline.
+They are appended to the journal and sent in order, on a fresh timeline
+per replay. Writes made redundant by a later write to the same task are
+not sent, e.g. all but the last setPriority; they leave the journal once
+RTM accepted the write replacing them, and are sent after all if RTM
+rejects it.
+
+Delivery is at least once: a write whose response was lost to a network
+error is sent again by the next replay, like RetryPolicy(retry_writes=True).
+"""
+
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+
+from milky import request
+from milky.error import MilkyError
+from milky.fileutil import replace_file
+from milky.retry import RETRYABLE_CODES
+
+# Seconds between replays of the background thread while RTM is away
+DEFAULT_REPLAY_INTERVAL = 30
+
+_TASK_WRITES = ('addTags', 'complete', 'movePriority', 'postpone',
+        'removeTags', 'setDueDate', 'setEstimate', 'setLocation', 'setName',
+        'setPriority', 'setRecurrence', 'setTags', 'setURL', 'uncomplete', )
+
+# {method: earlier methods on the same task that it makes redundant}
+SUPERSEDES = {
+    'rtm.tasks.setDueDate': ('rtm.tasks.setDueDate', 'rtm.tasks.postpone', ),
+    'rtm.tasks.setEstimate': ('rtm.tasks.setEstimate', ),
+    'rtm.tasks.setLocation': ('rtm.tasks.setLocation', ),
+    'rtm.tasks.setName': ('rtm.tasks.setName', ),
+    'rtm.tasks.setPriority': ('rtm.tasks.setPriority',
+        'rtm.tasks.movePriority', ),
+    'rtm.tasks.setRecurrence': ('rtm.tasks.setRecurrence', ),
+    'rtm.tasks.setTags': ('rtm.tasks.setTags', 'rtm.tasks.addTags',
+        'rtm.tasks.removeTags', ),
+    'rtm.tasks.setURL': ('rtm.tasks.setURL', ),
+    'rtm.tasks.delete': tuple('rtm.tasks.%s' % name
+        for name in _TASK_WRITES) + ('rtm.tasks.notes.add', ), }
+
+class JournalEntry(object):
+    """A journaled write: seq orders the writes of a journal."""
+
+    __slots__ = ('seq', 'method', 'params', 'created', )
+
+    def __init__(self, seq, method, params, created=None):
+        self.seq = seq
+        self.method = method
+        self.params = params
+        self.created = created
+
+    @property
+    def task_key(self):
+        """(list_id, taskseries_id, task_id) of a task write, or None."""
+
+        params = self.params
+        if 'task_id' not in params or 'list_id' not in params:
+            return None
+        return ('%s' % params['list_id'], '%s' % params.get('taskseries_id'),
+                '%s' % params['task_id'])
+
+    def __repr__(self):
+        return '<JournalEntry - %d %s>' % (self.seq, self.method)
+
+def supersede(entries):
+    """{seq: seq of the last write to the same task making it redundant}
+    of entries."""
+
+    replaced = {}
+    # {(task key, method): seq of the last write superseding it}
+    later = {}
+    for entry in reversed(entries):
+        key = entry.task_key
+        if key is None:
+            continue
+        if (key, entry.method) in later:
+            replaced[entry.seq] = later[(key, entry.method)]
+            continue
+        for method in SUPERSEDES.get(entry.method, ()):
+            later.setdefault((key, method), entry.seq)
+    return replaced
+
+def compact(entries):
+    """entries without the writes a later write to the same task makes
+    redundant; order is kept."""
+
+    replaced = supersede(entries)
+    return [entry for entry in entries if entry.seq not in replaced]
+
+class FileJournal(object):
+    """Journal in an append-only file of JSON lines.
+
+    A write appends {"seq", "method", "params", "created"}, a sent one
+    {"done": seq}. compact() rewrites the file with the pending writes.
+
+    Pending writes are also kept in memory, so one process at a time may
+    use the file; SQLiteJournal can be shared by worker processes.
+
+    Args:
+        path - journal file.
+        fsync - flush every append to disk before returning.
+    """
+
+    def __init__(self, path, fsync=True):
+        self.path = os.path.expanduser(path)
+        self.fsync = fsync
+        self._lock = threading.Lock()
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory, 0o700)
+        self._seq = 0
+        self._pending = self._load()
+        self._file = self._open()
+        if self._file.tell() and not self._ends_with_newline():
+            # Start after a line a crash cut short.
+            self._file.write('\n')
+
+    def _open(self):
+        return os.fdopen(os.open(self.path,
+            os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600), 'a')
+
+    def _ends_with_newline(self):
+        with open(self.path, 'rb') as f:
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) == b'\n'
+
+    def _load(self):
+        pending = {}
+        try:
+            f = open(self.path)
+        except (IOError, OSError):
+            return pending
+        with f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # A line cut short by a crash during append.
+                    continue
+                if 'done' in record:
+                    pending.pop(record['done'], None)
+                else:
+                    # seq keeps growing even when every entry was sent.
+                    self._seq = max(self._seq, record['seq'])
+                    pending[record['seq']] = JournalEntry(record['seq'],
+                            record['method'], record['params'],
+                            record.get('created'))
+        return pending
+
+    def _write(self, record):
+        self._file.write(json.dumps(record, sort_keys=True) + '\n')
+        self._file.flush()
+        if self.fsync:
+            os.fsync(self._file.fileno())
+
+    def append(self, method, params):
+        with self._lock:
+            self._seq += 1
+            entry = JournalEntry(self._seq, method, params, time.time())
+            self._write({'seq': entry.seq, 'method': method,
+                'params': params, 'created': entry.created})
+            self._pending[entry.seq] = entry
+        return entry
+
+    def pending(self):
+        """Unsent entries in order."""
+
+        with self._lock:
+            return [self._pending[seq] for seq in sorted(self._pending)]
+
+    def remove(self, entries):
+        with self._lock:
+            for entry in entries:
+                if self._pending.pop(entry.seq, None) is not None:
+                    self._write({'done': entry.seq})
+
+    def __len__(self):
+        return len(self._pending)
+
+    def compact(self):
+        """Rewrite the file with only the pending entries."""
+
+        def write(f):
+            for seq in sorted(self._pending):
+                entry = self._pending[seq]
+                f.write(json.dumps({'seq': seq, 'method': entry.method,
+                    'params': entry.params, 'created': entry.created},
+                    sort_keys=True) + '\n')
+
+        with self._lock:
+            replace_file(self.path, write, fsync=True)
+            self._file.close()
+            self._file = self._open()
+
+    def close(self):
+        self._file.close()
+
+class SQLiteJournal(object):
+    """Journal in an SQLite table; sent entries are deleted."""
+
+    def __init__(self, path):
+        import sqlite3
+
+        self.path = os.path.expanduser(path)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self.path, check_same_thread=False,
+                isolation_level=None)
+        self._db.execute('CREATE TABLE IF NOT EXISTS journal ('
+                'seq INTEGER PRIMARY KEY AUTOINCREMENT, method TEXT, '
+                'params TEXT, created REAL)')
+
+    def append(self, method, params):
+        created = time.time()
+        with self._lock:
+            seq = self._db.execute('INSERT INTO journal '
+                    '(method, params, created) VALUES (?, ?, ?)',
+                    (method, json.dumps(params, sort_keys=True),
+                        created)).lastrowid
+        return JournalEntry(seq, method, params, created)
+
+    def pending(self):
+        with self._lock:
+            rows = self._db.execute('SELECT seq, method, params, created '
+                    'FROM journal ORDER BY seq').fetchall()
+        return [JournalEntry(seq, method, json.loads(params), created)
+                for (seq, method, params, created) in rows]
+
+    def remove(self, entries):
+        with self._lock:
+            self._db.executemany('DELETE FROM journal WHERE seq = ?',
+                    [(entry.seq, ) for entry in entries])
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute('SELECT COUNT(*) FROM journal') \
+                    .fetchone()[0]
+
+    def compact(self):
+        with self._lock:
+            self._db.execute('VACUUM')
+
+    def close(self):
+        self._db.close()
+
+class ReplayResult(object):
+    """Outcome of one replay.
+
+    sent - [(entry, result)] of the writes RTM accepted.
+    failed - [(entry, MilkyError)] of the writes RTM rejected; they are
+        dropped from the journal.
+    dropped - entries left out by compaction, once RTM accepted the
+        write replacing them.
+    pending - writes still journaled (RTM was unreachable).
+    """
+
+    def __init__(self):
+        self.sent = []
+        self.failed = []
+        self.dropped = []
+        self.pending = 0
+
+    def __repr__(self):
+        return '<ReplayResult - sent=%d, failed=%d, dropped=%d, ' \
+                'pending=%d>' % (len(self.sent), len(self.failed),
+                        len(self.dropped), self.pending)
+
+class _WriterPrefix(object):
+    def __init__(self, writer, prefix, methods):
+        self.writer = writer
+        self.prefix = prefix
+        self.methods = methods
+
+    def __getattr__(self, attr):
+        if attr not in self.methods:
+            raise AttributeError('No such attribute %s' % attr)
+        return lambda **params: self.writer.submit(self.prefix, attr, params)
+
+class OfflineWriter(object):
+    """Timeline writes journaled first and sent by replay().
+
+    Args:
+        api - API instance sending the writes.
+        journal - FileJournal, SQLiteJournal or an object with append,
+            pending, remove and __len__ like them; its compact(), if any,
+            is called after a replay that reached RTM.
+        retry_codes - MilkyError codes that mean RTM is unreachable: the
+            replay stops and keeps the write. Other errors drop it.
+        interval - seconds between background replays while RTM is
+            unreachable.
+    """
+
+    def __init__(self, api, journal, retry_codes=RETRYABLE_CODES,
+            interval=DEFAULT_REPLAY_INTERVAL):
+        self.api = api
+        self.journal = journal
+        self.retry_codes = frozenset(retry_codes)
+        self.interval = interval
+        self._replay_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._stopping = False
+
+    def __getattr__(self, prefix):
+        methods = request.METHODS.get(prefix)
+        if methods is None:
+            raise AttributeError('No such attribute %s' % prefix)
+        return _WriterPrefix(self, prefix, dict(
+            (name, spec) for (name, spec) in methods.items()
+            if 'timeline' in spec[1]))
+
+    def __len__(self):
+        return len(self.journal)
+
+    def submit(self, prefix, attr, params):
+        """Journal METHODS[prefix][attr] with the params dict; return its
+        JournalEntry."""
+
+        auth_required, required_args, optional_args, model_cls = \
+                request.METHODS[prefix][attr]
+        if 'timeline' not in required_args:
+            raise TypeError('%s.%s is not a timeline write' % (prefix, attr))
+        for required_arg in required_args:
+            if required_arg != 'timeline' and required_arg not in params:
+                raise TypeError('Missing required parameter %s' % required_arg)
+
+        entry = self.journal.append(request.method_name(prefix, attr),
+                dict((k, '%s' % v) for (k, v) in params.items()
+                    if v is not None))
+        self._wake.set()
+        return entry
+
+    def _spec(self, method):
+        prefix, name = method[len('rtm.'):].rsplit('.', 1)
+        return request.METHODS[prefix.replace('.', '')][name]
+
+    def _plan(self):
+        """(entries to send, {seq: entries the write replaces})."""
+
+        entries = self.journal.pending()
+        replaced = supersede(entries)
+        keep = []
+        replaces = {}
+        for entry in entries:
+            if entry.seq in replaced:
+                replaces.setdefault(replaced[entry.seq], []).append(entry)
+            else:
+                keep.append(entry)
+        return keep, replaces
+
+    def _unreachable(self, error):
+        return isinstance(error, MilkyError) and error.no in self.retry_codes
+
+    def _settle(self, result, entry, replaces, value, error=None):
+        """Record the outcome of sending entry; return False when RTM is
+        unreachable and the replay stops."""
+
+        if error is None:
+            dropped = replaces.get(entry.seq, [])
+            result.sent.append((entry, value))
+            result.dropped.extend(dropped)
+            self.journal.remove([entry] + dropped)
+        elif self._unreachable(error):
+            return False
+        else:
+            logging.warn('Dropping journaled %s: %s' % (entry.method, error))
+            result.failed.append((entry, error))
+            self.journal.remove([entry])
+        return True
+
+    def _finish(self, result, reachable):
+        if not reachable:
+            result.pending = len(self.journal)
+        elif result.sent or result.failed:
+            compact = getattr(self.journal, 'compact', None)
+            if compact is not None:
+                compact()
+        return result
+
+    def _request(self, entry, timeline):
+        """(method, auth_required, model_cls, params) of an entry."""
+
+        auth_required, required_args, optional_args, model_cls = \
+                self._spec(entry.method)
+        params = dict(entry.params)
+        params['timeline'] = timeline
+        return entry.method, auth_required, model_cls, params
+
+    def replay(self):
+        """Send the journaled writes in order; return a ReplayResult.
+
+        Stops at the first write that fails with one of retry_codes and
+        leaves it and the rest in the journal.
+        """
+
+        with self._replay_lock:
+            result = ReplayResult()
+            timeline = None
+            # Another pass sends the writes a rejected one replaced.
+            again = True
+            while again:
+                keep, replaces = self._plan()
+                if not keep:
+                    break
+                if timeline is None:
+                    try:
+                        timeline = self.api.timelines.create()
+                    except MilkyError as e:
+                        if not self._unreachable(e):
+                            raise
+                        return self._finish(result, False)
+
+                again = False
+                for entry in keep:
+                    try:
+                        value = self.api._get(
+                                *self._request(entry, timeline))[0]
+                    except MilkyError as e:
+                        if not self._settle(result, entry, replaces, None, e):
+                            return self._finish(result, False)
+                        again = again or entry.seq in replaces
+                    else:
+                        self._settle(result, entry, replaces, value)
+            return self._finish(result, True)
+
+    async def replay_async(self):
+        """replay() for AsyncAPI."""
+
+        if not self._replay_lock.acquire(blocking=False):
+            # Wait for the replay of another thread off the event loop.
+            acquire = asyncio.get_running_loop().run_in_executor(None,
+                    self._replay_lock.acquire)
+            try:
+                await asyncio.shield(acquire)
+            except asyncio.CancelledError:
+                acquire.add_done_callback(
+                        lambda f: self._replay_lock.release())
+                raise
+        try:
+            result = ReplayResult()
+            timeline = None
+            again = True
+            while again:
+                keep, replaces = self._plan()
+                if not keep:
+                    break
+                if timeline is None:
+                    try:
+                        timeline = await self.api.timelines.create()
+                    except MilkyError as e:
+                        if not self._unreachable(e):
+                            raise
+                        return self._finish(result, False)
+
+                again = False
+                for entry in keep:
+                    try:
+                        value = (await self.api._get(
+                            *self._request(entry, timeline)))[0]
+                    except MilkyError as e:
+                        if not self._settle(result, entry, replaces, None, e):
+                            return self._finish(result, False)
+                        again = again or entry.seq in replaces
+                    else:
+                        self._settle(result, entry, replaces, value)
+            return self._finish(result, True)
+        finally:
+            self._replay_lock.release()
+
+    def start(self):
+        """Replay in a background thread: right after every submit, and
+        every interval seconds while writes are pending."""
+
+        if self._thread is not None:
+            return
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run,
+                name='milky-journal', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stopping:
+            self._wake.clear()
+            try:
+                result = self.replay()
+            except Exception:
+                logging.exception('Journal replay failed')
+                result = None
+            if result is not None and not result.pending \
+                    and not len(self.journal):
+                self._wake.wait()
+            else:
+                self._wake.wait(self.interval)
+
+    def stop(self, timeout=None):
+        """Stop the background thread after its current replay."""
+
+        if self._thread is None:
+            return
+        self._stopping = True
+        self._wake.set()
+        self._thread.join(timeout)
+        self._thread = None
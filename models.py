@@ -2,23 +2,228 @@
 
 import re
 import datetime
+from collections import namedtuple
+
+from milky.recurrence import parse_rule
 
 class ResultSet(list):
     """A list like object that holds results from a RTM API query."""
 
+class _LazyRegex(object):
+    """A pattern compiled on its first search()."""
+
+    def __init__(self, pattern, flags=0):
+        self.pattern = pattern
+        self.flags = flags
+
+    def search(self, string):
+        # The compiled pattern's method shadows this one from now on.
+        self.search = re.compile(self.pattern, self.flags).search
+        return self.search(string)
+
+# Field converters for the model schemas.
+
+def _identity(v):
+    return v
+
+def _or_none(v):
+    return v or None
+
+def _bool(v):
+    return v == u'1'
+
+def _int_or_none(v):
+    return v and int(v) or None
+
+def _float_or_none(v):
+    return v and float(v) or None
+
+_fromisoformat = getattr(datetime.datetime, 'fromisoformat', None)
+
+def _timestamp(v):
+    """Parse a '%Y-%m-%dT%H:%M:%SZ' timestamp, '' is None."""
+
+    if not v:
+        return None
+    if _fromisoformat and len(v) == 20 and v[10] == u'T' and v[19] == u'Z':
+        return _fromisoformat(v[:19])
+    return datetime.datetime.strptime(v, '%Y-%m-%dT%H:%M:%SZ')
+
+class _Unset(object):
+    """Value of an unset slot in pickled models."""
+
+    def __reduce__(self):
+        return '_UNSET'
+
+_UNSET = _Unset()
+
+def _restore(cls, names, values, extra):
+    """Unpickle a model pickled by ModelBase.__reduce_ex__.
+
+    values are those of the fields names. A field the class no longer
+    has goes to _extra; a new one stays unset.
+    """
+
+    obj = cls.__new__(cls)
+    object.__setattr__(obj, '_extra', extra)
+    for slot, name, value in zip(cls._slots_of(names), names, values):
+        if value is _UNSET:
+            continue
+        if slot is None:
+            obj.__setattr__(name, value)
+        else:
+            slot.__set__(obj, value)
+    return obj
+
 class ModelBase(object):
-    """Base model class"""
+    """Base model class
+
+    Models declare the fields RTM sends in __slots__, so instances carry
+    no per-instance __dict__. Other attributes (keys RTM adds later, or
+    set by callers) go to the _extra dict and read like normal attributes.
+    """
+
+    __slots__ = ('_extra', )
+
+    # {json key: converter or (attribute, converter)}, compiled once per
+    # class by _compile(). Keys without an entry are kept as is, '' as None.
+    _schema = {}
 
     def __init__(self):
         """Setup default datas."""
-        pass
+        self._extra = None
+
+    def __setattr__(self, name, value):
+        try:
+            object.__setattr__(self, name, value)
+        except AttributeError:
+            if self._extra is None:
+                object.__setattr__(self, '_extra', {})
+            self._extra[name] = value
+
+    def __getattr__(self, name):
+        # Only called when the slot is unset or the name is not a slot.
+        if name != '_extra':
+            extra = self._extra
+            if extra and name in extra:
+                return extra[name]
+        raise AttributeError(name)
+
+    def __delattr__(self, name):
+        try:
+            object.__delattr__(self, name)
+        except AttributeError:
+            if not self._extra or name not in self._extra:
+                raise
+            del self._extra[name]
+
+    def __dir__(self):
+        names = set(super(ModelBase, self).__dir__())
+        names.update(self._extra or ())
+        return sorted(names)
 
     def __repr__(self):
         return u'<%s - %s>' % (self.__class__.__name__, 
-                u', '.join([c for c in dir(self) if not c.startswith(u'_')]))
+                u', '.join(sorted(k for k in self.__getstate__()
+                    if not k.startswith(u'_'))))
+
+    @classmethod
+    def _slots(cls):
+        """[(name, slot descriptor)] of every field of the class."""
+
+        slots = cls.__dict__.get('_slot_descriptors')
+        if slots is None:
+            slots = []
+            for base in reversed(cls.__mro__):
+                for name in base.__dict__.get('__slots__', ()):
+                    if name != '_extra':
+                        slots.append((name, base.__dict__[name]))
+            cls._slot_names = tuple(name for (name, slot) in slots)
+            cls._slot_descriptors = slots
+        return slots
+
+    @classmethod
+    def _slots_of(cls, names):
+        """Slot descriptors of the field names, None where the class has
+        no such field."""
+
+        # Unpickling gives every model of a class in one pickle the same
+        # names tuple: map it once.
+        last = cls.__dict__.get('_last_names')
+        if last is None or last[0] is not names:
+            slots = dict(cls._slots())
+            last = (names, [slots.get(name) for name in names])
+            cls._last_names = last
+        return last[1]
 
     def __getstate__(self):
-        return dict(self.__dict__)
+        state = {}
+        for name, slot in self._slots():
+            try:
+                state[name] = slot.__get__(self)
+            except AttributeError:
+                pass
+        if self._extra:
+            state.update(self._extra)
+        return state
+
+    def __setstate__(self, state):
+        object.__setattr__(self, '_extra', None)
+        slots = dict(self._slots())
+        for name, value in state.items():
+            if name in slots:
+                slots[name].__set__(self, value)
+            else:
+                setattr(self, name, value)
+
+    def __reduce_ex__(self, protocol):
+        # Slot values in _slots() order: smaller than the state dict and
+        # restored without __setattr__, which matters when a process pool
+        # sends back thousands of models. The field names go along so a
+        # pickle made before fields changed is still read by name; as
+        # one tuple per class, pickle writes them once per dump.
+        values = []
+        for name, slot in self._slots():
+            try:
+                values.append(slot.__get__(self))
+            except AttributeError:
+                values.append(_UNSET)
+        return _restore, (self.__class__, self._slot_names, tuple(values),
+                self._extra)
+
+    @classmethod
+    def _compile(cls):
+        """Build {key: (setter, converter)} from the schema once per class."""
+
+        table = {}
+        for name, slot in cls._slots():
+            if not name.startswith(u'_'):
+                table[name] = (slot.__set__, _or_none)
+        for key, entry in cls._schema.items():
+            if type(entry) is tuple:
+                attr, converter = entry
+            else:
+                attr, converter = key, entry
+            setter = getattr(getattr(cls, attr, None), '__set__', None)
+            if setter is None:
+                setter = lambda obj, v, attr=attr: setattr(obj, attr, v)
+            table[key] = (setter, converter)
+        cls._table = table
+        return table
+
+    @classmethod
+    def _build(cls, json):
+        """Create an instance from a JSON object with the compiled schema."""
+
+        obj = cls()
+        table = cls.__dict__.get('_table') or cls._compile()
+        for k, v in json.items():
+            entry = table.get(k)
+            if entry is None:
+                setattr(obj, k, v or None)
+            else:
+                entry[0](obj, entry[1](v))
+        return obj
 
     @classmethod
     def _parse(cls, json):
@@ -36,11 +241,15 @@ class ModelBase(object):
         return ResultSet(cls._parse(obj) for obj in json_list if obj)
 
 class Frob(ModelBase):
+    __slots__ = ()
+
     @classmethod
     def _parse(cls, json):
         return json[u'frob']
 
 class Stat(ModelBase):
+    __slots__ = ()
+
     @classmethod
     def _parse(cls, json):
         if json[u'stat'] == u'ok':
@@ -48,68 +257,72 @@ class Stat(ModelBase):
         return False
 
 class Timeline(ModelBase):
+    __slots__ = ()
+
     @classmethod
     def _parse(cls, json):
         return json[u'timeline']
 
 class User(ModelBase):
+    __slots__ = ('id', 'username', 'fullname', )
+
+    _schema = {u'id': int, }
+
     @classmethod
     def _parse(cls, json):
-        user = cls()
-        for k, v in json[u'user'].items():
-            if k in [u'id', ]:
-                setattr(user, k, int(v))
-            else:
-                setattr(user, k, v and v or None)
-        return user
+        return cls._build(json[u'user'])
 
 class Auth(ModelBase):
+    __slots__ = ('token', 'perms', 'user', )
+
+    _schema = {u'user': lambda v: User._build(v), }
+
     @classmethod
     def _parse(cls, json):
-        auth = cls()
-        for k, v in json[u'auth'].items():
-            if k == u'user':
-                user = User._parse(json[u'auth'])
-                setattr(auth, k, user)
-            else:
-                setattr(auth, k, v and v or None)
-        return auth
+        return cls._build(json[u'auth'])
 
 class List(ModelBase):
+    __slots__ = ('id', 'name', 'deleted', 'locked', 'archived', 'position',
+            'smart', 'sort_order', 'filter', )
+
+    _schema = {
+        u'locked': _bool,
+        u'archived': _bool,
+        u'deleted': _bool,
+        u'smart': _bool,
+        u'id': int,
+        u'sort_order': int,
+        u'position': int, }
+
     @classmethod
     def _parse(cls, json):
 
         # for rtm.lists.add, archive, delete, setName, unarchive
-        if list in json:
-            json = json['list']
+        if u'list' in json:
+            json = json[u'list']
 
-        _list = cls()
-        for k, v in json.items():
-            if k in [u'locked', u'archived', u'deleted', u'smart', ]:
-                setattr(_list, k, v==u'1' and True or False)
-            elif k in [u'id', u'sort_order', u'position', ]:
-                setattr(_list, k, int(v))
-            else:
-                setattr(_list, k, v and v or None)
-        return _list
+        return cls._build(json)
 
 class Lists(ModelBase):
+    __slots__ = ()
+
     @classmethod
     def _parse(cls, json):
         if not json['lists'] or not json['lists']['list']:
             return ResultSet()
         return List._parse_list(json['lists']['list'])
 
-# For task recurrences
-RE_FREQ = re.compile(r"FREQ=(?P<freq>[a-z]+)", re.I)
-RE_INTERVAL = re.compile(r"INTERVAL=(?P<interval>[\d]+)", re.I)
-RE_WEEKLY_BYDAY = re.compile(r"BYDAY=(?P<byday>[a-z,]+)", re.I)
-RE_MONTHLY_BYDAY = re.compile(r"BYDAY=(?P<byday>[-\w]+)", re.I)
-RE_BYMONTHDAY = re.compile(r"BYMONTHDAY=(?P<bymonthday>[\d]+)", re.I)
-RE_UNTIL = re.compile(r"UNTIL=(?P<until>[\w]+)", re.I)
-RE_COUNT = re.compile(r"COUNT=(?P<count>[\d]+)", re.I)
-
 class Recurrence(ModelBase):
+    """Recurrence of a task series.
+
+    byday is a list ('MO', 'WE' or '2TU'); rule is the compiled
+    recurrence.Rule, shared by every series with the same rrule, for
+    occurrences().
+    """
+
+    __slots__ = ('freq', 'interval', 'byday', 'bymonthday', 'until', 'count',
+            'every', 'rule', )
+
     def __init__(self):
         super(Recurrence, self).__init__()
         self.freq = None
@@ -118,115 +331,140 @@ class Recurrence(ModelBase):
         self.bymonthday = None
         self.until = None
         self.count = None
+        self.rule = None
 
     @classmethod
     def _parse(cls, json):
-        recurrence = cls()
+        # Fields go through __setstate__ (slot descriptors), the rule
+        # itself is compiled once per text.
+        recurrence = cls.__new__(cls)
+        state = dict(freq=None, interval=None, byday=None, bymonthday=None,
+                until=None, count=None, rule=None)
 
         for k, v in json.items():
             if k == u'$t':
-                m = RE_FREQ.search(v)
-                if m:
-                    recurrence.freq = m.group('freq').upper()
-
-                m = RE_INTERVAL.search(v)
-                if m:
-                    recurrence.interval = m.group('interval') and int(m.group('interval')) or None
-
-                m = RE_WEEKLY_BYDAY.search(v)
-                if m:
-                    recurrence.byday = m.group('byday').upper().split(u',')
-
-                m = RE_MONTHLY_BYDAY.search(v)
-                if m:
-                    recurrence.byday = m.group('byday').upper()
-
-                m = RE_BYMONTHDAY.search(v)
-                if m:
-                    recurrence.bymonthday = m.group('bymonthday') and int(m.group('bymonthday')) or None
-
-                m = RE_UNTIL.search(v)
-                if m:
-                    recurrence.until = m.group('until') and datetime.datetime.strptime(
-                            v.upper(), "%Y%m%dT%H%M%SZ")
-
-                m = RE_COUNT.search(v)
-                if m:
-                    recurrence.count = m.group('count') and int(m.group('count')) or None
+                rule = state['rule'] = parse_rule(v)
+                state['freq'] = rule.freq
+                state['interval'] = rule.interval or None
+                state['byday'] = rule.byday and list(rule.byday) or None
+                state['bymonthday'] = rule.bymonthday \
+                        and rule.bymonthday[0] or None
+                state['until'] = rule.until
+                state['count'] = rule.count or None
             elif k in [u'every', ]:
-                setattr(recurrence, k, v and int(v) or None)
+                state[k] = v and int(v) or None
             else:
-                setattr(recurrence, k, v)
+                state[k] = v
 
+        recurrence.__setstate__(state)
         return recurrence
 
+    def occurrences(self, start, after=None, before=None):
+        """Occurrences from start (the due date) on; see
+        recurrence.Rule.occurrences."""
+
+        if self.rule is None:
+            return iter(())
+        return self.rule.occurrences(start, after, before)
+
 # For task estimates
-RE_DAYS = re.compile(r"(?P<days>[\d.]+)\s*d", re.I)
-RE_HOURS = re.compile(r"(?P<hours>[\d.]+)\s*h", re.I)
-RE_MINUTES = re.compile(r"(?P<minutes>[\d.]+)\s*m", re.I)
+RE_DAYS = _LazyRegex(r"(?P<days>[\d.]+)\s*d", re.I)
+RE_HOURS = _LazyRegex(r"(?P<hours>[\d.]+)\s*h", re.I)
+RE_MINUTES = _LazyRegex(r"(?P<minutes>[\d.]+)\s*m", re.I)
+
+def _priority(v):
+    if v == u'N':
+        return None
+    return v and int(v) or None
+
+def _estimate(v):
+    if not v:
+        return None
+
+    days = 0.0
+    hours = 0.0
+    minutes = 0.0
+
+    m = RE_DAYS.search(v)
+    if m:
+        days = float(m.group('days'))
+    m = RE_HOURS.search(v)
+    if m:
+        hours = float(m.group('hours'))
+    m = RE_MINUTES.search(v)
+    if m:
+        minutes = float(m.group('minutes'))
+    if days or hours or minutes:
+        return datetime.timedelta(days=days, hours=hours, minutes=minutes)
+    return None
 
 class Task(ModelBase):
+    __slots__ = ('id', 'due', 'has_due_time', 'added', 'completed', 'deleted',
+            'priority', 'postponed', 'estimate', )
+
+    _schema = {
+        u'priority': _priority,
+        u'has_due_time': _bool,
+        u'added': _timestamp,
+        u'completed': _timestamp,
+        u'deleted': _timestamp,
+        u'due': _timestamp,
+        u'postponed': int,
+        u'estimate': _estimate, }
+
     @classmethod
     def _parse(cls, json):
-        task = cls()
+        return cls._build(json)
 
-        for k, v in json.items():
-            if k == u'priority':
-                if v == u'N':
-                    setattr(task, k, None)
-                else:
-                    setattr(task, k, v and int(v) or None)
-            elif k in [u'has_due_time', ]:
-                setattr(task, k, v==u'1' and True or False)
-            elif k in [u'added', u'completed', u'deleted', u'due']:
-                setattr(task, k, v and datetime.datetime.strptime(
-                    v, '%Y-%m-%dT%H:%M:%SZ') or None)
-            elif k in [u'postponed', ]:
-                setattr(task, k, int(v))
-            elif k in [u'estimate', ]:
-                estimate = None
-                if v:
-                    days = 0.0
-                    hours = 0.0
-                    minutes = 0.0
-
-                    m = RE_DAYS.search(v)
-                    if m:
-                        days = float(m.group('days'))
-                    m = RE_HOURS.search(v)
-                    if m:
-                        hours = float(m.group('hours'))
-                    m = RE_MINUTES.search(v)
-                    if m:
-                        minutes = float(m.group('minutes'))
-                    if days or hours or minutes:
-                        estimate = datetime.timedelta(days=days, hours=hours, minutes=minutes)
-
-                setattr(task, k, estimate)
-            else:
-                setattr(task, k, v and v or None)
+class Note(ModelBase):
+    __slots__ = ('id', 'created', 'modified', 'title', 'text', )
 
-        return task
+    _schema = {
+        u'$t': (u'text', _identity),
+        u'id': int, }
 
-class Note(ModelBase):
     @classmethod
     def _parse(cls, json):
-        note = cls()
 
         # for rtm.tasks.notes.add, edit
         if 'note' in json:
             json = json[u'note']
 
-        for k, v in json.items():
-            if k == u'$t':
-                setattr(note, u'text', v)
-            elif k in [u'id', ]:
-                setattr(note, k, int(v))
-            else:
-                setattr(note, k, v and v or None)
-        return note
+        return cls._build(json)
+
+def _parse_tags(v):
+    if v and 'tag' in v:
+        if type(v[u'tag']) is list:
+            return v[u'tag']
+        return ResultSet([v[u'tag'], ])
+    return ResultSet()
+
+def _parse_notes(v):
+    if v and 'note' in v:
+        return Note._parse_list(v[u'note'])
+    return ResultSet()
+
+def _parse_participants(v):
+    if v and 'contact' in v:
+        return Contact._parse_list(v[u'contact'])
+    return ResultSet()
 
 class TaskSeries(ModelBase):
+    # list_id is set by sync.Replica.
+    __slots__ = ('id', 'created', 'modified', 'name', 'source', 'url',
+            'location_id', 'tags', 'participants', 'notes', 'task', 'rrule',
+            'list_id', )
+
+    _schema = {
+        u'task': lambda v: Task._parse_list(v),
+        u'rrule': lambda v: Recurrence._parse(v),
+        u'tags': _parse_tags,
+        u'notes': _parse_notes,
+        u'participants': _parse_participants,
+        u'created': _timestamp,
+        u'modified': _timestamp,
+        u'location_id': _int_or_none, }
+
     def __init__(self):
         super(TaskSeries, self).__init__()
         self.task = ResultSet()
@@ -237,89 +475,113 @@ class TaskSeries(ModelBase):
 
     @classmethod
     def _parse(cls, json):
-        taskseries = cls()
-
-        for k, v in json.items():
-            if k == u'task':
-                taskseries.task = Task._parse_list(v)
-            elif k == u'rrule':
-                taskseries.rrule = Recurrence._parse(v)
-            elif k == u'tags':
-                if v and 'tag' in v:
-                    if type(v[u'tag']) is list:
-                        taskseries.tags = v[u'tag']
-                    else:
-                        taskseries.tags = ResultSet(v[u'tag'], )
-            elif k == u'notes':
-                if v and 'note' in v:
-                    taskseries.notes = Note._parse_list(v[u'note'])
-            elif k == u'participants':
-                if v and 'contact' in v:
-                    taskseries.participants = Contact._parse_list(v[u'contact'])
-            elif k in [u'created', u'modified', ]:
-                setattr(taskseries, k, v and datetime.datetime.strptime(
-                    v, '%Y-%m-%dT%H:%M:%SZ') or None)
-            elif k in [u'location_id', ]:
-                setattr(taskseries, k, v and int(v) or None)
-            else:
-                setattr(taskseries, k, v and v or None)
-        return taskseries
+        return cls._build(json)
+
+class _LazyAttribute(object):
+    """Parse the raw JSON kept in the _raw_<name> slot on first access and
+    store the result in the <name> slot of the parent class."""
+
+    def __init__(self, parse):
+        self.parse = parse
+
+    def __set_name__(self, owner, name):
+        self.slot = [base.__dict__[name] for base in owner.__mro__[1:]
+                if name in base.__dict__][0]
+        self.raw = owner.__dict__[u'_raw_%s' % name]
+
+    def __get__(self, obj, cls):
+        if obj is None:
+            return self
+        try:
+            raw = self.raw.__get__(obj, cls)
+        except AttributeError:
+            return self.slot.__get__(obj, cls)
+        self.raw.__delete__(obj)
+        value = self.parse(raw)
+        self.slot.__set__(obj, value)
+        return value
+
+    def __set__(self, obj, value):
+        try:
+            self.raw.__delete__(obj)
+        except AttributeError:
+            pass
+        self.slot.__set__(obj, value)
+
+class LazyTaskSeries(TaskSeries):
+    """TaskSeries that parses notes, participants and rrule only when
+    they are first accessed."""
+
+    __slots__ = ('_raw_notes', '_raw_participants', '_raw_rrule', )
+
+    notes = _LazyAttribute(_parse_notes)
+    participants = _LazyAttribute(_parse_participants)
+    rrule = _LazyAttribute(lambda v: v and Recurrence._parse(v) or None)
+
+    _schema = dict(TaskSeries._schema)
+    _schema.update({
+        u'notes': (u'_raw_notes', _identity),
+        u'participants': (u'_raw_participants', _identity),
+        u'rrule': (u'_raw_rrule', _identity), })
+
+TaskRecord = namedtuple('TaskRecord', ('list', 'taskseries', 'task', ))
 
 class TaskList(ModelBase):
+    __slots__ = ('id', 'taskseries', 'current', 'deleted', )
+
+    _schema = {
+        u'taskseries': lambda v: TaskSeries._parse_list(v),
+        u'id': int, }
+
     def __init__(self):
         super(TaskList, self).__init__()
         self.taskseries = ResultSet()
 
     @classmethod
     def _parse(cls, json):
-        _list = cls()
 
         # for rtm.tasks.add
         if 'list' in json:
             json = json['list']
 
-        for k, v in json.items():
-            if k == 'taskseries':
-                _list.taskseries = TaskSeries._parse_list(v)
-            elif k in ['id', ]:
-                setattr(_list, k, int(v))
-            else:
-                setattr(_list, k, v and v or None)
-        return _list
+        return cls._build(json)
+
+def _parse_task_lists(v):
+    # parallel.ParsePool hands in lists it has parsed already.
+    if isinstance(v, ResultSet):
+        return v
+    return TaskList._parse_list(v)
 
 class Tasks(ModelBase):
+    __slots__ = ('lists', 'rev', )
+
+    _schema = {u'list': (u'lists', _parse_task_lists), }
+
     def __init__(self):
         super(Tasks, self).__init__()
         self.lists = ResultSet()
 
     @classmethod
     def _parse(cls, json):
-        tasks = cls()
-
-        for k, v in json[u'tasks'].items():
-            if k == u'list':
-                tasks.lists = TaskList._parse_list(v)
-            else:
-                setattr(tasks, k, v and v or None)
-        return tasks
+        return cls._build(json[u'tasks'])
 
 class Contact(ModelBase):
+    __slots__ = ('id', 'fullname', 'username', )
+
+    _schema = {u'id': int, }
+
     @classmethod
     def _parse(cls, json):
-        contact = cls()
 
         # for rtm.contacts.delete
         if 'contact' in json:
             json = json[u'contact']
 
-        for k, v in json.items():
-            if k in [u'id', ]:
-                setattr(contact, k, int(v))
-            else:
-                setattr(contact, k, v and v or None)
-        return contact
+        return cls._build(json)
 
 class Contacts(ModelBase):
+    __slots__ = ()
+
     @classmethod
     def _parse(cls, json):
         if not json[u'contacts'] or not 'contact' in json[u'contacts']:
@@ -327,28 +589,28 @@ class Contacts(ModelBase):
         return Contact._parse_list(json[u'contacts'][u'contact']);
 
 class Group(ModelBase):
+    __slots__ = ('id', 'name', 'contacts', )
+
+    _schema = {
+        u'contacts': lambda v: Contacts._parse({u'contacts': v}),
+        u'id': int, }
+
     def __init__(self):
         super(Group, self).__init__()
         self.contacts = ResultSet()
 
     @classmethod
     def _parse(cls, json):
-        group = cls()
 
         # for rtm.group.delete
         if 'group' in json:
             json = json[u'group']
 
-        for k, v in json.items():
-            if k == u'contacts':
-                group.contacts = Contacts._parse(json)
-            elif k in [u'id', ]:
-                setattr(group, k, int(v))
-            else:
-                setattr(group, k, v and v or None)
-        return group
+        return cls._build(json)
 
 class Groups(ModelBase):
+    __slots__ = ()
+
     @classmethod
     def _parse(cls, json):
         if not json[u'groups'] or not 'group' in json[u'groups']:
@@ -356,32 +618,48 @@ class Groups(ModelBase):
         return Group._parse_list(json[u'groups'][u'group']);
 
 class Argument(ModelBase):
+    __slots__ = ('name', 'optional', 'description', )
+
+    _schema = {
+        u'$t': (u'description', _identity),
+        u'optional': _bool, }
+
     @classmethod
     def _parse(cls, json):
-        argument = cls()
-        for k, v in json.items():
-            if k == u'$t':
-                setattr(argument, u'description', v)
-            elif k in [u'optional', ]:
-                setattr(argument, k, v==u'1' and True or False)
-            else:
-                setattr(argument, k, v and v or None)
-        return argument
+        return cls._build(json)
 
 class Error(ModelBase):
+    __slots__ = ('code', 'message', 'description', )
+
+    _schema = {
+        u'$t': (u'description', _or_none),
+        u'code': int, }
+
     @classmethod
     def _parse(cls, json):
-        error = cls()
-        for k, v in json.items():
-            if k == u'$t':
-                setattr(error, u'description', v and v or None)
-            elif k in [u'code', ]:
-                setattr(error, k, int(v))
-            else:
-                setattr(error, k, v and v or None)
-        return error
+        return cls._build(json)
+
+def _parse_arguments(v):
+    if 'argument' in v:
+        return Argument._parse_list(v[u'argument'])
+    return v or None
+
+def _parse_errors(v):
+    if 'error' in v:
+        return Error._parse_list(v[u'error'])
+    return v or None
 
 class Method(ModelBase):
+    __slots__ = ('name', 'needslogin', 'needssigning', 'requiredperms',
+            'description', 'response', 'arguments', 'errors', )
+
+    _schema = {
+        u'arguments': _parse_arguments,
+        u'errors': _parse_errors,
+        u'needslogin': _bool,
+        u'needssigning': _bool,
+        u'requiredperms': _bool, }
+
     def __init__(self):
         super(Method, self).__init__()
         self.arguments = ResultSet()
@@ -389,67 +667,62 @@ class Method(ModelBase):
 
     @classmethod
     def _parse(cls, json):
-        method = cls()
-
-        for k, v in json[u'method'].items():
-            if k == u'arguments' and 'argument' in v:
-                method.arguments = Argument._parse_list(v[u'argument'])
-            elif k == u'errors' and 'error' in v:
-                method.errors = Error._parse_list(v[u'error'])
-            elif k in [u'needslogin', u'needssigning', u'requiredperms', ]:
-                setattr(method, k, v==u'1' and True or False)
-            else:
-                setattr(method, k, v and v or None)
-        return method
+        return cls._build(json[u'method'])
 
 class Methods(ModelBase):
+    __slots__ = ()
+
     @classmethod
     def _parse(cls, json):
         return json[u'methods'][u'method']
 
 class Timezone(ModelBase):
+    __slots__ = ('id', 'name', 'dst', 'offset', 'current_offset', )
+
+    _schema = {
+        u'id': int,
+        u'dst': int,
+        u'offset': int,
+        u'current_offset': int, }
+
     @classmethod
     def _parse(cls, json):
-        timezone = cls()
-        for k, v in json.items():
-            if k in [u'id', u'dst', u'offset', u'current_offset',]:
-                setattr(timezone, k, int(v))
-            else:
-                setattr(timezone, k, v and v or None)
-        return timezone
+        return cls._build(json)
 
 class Timezones(ModelBase):
+    __slots__ = ()
+
     @classmethod
     def _parse(cls, json):
         return Timezone._parse_list(json[u'timezones'][u'timezone']);
 
 class Time(ModelBase):
+    __slots__ = ('time', 'timezone', )
+
+    _schema = {u'$t': (u'time', _or_none), }
+
     @classmethod
     def _parse(cls, json):
-        time = cls()
-        for k, v in json[u'time'].items():
-            if k == u'$t':
-                setattr(time, u'time', v and v or None)
-            else:
-                setattr(time, k, v and v or None)
-        return time
+        return cls._build(json[u'time'])
 
 class Location(ModelBase):
+    __slots__ = ('id', 'name', 'longitude', 'latitude', 'zoom', 'address',
+            'viewable', )
+
+    _schema = {
+        u'viewable': _bool,
+        u'id': int,
+        u'zoom': int,
+        u'longitude': _float_or_none,
+        u'latitude': _float_or_none, }
+
     @classmethod
     def _parse(cls, json):
-        location = cls()
-        for k, v in json.items():
-            if k in [u'viewable', ]:
-                setattr(location, k, v==u'1' and True or False)
-            elif k in [u'id', u'zoom', ]:
-                setattr(location, k, int(v))
-            elif k in [u'longitude', u'latitude', ]:
-                setattr(location, k, v and float(v) or None)
-            else:
-                setattr(location, k, v and v or None)
-        return location
+        return cls._build(json)
 
 class Locations(ModelBase):
+    __slots__ = ()
+
     @classmethod
     def _parse(cls, json):
         if not json[u'locations'] or not 'location' in json['locations']:
@@ -457,13 +730,14 @@ class Locations(ModelBase):
         return Location._parse_list(json[u'locations'][u'location'])
 
 class Settings(ModelBase):
+    __slots__ = ('timezone', 'dateformat', 'timeformat', 'defaultlist',
+            'language', )
+
+    _schema = {
+        u'defaultlist': int,
+        u'dateformat': int,
+        u'timeformat': int, }
+
     @classmethod
     def _parse(cls, json):
-        settings = cls()
-        for k, v in json[u'settings'].items():
-            if k in [u'defaultlist', u'dateformat', u'timeformat', ]:
-                setattr(settings, k, int(v))
-            else:
-                setattr(settings, k, v and v or None)
-        return settings
-
+        return cls._build(json[u'settings'])
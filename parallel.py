@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+
+"""Decoding and parsing of large tasks.getList responses in worker
+processes.
+
+    rtm = API(api_key, shared_secret, token=token, parse_pool=ParsePool())
+
+Decoding and parsing a response of many megabytes is pure Python and
+holds the GIL, so threads syncing several accounts take turns on one
+core. A ParsePool hands the responses above threshold bytes to a process
+pool. The calling thread splits the task lists out of the body with
+stream.ArraySplitter and sends runs of them to up to max_shares workers;
+each decodes and parses only its own lists, and the TaskList models come
+back pickled. Splitting and unpickling cost the calling thread a
+fraction of decoding and parsing the response itself.
+"""
+
+import json
+import multiprocessing
+import threading
+
+from milky.models import ResultSet, TaskList
+from milky.stream import split_array, TASKS_LIST_PATH
+
+# Responses from this size on are parsed in the pool (bytes)
+PARSE_THRESHOLD = 1024 * 1024
+# Body bytes per worker when a response is split
+SHARE_SIZE = 4 * 1024 * 1024
+
+# Methods whose responses the pool parses
+POOL_METHODS = ('rtm.tasks.getList', )
+
+def _parse_lists(texts):
+    """Worker: [TaskList] of the JSON texts of task lists."""
+
+    return [TaskList._parse(obj) for obj in map(json.loads, texts) if obj]
+
+def _runs(texts, shares):
+    """texts in up to shares runs of about the same length, in order."""
+
+    total = sum(len(text) for text in texts)
+    runs = [[]]
+    size = 0
+    for text in texts:
+        if runs[-1] and size >= total * len(runs) / shares:
+            runs.append([])
+        runs[-1].append(text)
+        size += len(text)
+    return runs
+
+def _context():
+    """Multiprocessing context of the pool: workers that do not inherit
+    the threads and locks of the calling process, as fork would."""
+
+    if 'forkserver' in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context('forkserver')
+    return multiprocessing.get_context('spawn')
+
+class ParsePool(object):
+    """A process pool decoding and parsing large responses.
+
+    Args:
+        max_workers - processes (Default: one per CPU)
+        threshold - smallest body in bytes parsed in the pool.
+        share_size - body bytes per worker; a response goes to
+            len(body) // share_size workers, at least 1 and at most
+            max_shares. A task list is never split.
+        max_shares - most workers one response is split across
+            (Default: max_workers or 4)
+        mp_context - multiprocessing context of the pool (Default:
+            forkserver, or spawn where it is missing)
+
+    Share one pool between the API instances of a process; close() it
+    on shutdown.
+    """
+
+    def __init__(self, max_workers=None, threshold=PARSE_THRESHOLD,
+            share_size=SHARE_SIZE, max_shares=None, mp_context=None):
+        self.max_workers = max_workers
+        self.threshold = threshold
+        self.share_size = share_size
+        self.max_shares = max_shares or max_workers or 4
+        self.mp_context = mp_context
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def accepts(self, method, body):
+        """Whether a response of method should be parsed in the pool."""
+
+        return method in POOL_METHODS and len(body) >= self.threshold
+
+    def _submit(self, lists, shares):
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    from concurrent.futures import ProcessPoolExecutor
+                    self._executor = ProcessPoolExecutor(
+                            max_workers=self.max_workers,
+                            mp_context=self.mp_context or _context())
+        return [self._executor.submit(_parse_lists, texts)
+                for texts in _runs(lists, shares)]
+
+    def _split(self, body):
+        """(rsp without the task lists, [JSON text of each list])."""
+
+        if isinstance(body, bytes):
+            body = body.decode('utf-8')
+        skeleton, lists = split_array(body, TASKS_LIST_PATH)
+        return json.loads(skeleton)['rsp'], lists
+
+    def _shares(self, body):
+        return max(1, min(self.max_shares, len(body) // self.share_size))
+
+    def parse(self, body):
+        """rsp of a response body with its task lists parsed: a
+        ResultSet of TaskList in place of the list JSON.
+
+        Raises ValueError if the body is not JSON.
+        """
+
+        rsp, lists = self._split(body)
+        if lists and rsp.get('stat') == 'ok':
+            rsp['tasks']['list'] = ResultSet(parsed
+                    for future in self._submit(lists, self._shares(body))
+                    for parsed in future.result())
+        return rsp
+
+    async def parse_async(self, body):
+        """parse() for coroutines."""
+
+        import asyncio
+
+        # Splitting holds the GIL, but leaves the event loop running.
+        rsp, lists = await asyncio.get_running_loop().run_in_executor(None,
+                self._split, body)
+        if lists and rsp.get('stat') == 'ok':
+            results = await asyncio.gather(*[asyncio.wrap_future(future)
+                for future in self._submit(lists, self._shares(body))])
+            rsp['tasks']['list'] = ResultSet(parsed
+                    for result in results for parsed in result)
+        return rsp
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
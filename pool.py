@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+
+import threading
+from collections import namedtuple
+
+from milky.api import API, PERMS_READ
+from milky.ratelimit import Scheduler
+
+DEFAULT_FAN_OUT_WORKERS = 8
+
+# Outcome of a fan-out call for one user: error is the exception fn
+# raised (a MilkyError for RTM failures) or None.
+FanOutResult = namedtuple('FanOutResult', ('user', 'result', 'error', ))
+
+class ClientPool(object):
+    """API instances of many RTM users on one API key.
+
+        pool = ClientPool(api_key, shared_secret, perms=PERMS_WRITE)
+        pool.add('alice', token_of_alice)
+        tasks = pool['alice'].tasks.getList()
+
+        for user, lists, error in pool.fan_out(
+                lambda rtm: rtm.lists.getList()):
+            ...
+
+    The clients share one transport (keep-alive connections), one
+    scheduler, and the response cache and retry policy if given. Tokens
+    and frobs stay per client; cached responses are keyed by the auth
+    token, so users never see each other's results.
+
+    Args:
+        api_key, shared_secret, perms - as for API.
+        transport - shared transport (Default: one api_cls creates)
+        scheduler - shared ratelimit.Scheduler (Default: a new one for
+            the pool; pass ratelimit.shared_scheduler() to share it with
+            other API instances of the key)
+        cache, retry - shared ResponseCache and RetryPolicy (Optional)
+        max_workers - threads of fan_out().
+        api_cls - API or AsyncAPI.
+        Other keyword arguments are passed to every api_cls.
+    """
+
+    def __init__(self, api_key, shared_secret, perms=PERMS_READ,
+            transport=None, scheduler=None, cache=None, retry=None,
+            max_workers=DEFAULT_FAN_OUT_WORKERS, api_cls=API, **kwargs):
+        self.api_key = api_key
+        self.shared_secret = shared_secret
+        self.perms = perms
+        self.max_workers = max_workers
+        self.api_cls = api_cls
+        if scheduler is None:
+            scheduler = Scheduler()
+        self.scheduler = scheduler
+        self.cache = cache
+        self.retry = retry
+        self.kwargs = kwargs
+        self.transport = transport
+        self._clients = {}
+        self._lock = threading.Lock()
+
+    def _create(self, user, token):
+        client = self.api_cls(self.api_key, self.shared_secret,
+                perms=self.perms, token=token, user=user,
+                transport=self.transport,
+                scheduler=self.scheduler, cache=self.cache, retry=self.retry,
+                **self.kwargs)
+        if self.transport is None:
+            # The first client's default transport is everybody's.
+            self.transport = client.transport
+        return client
+
+    def add(self, user, token=None):
+        """Register user with its auth token; return its client.
+
+        Without a token the client uses the one stored for user in
+        credentials (if the pool has credentials=), or goes through the
+        frob flow (get_auth_url(), then get_token()) on its own.
+        """
+
+        with self._lock:
+            client = self._clients.get(user)
+            if client is None:
+                client = self._clients[user] = self._create(user, token)
+            elif token is not None:
+                client.token = token
+        return client
+
+    def remove(self, user):
+        with self._lock:
+            self._clients.pop(user, None)
+
+    def client(self, user):
+        return self._clients[user]
+
+    __getitem__ = client
+
+    def __contains__(self, user):
+        return user in self._clients
+
+    def __len__(self):
+        return len(self._clients)
+
+    @property
+    def users(self):
+        with self._lock:
+            return list(self._clients)
+
+    def fan_out(self, fn, users=None, max_workers=None):
+        """Call fn(client) for every user (Default: all) on a thread pool
+        and yield a FanOutResult per user as the calls finish.
+
+        An exception of one user's call is reported in its
+        FanOutResult.error and does not stop the others.
+        """
+
+        from concurrent.futures import ThreadPoolExecutor, as_completed
+
+        if users is None:
+            users = self.users
+        with ThreadPoolExecutor(max_workers=max_workers
+                or self.max_workers) as pool:
+            futures = dict((pool.submit(fn, self.client(user)), user)
+                    for user in users)
+            for future in as_completed(futures):
+                try:
+                    result = FanOutResult(futures[future], future.result(),
+                            None)
+                except Exception as e:
+                    result = FanOutResult(futures[future], None, e)
+                yield result
+
+    async def fan_out_async(self, fn, users=None, max_workers=None):
+        """fan_out() for AsyncAPI clients: fn(client) returns an awaitable.
+
+        At most max_workers calls are in flight at a time.
+        """
+
+        import asyncio
+
+        if users is None:
+            users = self.users
+        semaphore = asyncio.Semaphore(max_workers or self.max_workers)
+
+        async def call(user):
+            async with semaphore:
+                try:
+                    return FanOutResult(user,
+                            await fn(self.client(user)), None)
+                except Exception as e:
+                    return FanOutResult(user, None, e)
+
+        for done in asyncio.as_completed([call(user) for user in users]):
+            yield await done
+
+    def close(self):
+        """Close the shared transport; await it for AsyncAPI clients."""
+
+        if self.transport is not None:
+            return self.transport.close()
@@ -0,0 +1,373 @@
+# -*- coding: utf-8 -*-
+
+"""Local evaluation of RTM filter expressions.
+
+    store = TaskStore.from_replica(engine.replica, lists=rtm.lists.getList())
+    for record in store.query('tag:work AND (due:today OR priority:1)'):
+        print(record.taskseries.name)
+
+Supported terms:
+    tag:NAME, list:NAME or ID, location:NAME or ID,
+    priority:1|2|3|none, status:completed|incomplete,
+    due:DATE, dueBefore:DATE, dueAfter:DATE,
+    completed:DATE, completedBefore:DATE, completedAfter:DATE,
+where DATE is today, tomorrow, yesterday, YYYY-MM-DD or (due only) never.
+Terms combine with AND, OR, NOT and parentheses; adjacent terms are
+ANDed. Values with spaces are quoted: list:"Home stuff".
+
+Dates are compared in UTC unless the store is given a utcoffset.
+"""
+
+import bisect
+import datetime
+import re
+
+from milky.models import TaskRecord
+
+_TOKEN = re.compile(r'''\s*(?:
+    (?P<open>\() |
+    (?P<close>\)) |
+    (?P<op>[A-Za-z]+):(?:"(?P<quoted>[^"]*)"|(?P<value>[^\s()"]+)) |
+    (?P<word>[^\s()]+)
+    )''', re.X)
+
+_OPERATORS = ('and', 'or', 'not', )
+
+class FilterError(ValueError):
+    """Malformed or unsupported filter expression."""
+
+def _tokenize(text):
+    tokens = []
+    pos = 0
+    text = text.strip()
+    while pos < len(text):
+        m = _TOKEN.match(text, pos)
+        if m is None or m.end() == pos:
+            raise FilterError('Cannot parse filter at %r' % text[pos:])
+        pos = m.end()
+        if m.group('open'):
+            tokens.append(('(', None))
+        elif m.group('close'):
+            tokens.append((')', None))
+        elif m.group('op'):
+            value = m.group('quoted')
+            if value is None:
+                value = m.group('value')
+            tokens.append(('term', (m.group('op').lower(), value)))
+        elif m.group('word').lower() in _OPERATORS:
+            tokens.append((m.group('word').lower(), None))
+        else:
+            raise FilterError('Unsupported filter term %r' % m.group('word'))
+    return tokens
+
+class _Parser(object):
+    """Recursive descent parser producing nested tuples:
+    ('or', a, b), ('and', a, b), ('not', a), ('term', op, value)."""
+
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.pos = 0
+
+    def _peek(self):
+        if self.pos < len(self.tokens):
+            return self.tokens[self.pos][0]
+        return None
+
+    def _next(self):
+        token = self.tokens[self.pos]
+        self.pos += 1
+        return token
+
+    def parse(self):
+        node = self._or()
+        if self.pos != len(self.tokens):
+            raise FilterError('Unexpected %r' % self._peek())
+        return node
+
+    def _or(self):
+        node = self._and()
+        while self._peek() == 'or':
+            self._next()
+            node = ('or', node, self._and())
+        return node
+
+    def _and(self):
+        node = self._not()
+        while self._peek() in ('and', 'not', 'term', '('):
+            if self._peek() == 'and':
+                self._next()
+            node = ('and', node, self._not())
+        return node
+
+    def _not(self):
+        if self._peek() == 'not':
+            self._next()
+            return ('not', self._not())
+        return self._atom()
+
+    def _atom(self):
+        kind = self._peek()
+        if kind is None:
+            raise FilterError('Unexpected end of filter')
+        kind, value = self._next()
+        if kind == '(':
+            node = self._or()
+            if self._peek() != ')':
+                raise FilterError('Missing )')
+            self._next()
+            return node
+        if kind == 'term':
+            if value[0] not in _TERMS:
+                raise FilterError('Unsupported filter term %s:' % value[0])
+            return ('term', ) + value
+        raise FilterError('Unexpected %r' % kind)
+
+_parsed = {}
+
+def parse_filter(text):
+    """Syntax tree of a filter expression; parsed once per text."""
+
+    node = _parsed.get(text)
+    if node is None:
+        node = _Parser(_tokenize(text)).parse()
+        if len(_parsed) >= 1024:
+            _parsed.clear()
+        _parsed[text] = node
+    return node
+
+# Sets of tasks are bitmaps: bit n stands for the n-th record of the store,
+# so AND, OR and NOT are single operations on Python ints.
+
+def _bitmap(positions):
+    bits = bytearray(len(positions) and max(positions) // 8 + 1)
+    for position in positions:
+        bits[position >> 3] |= 1 << (position & 7)
+    return int.from_bytes(bytes(bits), 'little')
+
+def _positions(bitmap):
+    return [i for (i, bit) in enumerate(bin(bitmap)[:1:-1]) if bit == '1']
+
+if hasattr(int, 'bit_count'):
+    _popcount = int.bit_count
+else:
+    def _popcount(bitmap):
+        return bin(bitmap).count('1')
+
+class _DateIndex(object):
+    """Positions sorted by a datetime, for range lookups."""
+
+    def __init__(self, pairs):
+        pairs.sort(key=lambda pair: pair[0])
+        self.keys = [key for (key, position) in pairs]
+        self.positions = [position for (key, position) in pairs]
+        self._ranges = {}
+
+    def range(self, start=None, end=None):
+        """Bitmap of the positions with start <= key < end."""
+
+        bitmap = self._ranges.get((start, end))
+        if bitmap is None:
+            lo, hi = 0, len(self.keys)
+            if start is not None:
+                lo = bisect.bisect_left(self.keys, start)
+            if end is not None:
+                hi = bisect.bisect_left(self.keys, end)
+            bitmap = _bitmap(self.positions[lo:hi])
+            if len(self._ranges) >= 256:
+                self._ranges.clear()
+            self._ranges[(start, end)] = bitmap
+        return bitmap
+
+def _bitmaps(index):
+    return dict((key, _bitmap(positions)) for (key, positions) in index.items())
+
+class TaskStore(object):
+    """Tasks indexed by tag, list, location, priority, due and completed
+    date, queried with RTM filter expressions.
+
+    Args:
+        records - iterable of (list, taskseries, task); deleted tasks are
+            left out.
+        lists - models.List objects, for list:NAME (Optional)
+        locations - models.Location objects, for location:NAME (Optional)
+        utcoffset - timedelta of the user's timezone for date terms.
+        today - function returning today's date (Default: from utcnow)
+    """
+
+    def __init__(self, records, lists=(), locations=(),
+            utcoffset=datetime.timedelta(0), today=None):
+        self.utcoffset = utcoffset
+        self._today = today
+        self.records = []
+        self._list_names = dict((l.name.lower(), l.id) for l in lists
+                if getattr(l, 'name', None))
+        self._location_names = dict((l.name.lower(), l.id) for l in locations
+                if getattr(l, 'name', None))
+
+        tags = {}
+        lists = {}
+        locations = {}
+        priorities = {}
+        no_due = []
+        due = []
+        completed = []
+
+        for tasklist, series, task in records:
+            if getattr(task, 'deleted', None):
+                continue
+            position = len(self.records)
+            self.records.append(TaskRecord(tasklist, series, task))
+
+            for tag in series.tags or ():
+                tags.setdefault(tag.lower(), []).append(position)
+            list_id = getattr(series, 'list_id', None)
+            if list_id is None and tasklist is not None:
+                list_id = tasklist.id
+            lists.setdefault(list_id, []).append(position)
+            locations.setdefault(series.location_id, []).append(position)
+            priorities.setdefault(task.priority, []).append(position)
+            if task.due:
+                due.append((task.due, position))
+            else:
+                no_due.append(position)
+            if task.completed:
+                completed.append((task.completed, position))
+
+        self._tags = _bitmaps(tags)
+        self._lists = _bitmaps(lists)
+        self._locations = _bitmaps(locations)
+        self._priorities = _bitmaps(priorities)
+        self._no_due = _bitmap(no_due)
+        self._completed = _bitmap([position for (c, position) in completed])
+        self._all = (1 << len(self.records)) - 1
+        self._due = _DateIndex(due)
+        self._completed_at = _DateIndex(completed)
+
+    @classmethod
+    def from_tasks(cls, tasks, **kwargs):
+        """Store of a models.Tasks (tasks.getList result)."""
+
+        return cls(((tasklist, series, task) for tasklist in tasks.lists
+            for series in tasklist.taskseries for task in series.task),
+            **kwargs)
+
+    @classmethod
+    def from_replica(cls, replica, **kwargs):
+        """Store of a sync.Replica."""
+
+        return cls(replica.iter_tasks(), **kwargs)
+
+    def __len__(self):
+        return len(self.records)
+
+    def query(self, text):
+        """TaskRecords matching the filter, in store order."""
+
+        records = self.records
+        return [records[i] for i in _positions(self._eval(parse_filter(text)))]
+
+    def count(self, text):
+        return _popcount(self._eval(parse_filter(text)))
+
+    def _eval(self, node):
+        kind = node[0]
+        if kind == 'and':
+            return self._eval(node[1]) & self._eval(node[2])
+        if kind == 'or':
+            return self._eval(node[1]) | self._eval(node[2])
+        if kind == 'not':
+            return self._all ^ self._eval(node[1])
+        return _TERMS[node[1]](self, node[2])
+
+    # Terms
+
+    def _tag(self, value):
+        return self._tags.get(value.lower(), 0)
+
+    def _named(self, index, names, value):
+        key = names.get(value.lower())
+        if key is None:
+            try:
+                key = int(value)
+            except ValueError:
+                return 0
+        return index.get(key, 0)
+
+    def _list(self, value):
+        return self._named(self._lists, self._list_names, value)
+
+    def _location(self, value):
+        return self._named(self._locations, self._location_names, value)
+
+    def _priority(self, value):
+        value = value.lower()
+        if value in ('none', 'n', '0'):
+            return self._priorities.get(None, 0)
+        try:
+            return self._priorities.get(int(value), 0)
+        except ValueError:
+            raise FilterError('Invalid priority %r' % value)
+
+    def _status(self, value):
+        value = value.lower()
+        if value == 'completed':
+            return self._completed
+        if value == 'incomplete':
+            return self._all ^ self._completed
+        raise FilterError('Invalid status %r' % value)
+
+    def _day(self, value):
+        """UTC datetime range [start, end) of a DATE value."""
+
+        value = value.lower()
+        if self._today is not None:
+            today = self._today()
+        else:
+            today = (datetime.datetime.utcnow() + self.utcoffset).date()
+        if value == 'today':
+            day = today
+        elif value == 'tomorrow':
+            day = today + datetime.timedelta(days=1)
+        elif value == 'yesterday':
+            day = today - datetime.timedelta(days=1)
+        else:
+            try:
+                day = datetime.datetime.strptime(value, '%Y-%m-%d').date()
+            except ValueError:
+                raise FilterError('Invalid date %r' % value)
+        start = datetime.datetime.combine(day, datetime.time()) \
+                - self.utcoffset
+        return start, start + datetime.timedelta(days=1)
+
+    def _due_on(self, value):
+        if value.lower() == 'never':
+            return self._no_due
+        return self._due.range(*self._day(value))
+
+    def _due_before(self, value):
+        return self._due.range(end=self._day(value)[0])
+
+    def _due_after(self, value):
+        return self._due.range(start=self._day(value)[1])
+
+    def _completed_on(self, value):
+        return self._completed_at.range(*self._day(value))
+
+    def _completed_before(self, value):
+        return self._completed_at.range(end=self._day(value)[0])
+
+    def _completed_after(self, value):
+        return self._completed_at.range(start=self._day(value)[1])
+
+_TERMS = {
+    'tag': TaskStore._tag,
+    'list': TaskStore._list,
+    'location': TaskStore._location,
+    'priority': TaskStore._priority,
+    'status': TaskStore._status,
+    'due': TaskStore._due_on,
+    'duebefore': TaskStore._due_before,
+    'dueafter': TaskStore._due_after,
+    'completed': TaskStore._completed_on,
+    'completedbefore': TaskStore._completed_before,
+    'completedafter': TaskStore._completed_after, }
@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+
+import threading
+import time
+from collections import OrderedDict, deque
+
+# RTM allows an average of one request per second per API key.
+RTM_RATE = 1.0
+RTM_BURST = 1
+
+# Priority lanes, lower is served first.
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BULK = 1
+
+class TokenBucket(object):
+    """Token bucket refilled at rate tokens per second up to burst tokens."""
+
+    def __init__(self, rate=RTM_RATE, burst=RTM_BURST, clock=time.monotonic):
+        self.rate = float(rate)
+        self.burst = burst
+        self.clock = clock
+        self.tokens = float(burst)
+        self.updated = clock()
+
+    def _refill(self):
+        now = self.clock()
+        self.tokens = min(self.burst,
+                self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self):
+        """Seconds until a token is available."""
+
+        self._refill()
+        if self.tokens >= 1.0:
+            return 0.0
+        return (1.0 - self.tokens) / self.rate
+
+    def take(self):
+        self._refill()
+        self.tokens -= 1.0
+
+class SchedulerStats(object):
+    """Counters of a scheduler.
+
+    granted - requests let through.
+    total_wait - seconds spent queued by all granted requests.
+    max_wait - longest time a granted request was queued.
+    """
+
+    def __init__(self):
+        self.granted = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    @property
+    def mean_wait(self):
+        return self.granted and self.total_wait / self.granted or 0.0
+
+    def __repr__(self):
+        return '<SchedulerStats - granted=%d, mean_wait=%.3f, max_wait=%.3f>' % (
+                self.granted, self.mean_wait, self.max_wait)
+
+class _Ticket(object):
+    __slots__ = ('client', 'priority', 'enqueued', )
+
+    def __init__(self, client, priority, enqueued):
+        self.client = client
+        self.priority = priority
+        self.enqueued = enqueued
+
+class Scheduler(object):
+    """Request scheduler in front of a token bucket.
+
+    Waiting requests are served by priority lane first; inside a lane the
+    clients (e.g. several API instances sharing one scheduler) take turns,
+    so one bulk job cannot starve the others. Works from threads through
+    acquire() and from coroutines through acquire_async().
+
+    Args:
+        rate - Requests per second.
+        burst - Requests that may be sent back to back after an idle period.
+    """
+
+    def __init__(self, rate=RTM_RATE, burst=RTM_BURST, clock=time.monotonic):
+        self.bucket = TokenBucket(rate, burst, clock)
+        self.clock = clock
+        self.stats = SchedulerStats()
+        self._cond = threading.Condition(threading.Lock())
+        self._lanes = {}
+
+    def _enqueue(self, client, priority):
+        ticket = _Ticket(client, priority, self.clock())
+        lane = self._lanes.setdefault(priority, OrderedDict())
+        lane.setdefault(client, deque()).append(ticket)
+        return ticket
+
+    def _remove(self, ticket):
+        lane = self._lanes[ticket.priority]
+        queue = lane[ticket.client]
+        queue.remove(ticket)
+        if queue:
+            # Let the other clients of the lane go first next time.
+            lane.move_to_end(ticket.client)
+        else:
+            del lane[ticket.client]
+
+    def _head(self):
+        for priority in sorted(self._lanes):
+            lane = self._lanes[priority]
+            if lane:
+                return next(iter(lane.values()))[0]
+        return None
+
+    def _poll(self, ticket):
+        """Grant the ticket if it is next in line and a token is available.
+
+        Return None when granted, otherwise seconds to wait before polling
+        again. Must be called with the lock held.
+        """
+
+        delay = self.bucket.delay()
+        if self._head() is not ticket:
+            return delay or 1.0 / self.bucket.rate
+        if delay:
+            return delay
+
+        self.bucket.take()
+        self._remove(ticket)
+        wait = self.clock() - ticket.enqueued
+        self.stats.granted += 1
+        self.stats.total_wait += wait
+        self.stats.max_wait = max(self.stats.max_wait, wait)
+        self._cond.notify_all()
+        return None
+
+    def _cancel(self, ticket):
+        with self._cond:
+            try:
+                self._remove(ticket)
+            except (KeyError, ValueError):
+                pass
+            else:
+                self._cond.notify_all()
+
+    def acquire(self, client=None, priority=PRIORITY_INTERACTIVE):
+        """Block until the request may be sent."""
+
+        with self._cond:
+            ticket = self._enqueue(client, priority)
+            try:
+                while True:
+                    delay = self._poll(ticket)
+                    if delay is None:
+                        return
+                    self._cond.wait(delay)
+            except BaseException:
+                self._remove(ticket)
+                self._cond.notify_all()
+                raise
+
+    async def acquire_async(self, client=None, priority=PRIORITY_INTERACTIVE):
+        """Wait without blocking the event loop until the request may be sent."""
+
+        import asyncio
+
+        with self._cond:
+            ticket = self._enqueue(client, priority)
+        try:
+            while True:
+                with self._cond:
+                    delay = self._poll(ticket)
+                if delay is None:
+                    return
+                await asyncio.sleep(delay)
+        except BaseException:
+            self._cancel(ticket)
+            raise
+
+    def queue_depth(self, priority=None):
+        """Number of waiting requests, optionally for one lane."""
+
+        with self._cond:
+            lanes = priority is None and self._lanes.values() \
+                    or [self._lanes.get(priority, {})]
+            return sum(len(queue) for lane in lanes for queue in lane.values())
+
+_shared_scheduler = None
+_shared_lock = threading.Lock()
+
+def shared_scheduler():
+    """Process-wide scheduler for API instances using the same API key."""
+
+    global _shared_scheduler
+    with _shared_lock:
+        if _shared_scheduler is None:
+            _shared_scheduler = Scheduler()
+        return _shared_scheduler
@@ -0,0 +1,295 @@
+# -*- coding: utf-8 -*-
+
+"""Expansion of RTM recurrence rules (RFC 5545 RRULE subset).
+
+    rule = parse_rule('FREQ=WEEKLY;INTERVAL=1;BYDAY=MO,WE')
+    now = datetime.datetime.utcnow()
+    for due in rule.occurrences(task.due, now,
+            now + datetime.timedelta(days=90)):
+        ...
+
+Supported parts: FREQ (DAILY, WEEKLY, MONTHLY, YEARLY), INTERVAL,
+BYDAY (MO,WE or 2TU, -1FR for monthly rules), BYMONTHDAY (15, -1),
+UNTIL and COUNT; other parts are ignored. Occurrences keep the time of
+day of the start date and are naive UTC datetimes like the rest of
+milky, so they do not follow DST changes of the user's timezone.
+
+Rules are compiled once per rule text and shared by every series that
+uses the same text.
+"""
+
+import datetime
+
+WEEKDAYS = ('MO', 'TU', 'WE', 'TH', 'FR', 'SA', 'SU', )
+
+_WEEKDAY_NUMBERS = dict((day, i) for (i, day) in enumerate(WEEKDAYS))
+_DAYS_IN_MONTH = (31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31, )
+_ONE_DAY = datetime.timedelta(days=1)
+_ONE_SECOND = datetime.timedelta(seconds=1)
+# Periods in a row without an occurrence after which a rule is taken to
+# have none left (e.g. BYMONTHDAY=31 with INTERVAL=2 from a 30 day month)
+_MAX_EMPTY_PERIODS = 1000
+
+def _days_in_month(year, month):
+    if month == 2 and year % 4 == 0 and (year % 100 != 0 or year % 400 == 0):
+        return 29
+    return _DAYS_IN_MONTH[month - 1]
+
+def _int(v):
+    try:
+        return int(v)
+    except ValueError:
+        return None
+
+def _until(v):
+    """(until, end): the UNTIL datetime and the first instant after it.
+
+    RTM sends 20121231T000000 with or without Z; a plain date covers the
+    whole day.
+    """
+
+    v = v.upper().rstrip('Z')
+    try:
+        if 'T' in v:
+            until = datetime.datetime.strptime(v, '%Y%m%dT%H%M%S')
+            return until, until + _ONE_SECOND
+        until = datetime.datetime.strptime(v, '%Y%m%d')
+        return until, until + _ONE_DAY
+    except ValueError:
+        return None, None
+
+def _weekday(v):
+    """(n, weekday number) of a BYDAY item: MO is (0, 0), -1FR is (-1, 4)."""
+
+    weekday = _WEEKDAY_NUMBERS.get(v[-2:])
+    if weekday is None:
+        return None
+    n = v[:-2]
+    if not n:
+        return 0, weekday
+    n = _int(n)
+    return n and (n, weekday) or None
+
+class Rule(object):
+    """A compiled recurrence rule.
+
+    freq - DAILY, WEEKLY, MONTHLY or YEARLY, or None.
+    interval, count - ints, or None when the rule has none.
+    byday - tuple of BYDAY items as sent ('MO', '2TU').
+    bymonthday - tuple of ints.
+    until - datetime, or None.
+    """
+
+    __slots__ = ('text', 'freq', 'interval', 'byday', 'bymonthday', 'until',
+            'count', '_step', '_weekdays', '_end', )
+
+    def __init__(self, text):
+        self.text = text
+        self.freq = None
+        self.interval = None
+        self.byday = ()
+        self.bymonthday = ()
+        self.until = None
+        self.count = None
+        self._end = None
+        weekdays = []
+
+        for part in text.upper().split(';'):
+            key, sep, value = part.partition('=')
+            key = key.strip()
+            value = value.strip()
+            if key == 'FREQ':
+                self.freq = value
+            elif key == 'INTERVAL':
+                self.interval = _int(value)
+            elif key == 'BYDAY':
+                self.byday = tuple(v.strip() for v in value.split(',')
+                        if v.strip())
+                weekdays = [w for w in map(_weekday, self.byday) if w]
+            elif key == 'BYMONTHDAY':
+                self.bymonthday = tuple(d for d in map(_int, value.split(','))
+                        if d)
+            elif key == 'UNTIL':
+                self.until, self._end = _until(value)
+            elif key == 'COUNT':
+                self.count = _int(value)
+
+        self._step = max(self.interval or 1, 1)
+        self._weekdays = tuple(sorted(set(weekdays)))
+
+    def __repr__(self):
+        return '<Rule - %s>' % self.text
+
+    def __reduce__(self):
+        # Unpickled rules are the shared ones of their text.
+        return parse_rule, (self.text, )
+
+    # Periods: period p of a rule starting at start is the day, week
+    # (from Monday), month or year p * interval units after start's.
+
+    def _unit(self, start, dt):
+        """Units (days, weeks, months, years) from start's to dt's."""
+
+        if self.freq == 'DAILY':
+            return (dt.date() - start.date()).days
+        if self.freq == 'WEEKLY':
+            return (dt.date() - start.date() + datetime.timedelta(
+                days=start.weekday())).days // 7
+        if self.freq == 'MONTHLY':
+            return (dt.year - start.year) * 12 + dt.month - start.month
+        return dt.year - start.year
+
+    def _periods(self, start, p):
+        """(start, occurrences) of the periods from p on, occurrences
+        before the rule's start included."""
+
+        if self.freq in ('DAILY', 'WEEKLY'):
+            # Periods of a fixed length: plain datetime arithmetic.
+            if self.freq == 'DAILY':
+                width = datetime.timedelta(days=self._step)
+            else:
+                width = datetime.timedelta(days=7 * self._step)
+            if self.freq == 'WEEKLY' and self._weekdays:
+                anchor = start - datetime.timedelta(days=start.weekday())
+                offsets = [datetime.timedelta(days=weekday)
+                        for (n, weekday) in self._weekdays]
+            else:
+                anchor = start
+                offsets = None
+            anchor += width * p
+            while True:
+                if offsets is None:
+                    yield anchor, (anchor, )
+                else:
+                    yield anchor, [anchor + offset for offset in offsets]
+                anchor += width
+
+        time = start.time()
+        combine = datetime.datetime.combine
+        while True:
+            first, days = self._period(start, p)
+            yield combine(first, time), [combine(day, time) for day in days]
+            p += 1
+
+    def _period(self, start, p):
+        """(first day of monthly or yearly period p, its days with an
+        occurrence)."""
+
+        units = p * self._step
+        if self.freq == 'MONTHLY':
+            year, month = divmod(start.year * 12 + start.month - 1 + units, 12)
+            month += 1
+            first = datetime.date(year, month, 1)
+            length = _days_in_month(year, month)
+            days = None
+            if self.bymonthday:
+                days = set(d > 0 and d or length + d + 1
+                        for d in self.bymonthday)
+            if self._weekdays:
+                offset = first.weekday()
+                matching = set()
+                for n, weekday in self._weekdays:
+                    candidates = range((weekday - offset) % 7 + 1,
+                            length + 1, 7)
+                    if n == 0:
+                        matching.update(candidates)
+                    elif -len(candidates) <= (n > 0 and n - 1 or n) \
+                            < len(candidates):
+                        matching.add(candidates[n > 0 and n - 1 or n])
+                if days is None:
+                    days = matching
+                else:
+                    days &= matching
+            if days is None:
+                days = (start.day, )
+            return first, [first.replace(day=d) for d in sorted(days)
+                    if 1 <= d <= length]
+
+        year = start.year + units
+        first = datetime.date(year, 1, 1)
+        if start.month == 2 and start.day == 29 \
+                and _days_in_month(year, 2) == 28:
+            return first, ()
+        return first, (start.date().replace(year=year), )
+
+    def occurrences(self, start, after=None, before=None):
+        """Occurrences of the rule from start (the first due date) on,
+        generated lazily in order.
+
+        Only the ones with after <= occurrence < before are yielded; COUNT
+        and UNTIL still count from start. Without before, UNTIL or COUNT
+        the generator is endless.
+        """
+
+        if self.freq not in ('DAILY', 'WEEKLY', 'MONTHLY', 'YEARLY') \
+                or start is None:
+            return
+        count = self.count
+        end = self._end
+        if before is not None and (end is None or before < end):
+            end = before
+        p = 0
+        if count is None and after is not None and after > start:
+            # Periods before the window hold nothing to yield.
+            p = self._unit(start, after) // self._step
+
+        seen = 0
+        empty = 0
+        for first, occurrences in self._periods(start, p):
+            if end is not None and first >= end:
+                return
+            found = False
+            for occurrence in occurrences:
+                if occurrence < start:
+                    continue
+                if end is not None and occurrence >= end:
+                    return
+                found = True
+                seen += 1
+                if after is None or occurrence >= after:
+                    yield occurrence
+                if count is not None and seen >= count:
+                    return
+            if found:
+                empty = 0
+            else:
+                empty += 1
+                if empty > _MAX_EMPTY_PERIODS:
+                    return
+
+    def between(self, start, after, before):
+        """List of the occurrences with after <= occurrence < before."""
+
+        return list(self.occurrences(start, after, before))
+
+_rules = {}
+
+def parse_rule(text):
+    """Compiled Rule of an rrule text; compiled once per text."""
+
+    rule = _rules.get(text)
+    if rule is None:
+        rule = Rule(text)
+        if len(_rules) >= 4096:
+            _rules.clear()
+        _rules[text] = rule
+    return rule
+
+def expand(records, after, before):
+    """(record, occurrence) of every occurrence of recurring tasks in the
+    window after <= occurrence < before.
+
+    records are (list, taskseries, task), e.g. API.iter_tasks(),
+    sync.Replica.iter_tasks() or a query.TaskStore query; the due date of
+    each incomplete task with a due date is taken as the rule's start.
+    """
+
+    for record in records:
+        series, task = record[1], record[2]
+        rrule = getattr(series, 'rrule', None)
+        due = getattr(task, 'due', None)
+        if rrule is None or due is None or getattr(task, 'completed', None) \
+                or getattr(task, 'deleted', None):
+            continue
+        for occurrence in rrule.occurrences(due, after, before):
+            yield record, occurrence
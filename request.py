@@ -174,3 +174,10 @@ METHODS = {
             ('timeline', 'transaction_id', ), (), 
             models.Stat, ), }, }
 
+
+def method_name(prefix, attr):
+    """RTM method name of METHODS[prefix][attr]."""
+
+    if prefix == 'tasksnotes':
+        return 'rtm.tasks.notes.%s' % attr
+    return 'rtm.%s.%s' % (prefix, attr)
@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+import logging
+import random
+import threading
+import time
+
+from milky.error import MilkyError, ERRCODE_NETWORK, ERRCODE_JSON
+
+# RTM "Service currently unavailable"
+ERRCODE_SERVICE_UNAVAILABLE = 105
+
+RETRYABLE_CODES = (ERRCODE_NETWORK, ERRCODE_JSON, ERRCODE_SERVICE_UNAVAILABLE, )
+
+class RetryStats(object):
+    """Retry counters of one RTM method.
+
+    calls - calls made through the policy.
+    retries - additional attempts sent.
+    recovered - calls that succeeded after at least one retry.
+    failures - calls that raised in the end.
+    """
+
+    def __init__(self):
+        self.calls = 0
+        self.retries = 0
+        self.recovered = 0
+        self.failures = 0
+
+    def __repr__(self):
+        return '<RetryStats - calls=%d, retries=%d, recovered=%d, failures=%d>' % (
+                self.calls, self.retries, self.recovered, self.failures)
+
+class RetryPolicy(object):
+    """Retry transient failures with exponential backoff and full jitter.
+
+    Args:
+        max_attempts - Attempts per call, including the first one.
+        base_delay - Backoff before the first retry, in seconds.
+        max_delay - Upper bound of one backoff.
+        deadline - Total seconds a call may take including backoffs.
+        retry_codes - MilkyError codes that are retried.
+        retry_writes - Also retry timeline writes. They are not idempotent:
+            a request lost after RTM applied it would be applied twice.
+    """
+
+    def __init__(self, max_attempts=4, base_delay=0.5, max_delay=8.0,
+            deadline=30.0, retry_codes=RETRYABLE_CODES, retry_writes=False,
+            clock=time.monotonic, sleep=time.sleep):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.deadline = deadline
+        self.retry_codes = frozenset(retry_codes)
+        self.retry_writes = retry_writes
+        self.clock = clock
+        self.sleep = sleep
+        self.stats = {}
+        self._lock = threading.Lock()
+
+    def is_retryable(self, error, write=False):
+        if write and not self.retry_writes:
+            return False
+        return isinstance(error, MilkyError) and error.no in self.retry_codes
+
+    def backoff(self, attempt):
+        """Delay before retry number attempt (starting at 1)."""
+
+        return random.uniform(0, min(self.max_delay,
+                self.base_delay * (2 ** (attempt - 1))))
+
+    def _count(self, method, field):
+        with self._lock:
+            stats = self.stats.get(method)
+            if stats is None:
+                stats = self.stats[method] = RetryStats()
+            setattr(stats, field, getattr(stats, field) + 1)
+
+    def _next_delay(self, method, error, write, attempt, started):
+        """Return the backoff before the next attempt or None to give up."""
+
+        if attempt >= self.max_attempts or not self.is_retryable(error, write):
+            return None
+        delay = self.backoff(attempt)
+        if self.clock() - started + delay > self.deadline:
+            return None
+        logging.debug('retry %s in %.2fs: %s' % (method, delay, error))
+        self._count(method, 'retries')
+        return delay
+
+    def call(self, method, write, fn):
+        """Call fn() until it succeeds or the policy gives up."""
+
+        self._count(method, 'calls')
+        started = self.clock()
+        attempt = 1
+        while True:
+            try:
+                result = fn()
+            except MilkyError as e:
+                delay = self._next_delay(method, e, write, attempt, started)
+                if delay is None:
+                    self._count(method, 'failures')
+                    raise
+                self.sleep(delay)
+                attempt += 1
+                continue
+            if attempt > 1:
+                self._count(method, 'recovered')
+            return result
+
+    async def call_async(self, method, write, fn):
+        """Await fn() until it succeeds or the policy gives up."""
+
+        self._count(method, 'calls')
+        started = self.clock()
+        attempt = 1
+        while True:
+            try:
+                result = await fn()
+            except MilkyError as e:
+                delay = self._next_delay(method, e, write, attempt, started)
+                if delay is None:
+                    self._count(method, 'failures')
+                    raise
+                await asyncio.sleep(delay)
+                attempt += 1
+                continue
+            if attempt > 1:
+                self._count(method, 'recovered')
+            return result
@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+
+"""Coalescing of concurrent identical reads.
+
+When threads or coroutines make the same read call (method and
+parameters, auth token included) while one is in flight, they wait for
+its response and parsed result instead of sending their own request.
+Calls with a timeline, and the few reads that hand out something new on
+every call, are never coalesced.
+
+It is off unless asked for with API(..., singleflight=True). The callers
+sharing a call get the very same result objects, so none of them may
+change the models in place; sync.Replica, for one, does.
+"""
+
+import threading
+
+# Methods without a timeline that must not be shared between callers
+NOT_COALESCED = frozenset(('rtm.auth.getFrob', 'rtm.timelines.create', ))
+
+def coalescable(params):
+    """Whether a signed request may share another caller's response."""
+
+    return 'timeline' not in params \
+            and params['method'] not in NOT_COALESCED
+
+class _Call(object):
+    __slots__ = ('done', 'result', 'error', )
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+class SingleFlight(object):
+    """Concurrent calls of one key share a single execution.
+
+    The first caller of a key runs the function; callers arriving before
+    it returns wait and get its result or exception. Nothing is kept
+    once the call is over, use cache.ResponseCache for that.
+
+    shared - calls that got the result of another caller's flight.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._tasks = {}
+        self._lock = threading.Lock()
+        self.shared = 0
+
+    def do(self, key, fn):
+        """(fn(), shared): shared tells whether another thread ran fn."""
+
+        with self._lock:
+            call = self._calls.get(key)
+            if call is None:
+                leader = True
+                call = self._calls[key] = _Call()
+            else:
+                leader = False
+                self.shared += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result, False
+
+    async def do_async(self, key, fn):
+        """do() for coroutines: fn() returns an awaitable.
+
+        The call runs as a task of its own, so a caller that is cancelled
+        does not cancel it for the others.
+        """
+
+        import asyncio
+
+        key = (asyncio.get_running_loop(), key)
+        task = self._tasks.get(key)
+        if task is not None:
+            with self._lock:
+                self.shared += 1
+            return await asyncio.shield(task), True
+
+        task = self._tasks[key] = asyncio.ensure_future(fn())
+
+        def done(task):
+            if self._tasks.get(key) is task:
+                del self._tasks[key]
+            if not task.cancelled():
+                # Retrieved, even when every caller has gone.
+                task.exception()
+
+        task.add_done_callback(done)
+        return await asyncio.shield(task), False
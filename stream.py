@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+
+import re
+
+# Path of the task lists in a tasks.getList response.
+TASKS_LIST_PATH = ('rsp', 'tasks', 'list', )
+
+_STRUCTURE = re.compile(r'[{}\[\]":]')
+_STRING = re.compile(r'"(?:[^"\\]|\\.)*"', re.S)
+# Inside the array only brackets count: a run of other text and whole
+# strings is skipped by one match.
+_SKIP = re.compile(r'(?:[^"{}\[\]]+|"[^"\\]*(?:\\.[^"\\]*)*")*', re.S)
+
+class ArraySplitter(object):
+    """Split the elements of one JSON array out of a document fed in chunks.
+
+    Each element is returned as JSON text as soon as it is complete, so
+    only the current element is held in memory. A single object in place
+    of the array (RTM sends one when there is one element) is returned as
+    the only element.
+
+    After close(), skeleton is the rest of the document with the array
+    emptied, e.g. '{"rsp":{"stat":"ok","tasks":{"rev":"1","list":[]}}}'.
+
+    Args:
+        path - Object keys from the root to the array.
+    """
+
+    def __init__(self, path):
+        self.path = tuple(path)
+        self.found = False
+        self._buf = ''
+        self._pos = 0
+        self._skeleton = []
+        self._keys = []
+        self._last_string = None
+        self._key = None
+        # None before the array, the nesting depth inside it, or -1 after.
+        self._depth = None
+        self._start = None
+        self._single = False
+
+    @property
+    def skeleton(self):
+        return ''.join(self._skeleton)
+
+    def feed(self, text):
+        """Add text; return the list of elements completed by it."""
+
+        self._buf += text
+        elements = []
+        if self._depth is None:
+            self._scan_outside()
+        if self._depth is not None and self._depth >= 0:
+            self._scan_array(elements)
+        if self._depth == -1:
+            self._skeleton.append(self._buf[self._pos:])
+            self._buf = ''
+            self._pos = 0
+        return elements
+
+    def close(self):
+        self._skeleton.append(self._buf[self._pos:])
+        self._buf = ''
+        self._pos = 0
+
+    def _trim(self, keep_from):
+        if keep_from:
+            self._buf = self._buf[keep_from:]
+            self._pos -= keep_from
+            if self._start is not None:
+                self._start -= keep_from
+
+    def _scan_outside(self):
+        buf = self._buf
+        pos = self._pos
+        while True:
+            m = _STRUCTURE.search(buf, pos)
+            if m is None:
+                pos = len(buf)
+                break
+            c = m.group()
+            i = m.start()
+            if c == '"':
+                s = _STRING.match(buf, i)
+                if s is None:
+                    pos = i
+                    break
+                self._last_string = s.group()[1:-1]
+                pos = s.end()
+                continue
+            pos = i + 1
+            if c == ':':
+                self._key = self._last_string
+            elif c in '{[':
+                keys = self._keys + [self._key]
+                if tuple(keys[1:]) == self.path:
+                    self.found = True
+                    self._skeleton.append(buf[self._pos:i] + '[]')
+                    self._pos = i
+                    self._depth = 0
+                    self._single = c == '{'
+                    if self._single:
+                        self._start = i
+                    else:
+                        self._pos = i + 1
+                    self._trim(self._pos)
+                    return
+                self._keys = keys
+                self._key = None
+            elif c in '}]':
+                if self._keys:
+                    self._keys.pop()
+                self._key = None
+
+        self._skeleton.append(buf[self._pos:pos])
+        self._pos = pos
+        self._trim(pos)
+
+    def _scan_array(self, elements):
+        buf = self._buf
+        pos = self._pos
+        depth = self._depth
+        skip = _SKIP.match
+        end = len(buf)
+        while True:
+            pos = skip(buf, pos).end()
+            if pos == end or buf[pos] == '"':
+                # The end of the text, or a string it cuts short.
+                break
+            c = buf[pos]
+            i = pos
+            pos = i + 1
+            if c in '{[':
+                if not depth:
+                    self._start = i
+                depth += 1
+            elif c in '}]':
+                if not depth:
+                    # End of the array.
+                    self._depth = -1
+                    self._pos = pos
+                    return
+                depth -= 1
+                if not depth:
+                    elements.append(buf[self._start:pos])
+                    self._start = None
+                    if self._single:
+                        self._depth = -1
+                        self._pos = pos
+                        return
+
+        self._depth = depth
+        self._pos = pos
+        self._trim(self._start if self._start is not None else pos)
+
+def split_array(text, path):
+    """Split a complete document; return (skeleton, [element texts])."""
+
+    splitter = ArraySplitter(path)
+    elements = splitter.feed(text)
+    splitter.close()
+    return splitter.skeleton, elements
@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+
+import datetime
+from collections import OrderedDict
+
+from milky.api import DATE_FORMAT
+from milky.models import ResultSet
+
+# Subtracted from the local clock for the next last_sync, to cover a client
+# clock running ahead of RTM's
+CLOCK_MARGIN = datetime.timedelta(minutes=5)
+
+def _as_list(v):
+    if not v:
+        return []
+    if type(v) is not list:
+        return [v, ]
+    return v
+
+class SyncResult(object):
+    """Changes applied by one sync."""
+
+    def __init__(self):
+        self.added = 0
+        self.modified = 0
+        self.deleted = 0
+
+    def __repr__(self):
+        return '<SyncResult - added=%d, modified=%d, deleted=%d>' % (
+                self.added, self.modified, self.deleted)
+
+class Replica(object):
+    """Local copy of an account's tasks keyed by id.
+
+    lists - {list_id: TaskList} list attributes, without taskseries.
+    taskseries - {taskseries_id: TaskSeries}, each with a list_id.
+    tasks - {task_id: taskseries_id}
+    last_sync - UTC datetime of the last applied sync or None.
+    """
+
+    def __init__(self):
+        self.lists = {}
+        self.taskseries = {}
+        self.tasks = {}
+        self.last_sync = None
+
+    def __len__(self):
+        return len(self.tasks)
+
+    def iter_tasks(self):
+        """Yield (list, taskseries, task) for every task of the replica."""
+
+        for series in self.taskseries.values():
+            tasklist = self.lists.get(series.list_id)
+            for task in series.task:
+                yield tasklist, series, task
+
+    def apply(self, tasks, result=None):
+        """Apply a tasks.getList response (full or delta) in place."""
+
+        if result is None:
+            result = SyncResult()
+
+        deletions = []
+        for tasklist in tasks.lists:
+            list_id = tasklist.id
+            for series in tasklist.taskseries:
+                self._apply_series(list_id, series, result)
+
+            deleted = getattr(tasklist, 'deleted', None)
+            if isinstance(deleted, dict):
+                for series in _as_list(deleted.get(u'taskseries')):
+                    for task in _as_list(series.get(u'task')):
+                        deletions.append((list_id, series[u'id'], task[u'id']))
+
+            tasklist.taskseries = ResultSet()
+            self.lists[list_id] = tasklist
+
+        # Deletions go last: a series moved to another list shows up as
+        # deleted from its old list in the same delta.
+        for list_id, series_id, task_id in deletions:
+            self._delete_task(list_id, series_id, task_id, result)
+
+        return result
+
+    def _apply_series(self, list_id, series, result):
+        series.list_id = list_id
+        old = self.taskseries.get(series.id)
+
+        tasks = OrderedDict()
+        if old is not None:
+            for task in old.task:
+                tasks[task.id] = task
+
+        for task in series.task:
+            if getattr(task, 'deleted', None):
+                if tasks.pop(task.id, None) is not None:
+                    del self.tasks[task.id]
+                    result.deleted += 1
+                continue
+            if task.id in tasks:
+                result.modified += 1
+            else:
+                result.added += 1
+            tasks[task.id] = task
+            self.tasks[task.id] = series.id
+
+        if tasks:
+            series.task = ResultSet(tasks.values())
+            self.taskseries[series.id] = series
+        else:
+            self.taskseries.pop(series.id, None)
+
+    def _delete_task(self, list_id, series_id, task_id, result):
+        series = self.taskseries.get(series_id)
+        if series is None or series.list_id != list_id:
+            return
+        remaining = ResultSet(t for t in series.task if t.id != task_id)
+        if len(remaining) == len(series.task):
+            return
+        self.tasks.pop(task_id, None)
+        result.deleted += 1
+        if remaining:
+            series.task = remaining
+        else:
+            del self.taskseries[series_id]
+
+class SyncEngine(object):
+    """Keep a Replica up to date with tasks.getList deltas.
+
+    The first sync downloads the account; later ones only ask for changes
+    since the previous sync with last_sync.
+
+    Args:
+        api - API instance.
+        replica - Replica to update (Default: a new empty one)
+        list_id, filter - passed through to tasks.getList.
+    """
+
+    def __init__(self, api, replica=None, list_id=None, filter=None):
+        self.api = api
+        if replica is None:
+            replica = Replica()
+        self.replica = replica
+        self.params = {}
+        if list_id is not None:
+            self.params['list_id'] = list_id
+        if filter is not None:
+            self.params['filter'] = filter
+
+    def sync(self):
+        """Fetch and apply changes; return a SyncResult."""
+
+        # The next last_sync is the local time before the request, so
+        # changes made while it is in flight are fetched again, less
+        # CLOCK_MARGIN for a client clock ahead of RTM's. The 'current' of
+        # a delta response is only the last_sync sent, not a server time.
+        started = datetime.datetime.now(datetime.timezone.utc).replace(
+                tzinfo=None, microsecond=0) - CLOCK_MARGIN
+
+        params = dict(self.params)
+        if self.replica.last_sync is not None:
+            params['last_sync'] = self.replica.last_sync.strftime(DATE_FORMAT)
+
+        result = self.replica.apply(self.api.tasks.getList(**params))
+        self.replica.last_sync = started
+        return result
@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+
+from milky.api import API, POST_AUTO, POST_ALWAYS
+from milky.fakertm import FakeRTM
+
+class PostTest(unittest.TestCase):
+
+    def _method(self, rtm, **params):
+        return rtm._http_request(rtm._prepare('rtm.tasks.notes.add',
+            params, 'token'))[0]
+
+    def test_get_by_default(self):
+        rtm = API('key', 'secret')
+        self.assertEqual(self._method(rtm, note_text='x' * 10000), 'GET')
+
+    def test_auto(self):
+        rtm = API('key', 'secret', post=POST_AUTO, post_threshold=300)
+        self.assertEqual(self._method(rtm, note_text='x'), 'GET')
+        self.assertEqual(self._method(rtm, note_text='x' * 300), 'POST')
+
+    def test_post_accepted(self):
+        with FakeRTM(lists=1, taskseries=1) as server:
+            rtm = API(server.api_key, server.shared_secret,
+                    token=server.token, api_url=server.url,
+                    post=POST_ALWAYS)
+            timeline = rtm.timelines.create()
+            rtm.transport.close()
+        self.assertTrue(timeline)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+import unittest
+
+from milky.api import API, PERMS_DELETE
+from milky.asyncapi import AsyncAPI, AsyncTransport
+from milky.error import RTMSystemError, ERRCODE_JSON, ERRCODE_NETWORK
+from milky.fakertm import FakeRTM
+
+class FailingParsePool(object):
+    """ParsePool stand-in taking every response and failing to parse it."""
+
+    def accepts(self, method, body):
+        return True
+
+    async def parse_async(self, body):
+        raise ValueError('broken worker')
+
+class ParsePoolTest(unittest.TestCase):
+
+    def test_parse_async_failure(self):
+        async def call(server):
+            rtm = AsyncAPI(server.api_key, server.shared_secret,
+                    token=server.token, api_url=server.url,
+                    parse_pool=FailingParsePool())
+            try:
+                await rtm.tasks.getList()
+            finally:
+                await rtm.close()
+
+        with FakeRTM(lists=1, taskseries=1) as server:
+            with self.assertRaises(RTMSystemError) as cm:
+                asyncio.run(call(server))
+        self.assertEqual(cm.exception.no, ERRCODE_JSON)
+
+class SlowConnectTransport(AsyncTransport):
+
+    async def _connect(self, key):
+        await asyncio.sleep(10)
+
+class TransportTest(unittest.TestCase):
+
+    def test_connect_timeout(self):
+        async def call():
+            rtm = AsyncAPI('key', 'secret', token='token',
+                    api_url='http://127.0.0.1:1/',
+                    transport=SlowConnectTransport(timeout=0.1))
+            try:
+                await rtm.tasks.getList()
+            finally:
+                await rtm.close()
+
+        with self.assertRaises(RTMSystemError) as cm:
+            asyncio.run(asyncio.wait_for(call(), 5))
+        self.assertEqual(cm.exception.no, ERRCODE_NETWORK)
+
+class SignatureTest(unittest.TestCase):
+
+    def test_positional_perms(self):
+        rtm = AsyncAPI('key', 'secret', PERMS_DELETE, None, 'token')
+        self.assertEqual(rtm.perms, PERMS_DELETE)
+        self.assertEqual(rtm.token, 'token')
+        self.assertTrue(isinstance(rtm.transport, AsyncTransport))
+
+class StreamTest(unittest.TestCase):
+
+    def _records(self, server, **kwargs):
+        async def call():
+            rtm = AsyncAPI(server.api_key, server.shared_secret,
+                    token=server.token, api_url=server.url)
+            try:
+                lists = [l async for l in rtm.stream_tasks(**kwargs)]
+                records = [r async for r in rtm.iter_tasks(**kwargs)]
+                return lists, records, rtm.transport.stats
+            finally:
+                await rtm.close()
+        return asyncio.run(call())
+
+    def test_same_as_api(self):
+        for compress in (0, 1):
+            with FakeRTM(lists=3, taskseries=20, compress=compress) as server:
+                rtm = API(server.api_key, server.shared_secret,
+                        token=server.token, api_url=server.url)
+                expected = [(r.list.id, r.taskseries.id, r.task.id)
+                        for r in rtm.iter_tasks()]
+                rtm.transport.close()
+                lists, records, stats = self._records(server,
+                        chunk_size=100)
+            self.assertEqual(len(lists), 3)
+            self.assertEqual([(r.list.id, r.taskseries.id, r.task.id)
+                    for r in records], expected)
+            # The connection is given back once a body is read to its end.
+            self.assertEqual(stats.reused, 1)
+
+if __name__ == '__main__':
+    unittest.main()
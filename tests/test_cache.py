@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+
+import multiprocessing
+import os
+import shutil
+import tempfile
+import unittest
+
+from milky.cache import ResponseCache, MemoryBackend, DiskBackend, MISSING
+
+def _params(method, **params):
+    params['method'] = method
+    params['api_sig'] = 'sig'
+    return params
+
+def _fill(path, first, count):
+    backend = DiskBackend(path, maxsize=30)
+    for i in range(first, first + count):
+        backend.set(('rtm.lists.getList', i), i, 1e12)
+
+class Clock(object):
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+class ResponseCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = Clock()
+        self.cache = ResponseCache(clock=self.clock,
+                ttls={'rtm.lists.getList': 60})
+
+    def test_ttl(self):
+        params = _params('rtm.lists.getList')
+        self.cache.set(params, 'lists')
+        self.clock.now += 59
+        self.assertEqual(self.cache.get(params), 'lists')
+        self.clock.now += 1
+        self.assertTrue(self.cache.get(params) is MISSING)
+        self.assertEqual((self.cache.stats.hits, self.cache.stats.misses),
+                (1, 1))
+
+    def test_uncached_method(self):
+        params = _params('rtm.tasks.getList')
+        self.cache.set(params, 'tasks')
+        self.assertTrue(self.cache.get(params) is MISSING)
+
+    def test_signature_ignored(self):
+        self.cache.set(_params('rtm.lists.getList'), 'lists')
+        params = _params('rtm.lists.getList')
+        params['api_sig'] = 'other'
+        self.assertEqual(self.cache.get(params), 'lists')
+
+    def test_invalidate(self):
+        lists = _params('rtm.lists.getList')
+        settings = _params('rtm.settings.getList')
+        self.cache.set(lists, 'lists')
+        self.cache.set(settings, 'settings')
+        self.cache.invalidate('rtm.lists.setName')
+        self.assertTrue(self.cache.get(lists) is MISSING)
+        self.assertEqual(self.cache.get(settings), 'settings')
+        self.cache.invalidate('rtm.transactions.undo')
+        self.assertTrue(self.cache.get(settings) is MISSING)
+
+class MemoryBackendTest(unittest.TestCase):
+
+    def test_lru(self):
+        backend = MemoryBackend(maxsize=2)
+        backend.set(('a', ), 1, 10)
+        backend.set(('b', ), 2, 10)
+        backend.get(('a', ))
+        backend.set(('c', ), 3, 10)
+        self.assertEqual(backend.get(('b', )), None)
+        self.assertEqual(backend.get(('a', )), (10, 1))
+        self.assertEqual(backend.get(('c', )), (10, 3))
+
+class DiskBackendTest(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_round_trip(self):
+        backend = DiskBackend(self.path)
+        key = ('rtm.lists.getList', (('api_key', 'key'), ))
+        backend.set(key, {'lists': [1, 2]}, 123.0)
+        self.assertEqual(backend.get(key), (123.0, {'lists': [1, 2]}))
+        backend.delete_prefix('rtm.lists.')
+        self.assertEqual(backend.get(key), None)
+
+    def test_maxsize(self):
+        backend = DiskBackend(self.path, maxsize=3)
+        for i in range(5):
+            backend.set(('rtm.lists.getList', i), i, 1e12)
+            # mtime orders the entries; keep them apart.
+            os.utime(backend._filename(('rtm.lists.getList', i)),
+                    (i, i))
+        self.assertEqual([i for i in range(5)
+            if backend.get(('rtm.lists.getList', i)) is not None],
+            [2, 3, 4])
+
+    def test_processes(self):
+        processes = [multiprocessing.Process(target=_fill,
+            args=(self.path, i * 20, 20)) for i in range(4)]
+        for p in processes:
+            p.start()
+        for p in processes:
+            p.join()
+        self.assertEqual([p.exitcode for p in processes], [0] * 4)
+        names = os.listdir(self.path)
+        self.assertEqual([n for n in names if n.endswith('.tmp')], [])
+        self.assertTrue(len(names) <= 30 + 4)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+
+import multiprocessing
+import os
+import shutil
+import tempfile
+import unittest
+
+from milky.api import API, PERMS_READ, PERMS_DELETE
+from milky.credentials import Credential, Credentials, FileStore, \
+        MemoryStore, covers
+from milky.fakertm import FakeRTM
+
+def _save_users(path, first, count):
+    store = FileStore(path)
+    for i in range(first, first + count):
+        store.set('key', 'user%d' % i, Credential(token='token%d' % i))
+
+class CoversTest(unittest.TestCase):
+
+    def test_order(self):
+        self.assertTrue(covers('delete', 'write'))
+        self.assertTrue(covers('write', 'write'))
+        self.assertFalse(covers('read', 'write'))
+        self.assertFalse(covers(None, 'read'))
+        self.assertTrue(covers(None, None))
+
+class StoredTokenTest(unittest.TestCase):
+
+    def _api(self, server, credentials, perms):
+        return API(server.api_key, server.shared_secret, perms,
+                api_url=server.url, credentials=credentials)
+
+    def test_fresh_token(self):
+        credentials = Credentials(MemoryStore())
+        with FakeRTM(lists=1, taskseries=1) as server:
+            credentials.store.set(server.api_key, u'', Credential(
+                token=server.token, perms=PERMS_READ,
+                checked=credentials.clock()))
+            rtm = self._api(server, credentials, PERMS_READ)
+            self.assertEqual(rtm.get_token(), server.token)
+            self.assertEqual(server.calls, {})
+
+    def test_weaker_perms(self):
+        credentials = Credentials(MemoryStore())
+        with FakeRTM(lists=1, taskseries=1) as server:
+            credentials.store.set(server.api_key, u'', Credential(
+                token='read-token', perms=PERMS_READ,
+                checked=credentials.clock()))
+            rtm = self._api(server, credentials, PERMS_DELETE)
+            # The read token is not used; a new one is asked for.
+            self.assertEqual(rtm.get_token(), server.token)
+            rtm.transport.close()
+            self.assertEqual(server.calls.get('rtm.auth.getToken'), 1)
+        stored = credentials.store.get(server.api_key, u'')
+        self.assertEqual((stored.token, stored.perms),
+                (server.token, PERMS_DELETE))
+
+class FileStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'credentials.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_processes(self):
+        # Writers in other processes do not lose each other's users.
+        processes = [multiprocessing.Process(target=_save_users,
+            args=(self.path, i * 20, 20)) for i in range(4)]
+        for p in processes:
+            p.start()
+        for p in processes:
+            p.join()
+        store = FileStore(self.path)
+        for i in range(80):
+            self.assertEqual(store.get('key', 'user%d' % i).token,
+                    'token%d' % i)
+        self.assertEqual(os.stat(self.path).st_mode & 0o777, 0o600)
+        self.assertEqual([f for f in os.listdir(self.directory)
+            if f.endswith('.tmp')], [])
+
+    def test_delete(self):
+        store = FileStore(self.path)
+        store.set('key', 'alice', Credential(token='a'))
+        store.delete('key', 'alice')
+        self.assertEqual(store.get('key', 'alice'), None)
+
+if __name__ == '__main__':
+    unittest.main()
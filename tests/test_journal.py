@@ -0,0 +1,210 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from milky.error import RTMRequestError, RTMSystemError, ERRCODE_NETWORK
+from milky.journal import FileJournal, JournalEntry, OfflineWriter, \
+        compact, supersede
+
+TASK = {'list_id': '1', 'taskseries_id': '2', 'task_id': '3'}
+
+class Crash(Exception):
+    """The process dies while a write is in flight."""
+
+class FakeTimelines(object):
+
+    def __init__(self, api):
+        self.api = api
+
+    def create(self):
+        if self.api.unreachable:
+            raise RTMSystemError('Cannot connect RTM.', ERRCODE_NETWORK)
+        return 'timeline'
+
+class FakeAPI(object):
+    """API stand-in recording the writes it accepts.
+
+    reject - {(method, params value): error code} of writes RTM rejects.
+    crash_after - writes accepted before Crash is raised.
+    """
+
+    def __init__(self, reject=None, crash_after=None):
+        self.sent = []
+        self.reject = reject or {}
+        self.crash_after = crash_after
+        self.unreachable = False
+        self.timelines = FakeTimelines(self)
+
+    def _get(self, method, auth_required, model_cls, params):
+        if self.crash_after is not None \
+                and len(self.sent) == self.crash_after:
+            raise Crash()
+        value = params.get('priority', params.get('name'))
+        code = self.reject.get((method, value))
+        if code is not None:
+            raise RTMRequestError('rejected', code)
+        self.sent.append((method, value))
+        return (method, value), None
+
+class AsyncFakeTimelines(FakeTimelines):
+
+    async def create(self):
+        return FakeTimelines.create(self)
+
+class AsyncFakeAPI(FakeAPI):
+
+    def __init__(self, *args, **kwargs):
+        super(AsyncFakeAPI, self).__init__(*args, **kwargs)
+        self.timelines = AsyncFakeTimelines(self)
+
+    async def _get(self, *args):
+        return FakeAPI._get(self, *args)
+
+def _entry(seq, method, **params):
+    params.update(TASK)
+    return JournalEntry(seq, 'rtm.tasks.%s' % method, params)
+
+class CompactTest(unittest.TestCase):
+
+    def test_last_write_wins(self):
+        entries = [_entry(1, 'setPriority', priority='1'),
+                _entry(2, 'setName', name='a'),
+                _entry(3, 'movePriority', direction='up'),
+                _entry(4, 'setPriority', priority='2')]
+        self.assertEqual([e.seq for e in compact(entries)], [2, 4])
+        self.assertEqual(supersede(entries), {1: 4, 3: 4})
+
+    def test_delete(self):
+        entries = [_entry(1, 'setName', name='a'),
+                _entry(2, 'complete'),
+                _entry(3, 'delete')]
+        self.assertEqual([e.seq for e in compact(entries)], [3])
+
+    def test_other_tasks_kept(self):
+        other = JournalEntry(2, 'rtm.tasks.setPriority', {'list_id': '1',
+            'taskseries_id': '2', 'task_id': '4', 'priority': '3'})
+        entries = [_entry(1, 'setPriority', priority='1'), other]
+        self.assertEqual(compact(entries), entries)
+
+class ReplayTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'journal')
+        self.journals = []
+
+    def tearDown(self):
+        for journal in self.journals:
+            journal.close()
+        shutil.rmtree(self.directory)
+
+    def _writer(self, api, journal=None):
+        if journal is None:
+            journal = FileJournal(self.path, fsync=False)
+            self.journals.append(journal)
+        return OfflineWriter(api, journal)
+
+    def test_order(self):
+        api = FakeAPI()
+        writer = self._writer(api)
+        for name in ('a', 'b'):
+            writer.tasks.setName(name=name, **TASK)
+            writer.tasks.setPriority(priority=name, **TASK)
+        writer.lists.add(name='list')
+        writer.tasks.complete(**TASK)
+        result = writer.replay()
+        self.assertEqual(api.sent, [('rtm.tasks.setName', 'b'),
+            ('rtm.tasks.setPriority', 'b'), ('rtm.lists.add', 'list'),
+            ('rtm.tasks.complete', None)])
+        self.assertEqual(len(result.dropped), 2)
+        self.assertEqual(len(writer), 0)
+
+    def test_unreachable(self):
+        api = FakeAPI()
+        api.unreachable = True
+        writer = self._writer(api)
+        writer.tasks.setPriority(priority='1', **TASK)
+        writer.tasks.setPriority(priority='2', **TASK)
+        result = writer.replay()
+        # Nothing replaced the first write yet: both stay.
+        self.assertEqual((result.pending, len(result.dropped)), (2, 0))
+        api.unreachable = False
+        writer.replay()
+        self.assertEqual(api.sent, [('rtm.tasks.setPriority', '2')])
+
+    def test_rejected_replacement(self):
+        # The replaced write is sent when RTM rejects its replacement.
+        api = FakeAPI(reject={('rtm.tasks.setPriority', '9'): 4040})
+        writer = self._writer(api)
+        writer.tasks.setPriority(priority='1', **TASK)
+        writer.tasks.setName(name='a', **TASK)
+        writer.tasks.setPriority(priority='9', **TASK)
+        result = writer.replay()
+        self.assertEqual(api.sent, [('rtm.tasks.setName', 'a'),
+            ('rtm.tasks.setPriority', '1')])
+        self.assertEqual((len(result.failed), len(result.dropped)), (1, 0))
+        self.assertEqual(len(writer), 0)
+
+    def test_crash(self):
+        api = FakeAPI(crash_after=2)
+        writer = self._writer(api)
+        writer.tasks.setPriority(priority='1', **TASK)
+        writer.tasks.setName(name='a', **TASK)
+        writer.lists.add(name='list')
+        writer.tasks.setPriority(priority='2', **TASK)
+        with self.assertRaises(Crash):
+            writer.replay()
+        writer.journal.close()
+
+        # A restart reads what the crash left: the write in flight and
+        # the one it replaces are still there.
+        journal = FileJournal(self.path, fsync=False)
+        self.journals.append(journal)
+        self.assertEqual([(e.method, e.params['priority'])
+            for e in journal.pending()],
+            [('rtm.tasks.setPriority', '1'), ('rtm.tasks.setPriority', '2')])
+        api = FakeAPI()
+        result = self._writer(api, journal).replay()
+        self.assertEqual(api.sent, [('rtm.tasks.setPriority', '2')])
+        self.assertEqual([e.seq for e in result.dropped], [1])
+        journal.close()
+        journal = FileJournal(self.path)
+        self.journals.append(journal)
+        self.assertEqual(len(journal), 0)
+
+    def test_compacted_after_replay(self):
+        writer = self._writer(FakeAPI())
+        for i in range(10):
+            writer.lists.add(name='list%d' % i)
+        writer.replay()
+        writer.lists.add(name='last')
+        writer.journal.close()
+        with open(self.path) as f:
+            # The sent writes and their done records are gone.
+            self.assertEqual(len(f.readlines()), 1)
+        self.assertEqual([f for f in os.listdir(self.directory)
+            if f.endswith('.tmp')], [])
+
+    def test_async_lock(self):
+        api = AsyncFakeAPI()
+        writer = self._writer(api)
+        writer.tasks.setName(name='a', **TASK)
+
+        async def replay():
+            return await writer.replay_async()
+
+        writer._replay_lock.acquire()
+        timer = threading.Timer(0.1, writer._replay_lock.release)
+        timer.start()
+        result = asyncio.run(replay())
+        timer.join()
+        self.assertEqual(len(result.sent), 1)
+        self.assertTrue(writer._replay_lock.acquire(blocking=False))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+
+from milky import models
+from milky.fakertm import synthetic_tasks
+from milky.tests import legacy_models
+
+def _state(obj):
+    """Comparable form of models, old or new, and the lists holding them."""
+
+    if isinstance(obj, (models.ModelBase, legacy_models.ModelBase)):
+        state = dict((k, _state(v)) for (k, v) in obj.__getstate__().items())
+        if obj.__class__.__name__ == 'Recurrence':
+            # The compiled rule is new. byday was the string matched by
+            # the monthly pattern ('MO' for 'MO,WE'), it is now the list
+            # of every day; the old value is the first of them.
+            state.pop('rule', None)
+            if isinstance(state.get('byday'), list):
+                state['byday'] = state['byday'][0]
+        return (obj.__class__.__name__, state)
+    if isinstance(obj, list):
+        return [_state(v) for v in obj]
+    return obj
+
+TASKS = synthetic_tasks(lists=3, taskseries=30)
+
+TASKSERIES = {
+    'id': '1', 'created': '2009-05-07T10:19:54Z', 'modified': '',
+    'name': 'Series', 'source': 'js', 'url': 'http://example.com/',
+    'location_id': '7',
+    'rrule': {'every': '0', '$t': 'FREQ=MONTHLY;INTERVAL=2;BYDAY=-1FR'},
+    'tags': {'tag': ['home', 'call']},
+    'notes': {'note': {'id': '3', 'created': '2009-05-07T10:19:54Z',
+        'modified': '2009-05-07T10:19:54Z', 'title': '', '$t': 'Text'}},
+    'participants': {'contact': [{'id': '4', 'fullname': 'Omar Kilani',
+        'username': 'omar'}]},
+    'task': [
+        {'id': '2', 'due': '2009-05-08T00:00:00Z', 'has_due_time': '0',
+            'added': '2009-05-07T10:19:54Z', 'completed': '', 'deleted': '',
+            'priority': '2', 'postponed': '3', 'estimate': '2 days 4h'},
+        {'id': '5', 'due': '', 'has_due_time': '1',
+            'added': '2009-05-07T10:19:54Z', 'completed': '', 'deleted': '',
+            'priority': 'N', 'postponed': '0', 'estimate': 'soon'}, ],
+    }
+
+# (model name, rsp) pairs, in the shapes the REST JSON format answers.
+RESPONSES = [
+    ('Tasks', TASKS),
+    ('Tasks', {'tasks': {'rev': 'r', 'list': {'id': '9',
+        'taskseries': TASKSERIES}}}),
+    ('Tasks', {'tasks': {'rev': 'r'}}),
+    ('TaskList', {'list': {'id': '9', 'taskseries': [TASKSERIES]}}),
+    ('Auth', {'auth': {'token': 't', 'perms': 'delete',
+        'user': {'id': '1', 'username': 'bob', 'fullname': ''}}}),
+    ('Lists', {'lists': {'list': [
+        {'id': '100', 'name': 'Inbox', 'deleted': '0', 'locked': '1',
+            'archived': '0', 'position': '-1', 'smart': '0',
+            'sort_order': '0'},
+        {'id': '101', 'name': 'Smart', 'deleted': '0', 'locked': '0',
+            'archived': '1', 'position': '0', 'smart': '1',
+            'sort_order': '2', 'filter': '(priority:1)'}, ]}}),
+    ('Lists', {'lists': []}),
+    ('Contacts', {'contacts': {'contact': {'id': '4',
+        'fullname': 'Omar Kilani', 'username': 'omar'}}}),
+    ('Groups', {'groups': {'group': [{'id': '5', 'name': 'Friends',
+        'contacts': {'contact': [{'id': '4'}]}}]}}),
+    ('Method', {'method': {'name': 'rtm.test.echo', 'needslogin': '0',
+        'needssigning': '1', 'requiredperms': '0', 'description': 'Echo',
+        'response': '', 'arguments': {'argument': [{'name': 'api_key',
+            'optional': '0', '$t': 'Your API key.'}]},
+        'errors': {'error': {'code': '100', 'message': 'Invalid API Key',
+            '$t': 'The API key passed was not valid.'}}}}),
+    ('Timezones', {'timezones': {'timezone': [{'id': '216',
+        'name': 'Asia/Hong_Kong', 'dst': '0', 'offset': '28800',
+        'current_offset': '28800'}]}}),
+    ('Time', {'time': {'timezone': 'UTC', '$t': '2009-05-07T10:19:54'}}),
+    ('Locations', {'locations': {'location': [{'id': '1', 'name': 'Home',
+        'longitude': '151.2', 'latitude': '-33.8', 'zoom': '12',
+        'address': '', 'viewable': '1'}]}}),
+    ('Settings', {'settings': {'timezone': 'Australia/Sydney',
+        'dateformat': '0', 'timeformat': '1', 'defaultlist': '100',
+        'language': 'en'}}),
+    ('Frob', {'frob': 'f'}),
+    ('Timeline', {'timeline': '12'}),
+    ('Stat', {'stat': 'ok'}), ]
+
+class LegacyTest(unittest.TestCase):
+    """The schema tables parse every response as the old parsers did."""
+
+    def test_responses(self):
+        for name, rsp in RESPONSES:
+            new = getattr(models, name)._parse(rsp)
+            old = getattr(legacy_models, name)._parse(rsp)
+            self.assertEqual(_state(new), _state(old), name)
+
+    def test_lazy_taskseries(self):
+        new = models.LazyTaskSeries._parse(TASKSERIES)
+        # Parse what is kept raw, as any reader would.
+        new.notes, new.participants, new.rrule
+        old = legacy_models.TaskSeries._parse(TASKSERIES)
+        self.assertEqual(_state(new)[1], _state(old)[1])
+
+    def test_single_tag(self):
+        # The old parser made a ResultSet of the tag's characters.
+        json = {'id': '1', 'tags': {'tag': 'home'}}
+        self.assertEqual(list(legacy_models.TaskSeries._parse(json).tags),
+                ['h', 'o', 'm', 'e'])
+        self.assertEqual(models.TaskSeries._parse(json).tags, ['home'])
+
+    def test_byday(self):
+        rrule = {'every': '1', '$t': 'FREQ=WEEKLY;INTERVAL=1;BYDAY=MO,WE'}
+        self.assertEqual(legacy_models.Recurrence._parse(rrule).byday, 'MO')
+        self.assertEqual(models.Recurrence._parse(rrule).byday, ['MO', 'WE'])
+
+if __name__ == '__main__':
+    unittest.main()
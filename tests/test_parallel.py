@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+
+import json
+import pickle
+import unittest
+
+from milky import models
+from milky.fakertm import synthetic_tasks
+from milky.models import ModelBase, TaskList, _restore
+from milky.parallel import ParsePool, _runs
+
+def _state(obj):
+    """Comparable form of models and the lists holding them."""
+
+    if isinstance(obj, ModelBase):
+        return (obj.__class__.__name__, dict((k, _state(v))
+            for (k, v) in obj.__getstate__().items()))
+    if isinstance(obj, list):
+        return [_state(v) for v in obj]
+    return obj
+
+class ParsePoolTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.pool = ParsePool(max_workers=2, share_size=1)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.pool.close()
+
+    def _body(self, rsp):
+        return json.dumps({'rsp': rsp}).encode('utf-8')
+
+    def test_same_as_inline(self):
+        body = self._body(synthetic_tasks(lists=5, taskseries=20))
+        rsp = self.pool.parse(body)
+        expected = [TaskList._parse(obj) for obj in
+                json.loads(body)['rsp']['tasks']['list']]
+        self.assertTrue(isinstance(rsp['tasks']['list'], models.ResultSet))
+        self.assertEqual(_state(list(rsp['tasks']['list'])),
+                _state(expected))
+        self.assertEqual(rsp['stat'], 'ok')
+
+    def test_error(self):
+        rsp = self.pool.parse(self._body({'stat': 'fail',
+            'err': {'code': '98', 'msg': 'Login failed'}}))
+        self.assertEqual(rsp['err']['code'], '98')
+
+    def test_not_json(self):
+        with self.assertRaises(ValueError):
+            self.pool.parse(b'{"rsp": ')
+
+    def test_runs(self):
+        texts = ['a' * 10, 'b' * 10, 'c' * 30, 'd' * 10]
+        runs = _runs(texts, 2)
+        self.assertEqual(sum(runs, []), texts)
+        self.assertEqual(len(runs), 2)
+        self.assertEqual(_runs(texts[:1], 4), [texts[:1]])
+
+class PickleTest(unittest.TestCase):
+
+    def test_round_trip(self):
+        tasklist = TaskList._parse(synthetic_tasks(lists=1,
+            taskseries=3)['tasks']['list'][0])
+        tasklist.note = 'kept in _extra'
+        copy = pickle.loads(pickle.dumps(tasklist, pickle.HIGHEST_PROTOCOL))
+        self.assertEqual(_state(copy), _state(tasklist))
+
+    def test_fields_by_name(self):
+        # A pickle from before a field was added, renamed or reordered.
+        names = ('name', 'gone', 'id')
+        tasklist = _restore(TaskList, names, ('Inbox', 'old', '1'), None)
+        self.assertEqual((tasklist.id, tasklist.name), ('1', 'Inbox'))
+        self.assertEqual(tasklist.gone, 'old')
+        self.assertRaises(AttributeError, getattr, tasklist, 'deleted')
+
+if __name__ == '__main__':
+    unittest.main()
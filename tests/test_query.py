@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+
+import datetime
+import unittest
+
+from milky.fakertm import synthetic_tasks
+from milky.models import List, Tasks
+from milky.query import FilterError, TaskStore, parse_filter
+
+TASKS = Tasks._parse(synthetic_tasks(lists=3, taskseries=100))
+
+LISTS = [List._parse({'id': '100', 'name': 'Inbox'}),
+        List._parse({'id': '101', 'name': 'Home stuff'})]
+
+def _records():
+    return [(tasklist, series, task) for tasklist in TASKS.lists
+            for series in tasklist.taskseries for task in series.task]
+
+class TaskStoreTest(unittest.TestCase):
+
+    def _store(self, **kwargs):
+        return TaskStore.from_tasks(TASKS, lists=LISTS, **kwargs)
+
+    def _check(self, store, text, predicate):
+        """The store answers text as a scan with predicate would."""
+
+        expected = [(series.id, task.id) for (tasklist, series, task)
+                in _records() if predicate(tasklist, series, task)]
+        found = [(r.taskseries.id, r.task.id) for r in store.query(text)]
+        self.assertEqual(found, expected, text)
+        self.assertEqual(store.count(text), len(expected), text)
+        self.assertTrue(expected, text)
+
+    def test_terms(self):
+        store = self._store()
+        self.assertEqual(len(store), len(_records()))
+        self._check(store, 'tag:work', lambda l, s, t: 'work' in s.tags)
+        self._check(store, 'tag:WORK', lambda l, s, t: 'work' in s.tags)
+        self._check(store, 'priority:1', lambda l, s, t: t.priority == 1)
+        self._check(store, 'priority:none',
+                lambda l, s, t: t.priority is None)
+        self._check(store, 'status:completed',
+                lambda l, s, t: t.completed is not None)
+        self._check(store, 'status:incomplete',
+                lambda l, s, t: t.completed is None)
+        self._check(store, 'list:inbox', lambda l, s, t: l.id == 100)
+        self._check(store, 'list:"Home stuff"', lambda l, s, t: l.id == 101)
+        self._check(store, 'list:102', lambda l, s, t: l.id == 102)
+        self._check(store, 'due:never', lambda l, s, t: t.due is None)
+        self.assertEqual(store.query('tag:missing'), [])
+        self.assertEqual(store.query('list:missing'), [])
+
+    def test_operators(self):
+        store = self._store()
+        self._check(store, 'tag:work AND (priority:1 OR status:completed)',
+                lambda l, s, t: 'work' in s.tags and (t.priority == 1
+                    or t.completed is not None))
+        self._check(store, 'tag:work priority:2',
+                lambda l, s, t: 'work' in s.tags and t.priority == 2)
+        self._check(store, 'NOT tag:work OR NOT priority:none',
+                lambda l, s, t: 'work' not in s.tags
+                    or t.priority is not None)
+        self._check(store, 'not (list:inbox or list:101)',
+                lambda l, s, t: l.id == 102)
+
+    def test_dates(self):
+        day = [t.due for (l, s, t) in _records() if t.due][0].date()
+        start = datetime.datetime.combine(day, datetime.time())
+        end = start + datetime.timedelta(days=1)
+        store = self._store(today=lambda: day)
+        self._check(store, 'due:today',
+                lambda l, s, t: t.due and start <= t.due < end)
+        self._check(store, 'due:%s' % day.isoformat(),
+                lambda l, s, t: t.due and start <= t.due < end)
+        self._check(store, 'dueBefore:tomorrow',
+                lambda l, s, t: t.due and t.due < end)
+        self._check(store, 'dueAfter:yesterday',
+                lambda l, s, t: t.due and t.due >= start)
+        self._check(store, 'completedBefore:2012-01-01',
+                lambda l, s, t: t.completed
+                    and t.completed < datetime.datetime(2012, 1, 1))
+
+    def test_utcoffset(self):
+        # With UTC+10 a local day starts at 14:00 UTC the day before.
+        offset = datetime.timedelta(hours=10)
+        due = [t.due for (l, s, t) in _records() if t.due][0]
+        day = (due + offset).date()
+        start = datetime.datetime.combine(day, datetime.time()) - offset
+        end = start + datetime.timedelta(days=1)
+        store = self._store(utcoffset=offset, today=lambda: day)
+        self._check(store, 'due:today',
+                lambda l, s, t: t.due and start <= t.due < end)
+
+    def test_deleted(self):
+        records = _records()
+        tasks = Tasks._parse(synthetic_tasks(lists=1, taskseries=1))
+        tasklist = tasks.lists[0]
+        series = tasklist.taskseries[0]
+        series.task[0].deleted = datetime.datetime(2011, 1, 1)
+        store = TaskStore(records + [(tasklist, series, series.task[0])])
+        self.assertEqual(len(store), len(records))
+
+    def test_errors(self):
+        store = self._store()
+        for text in ('work', 'tag:a AND (tag:b', 'tag:a )', 'bogus:1',
+                'tag:a OR', ''):
+            self.assertRaises(FilterError, parse_filter, text)
+        for text in ('priority:high', 'status:done', 'due:someday'):
+            self.assertRaises(FilterError, store.query, text)
+        self.assertTrue(issubclass(FilterError, ValueError))
+
+if __name__ == '__main__':
+    unittest.main()
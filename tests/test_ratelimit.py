@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+import threading
+import unittest
+
+from milky.ratelimit import PRIORITY_BULK, Scheduler, TokenBucket
+
+class Clock(object):
+
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+class TokenBucketTest(unittest.TestCase):
+
+    def test_refill(self):
+        clock = Clock()
+        bucket = TokenBucket(rate=2, burst=2, clock=clock)
+        bucket.take()
+        bucket.take()
+        self.assertEqual(bucket.delay(), 0.5)
+        clock.now += 0.25
+        self.assertEqual(bucket.delay(), 0.25)
+        # Never more than burst tokens after an idle period.
+        clock.now += 60
+        bucket.take()
+        bucket.take()
+        self.assertEqual(bucket.delay(), 0.5)
+
+class SchedulerTest(unittest.TestCase):
+
+    def _grants(self, scheduler, clock, tickets):
+        """Tickets in the order the scheduler grants them."""
+
+        order = []
+        while len(order) < len(tickets):
+            for name, ticket in tickets:
+                if name in order:
+                    continue
+                with scheduler._cond:
+                    if scheduler._poll(ticket) is None:
+                        order.append(name)
+            clock.now += 1.0
+        return order
+
+    def test_priority(self):
+        clock = Clock()
+        scheduler = Scheduler(clock=clock)
+        tickets = [('bulk', scheduler._enqueue('a', PRIORITY_BULK)),
+                ('interactive', scheduler._enqueue('b', 0))]
+        self.assertEqual(self._grants(scheduler, clock, tickets),
+                ['interactive', 'bulk'])
+
+    def test_clients_take_turns(self):
+        clock = Clock()
+        scheduler = Scheduler(clock=clock)
+        tickets = [('a1', scheduler._enqueue('a', 0)),
+                ('a2', scheduler._enqueue('a', 0)),
+                ('a3', scheduler._enqueue('a', 0)),
+                ('b1', scheduler._enqueue('b', 0))]
+        self.assertEqual(self._grants(scheduler, clock, tickets),
+                ['a1', 'b1', 'a2', 'a3'])
+        self.assertEqual(scheduler.queue_depth(), 0)
+        self.assertEqual(scheduler.stats.granted, 4)
+        self.assertEqual(scheduler.stats.max_wait, 3.0)
+
+    def test_threads(self):
+        scheduler = Scheduler(rate=1000, burst=1)
+
+        def run(client):
+            for i in range(5):
+                scheduler.acquire(client, i % 2)
+
+        threads = [threading.Thread(target=run, args=(n, ))
+                for n in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(scheduler.stats.granted, 15)
+        self.assertEqual(scheduler.queue_depth(), 0)
+
+    def test_async_cancel(self):
+        scheduler = Scheduler(rate=1, burst=1)
+
+        async def run():
+            await scheduler.acquire_async('a')
+            with self.assertRaises(asyncio.TimeoutError):
+                await asyncio.wait_for(scheduler.acquire_async('b'), 0.05)
+
+        asyncio.run(run())
+        # The cancelled request does not hold up the queue.
+        self.assertEqual(scheduler.queue_depth(), 0)
+        self.assertEqual(scheduler.stats.granted, 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+
+import datetime
+import pickle
+import unittest
+
+from milky.models import Recurrence, Task, TaskSeries
+from milky.recurrence import expand, parse_rule
+
+def _dt(*args):
+    return datetime.datetime(*args)
+
+def _days(rule, start, count=None, before=None):
+    """(month, day) of the first count occurrences."""
+
+    occurrences = parse_rule(rule).occurrences(start, before=before)
+    days = []
+    for occurrence in occurrences:
+        days.append((occurrence.month, occurrence.day))
+        if count is not None and len(days) >= count:
+            break
+    return days
+
+class RuleTest(unittest.TestCase):
+
+    def test_daily(self):
+        self.assertEqual(list(parse_rule('FREQ=DAILY;INTERVAL=2;COUNT=3')
+            .occurrences(_dt(2012, 1, 30, 10))),
+            [_dt(2012, 1, 30, 10), _dt(2012, 2, 1, 10), _dt(2012, 2, 3, 10)])
+
+    def test_weekly(self):
+        self.assertEqual(_days('FREQ=WEEKLY;INTERVAL=1;BYDAY=MO,WE',
+            _dt(2012, 1, 4, 9), before=_dt(2012, 1, 17)),
+            [(1, 4), (1, 9), (1, 11), (1, 16)])
+        # Every other week, from a Thursday: the Monday before is skipped.
+        self.assertEqual(_days('FREQ=WEEKLY;INTERVAL=2;BYDAY=MO,TH',
+            _dt(2012, 1, 5), 4), [(1, 5), (1, 16), (1, 19), (1, 30)])
+        self.assertEqual(_days('FREQ=WEEKLY', _dt(2012, 1, 5), 2),
+                [(1, 5), (1, 12)])
+
+    def test_monthly(self):
+        self.assertEqual(_days('FREQ=MONTHLY;BYDAY=-1FR', _dt(2012, 1, 27),
+            3), [(1, 27), (2, 24), (3, 30)])
+        self.assertEqual(_days('FREQ=MONTHLY;BYDAY=2TU', _dt(2012, 1, 10),
+            3), [(1, 10), (2, 14), (3, 13)])
+        self.assertEqual(_days('FREQ=MONTHLY;BYMONTHDAY=-1',
+            _dt(2012, 1, 31), 3), [(1, 31), (2, 29), (3, 31)])
+        # Months without a 31st are skipped.
+        self.assertEqual(_days('FREQ=MONTHLY;BYMONTHDAY=31',
+            _dt(2012, 1, 31), 3), [(1, 31), (3, 31), (5, 31)])
+        self.assertEqual(_days('FREQ=MONTHLY', _dt(2012, 1, 15), 2),
+                [(1, 15), (2, 15)])
+
+    def test_yearly(self):
+        self.assertEqual([o.year for o in parse_rule(
+            'FREQ=YEARLY;COUNT=2').occurrences(_dt(2012, 2, 29))],
+            [2012, 2016])
+
+    def test_until(self):
+        # A plain date covers its whole day, a datetime only that instant.
+        self.assertEqual(len(list(parse_rule('FREQ=DAILY;UNTIL=20120105')
+            .occurrences(_dt(2012, 1, 1, 10)))), 5)
+        self.assertEqual(len(list(parse_rule(
+            'FREQ=DAILY;UNTIL=20120105T000000Z')
+            .occurrences(_dt(2012, 1, 1, 10)))), 4)
+
+    def test_window(self):
+        # Skipping to the window gives what filtering the whole run gives.
+        start = _dt(2012, 1, 31, 8)
+        after = _dt(2013, 6, 1)
+        before = _dt(2015, 1, 1)
+        for text in ('FREQ=DAILY;INTERVAL=3', 'FREQ=WEEKLY;BYDAY=MO,FR',
+                'FREQ=WEEKLY;INTERVAL=3;BYDAY=SU', 'FREQ=MONTHLY;BYDAY=-1FR',
+                'FREQ=MONTHLY;INTERVAL=2;BYMONTHDAY=31',
+                'FREQ=YEARLY;INTERVAL=1', 'FREQ=DAILY;COUNT=600'):
+            rule = parse_rule(text)
+            expected = [o for o in rule.occurrences(start, before=before)
+                    if o >= after]
+            self.assertTrue(expected, text)
+            self.assertEqual(rule.between(start, after, before), expected,
+                    text)
+
+    def test_no_occurrences(self):
+        # April never has a 31st: the generator ends on its own.
+        self.assertEqual(list(parse_rule(
+            'FREQ=MONTHLY;INTERVAL=12;BYMONTHDAY=31')
+            .occurrences(_dt(2012, 4, 15))), [])
+        self.assertEqual(list(parse_rule('FREQ=HOURLY')
+            .occurrences(_dt(2012, 1, 1))), [])
+        self.assertEqual(list(parse_rule('FREQ=DAILY').occurrences(None)), [])
+
+    def test_shared(self):
+        rule = parse_rule('FREQ=WEEKLY;BYDAY=MO')
+        self.assertTrue(parse_rule('FREQ=WEEKLY;BYDAY=MO') is rule)
+        self.assertTrue(pickle.loads(pickle.dumps(rule)) is rule)
+        self.assertEqual(rule.byday, ('MO', ))
+
+class ExpandTest(unittest.TestCase):
+
+    def _record(self, due, completed=''):
+        series = TaskSeries._parse({'id': '1', 'rrule': {'every': '1',
+            '$t': 'FREQ=WEEKLY;BYDAY=MO'}})
+        task = Task._parse({'id': '2', 'due': due, 'completed': completed})
+        return (None, series, task)
+
+    def test_expand(self):
+        pending = self._record('2012-01-02T09:00:00Z')
+        done = self._record('2012-01-02T09:00:00Z', '2012-01-02T10:00:00Z')
+        occurrences = list(expand([pending, done], _dt(2012, 1, 3),
+            _dt(2012, 1, 17)))
+        self.assertEqual(occurrences, [(pending, _dt(2012, 1, 9, 9)),
+            (pending, _dt(2012, 1, 16, 9))])
+        self.assertTrue(isinstance(pending[1].rrule, Recurrence))
+
+if __name__ == '__main__':
+    unittest.main()
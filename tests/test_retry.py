@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+import unittest
+
+from milky.error import MilkyError, ERRCODE_NETWORK, ERRCODE_LOGIN_FAILED
+from milky.retry import RetryPolicy
+
+class Clock(object):
+
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, delay):
+        self.sleeps.append(delay)
+        self.now += delay
+
+def _failing(times, no=ERRCODE_NETWORK):
+    """fn() raising MilkyError(no) times before it returns 'ok'."""
+
+    calls = []
+
+    def fn():
+        calls.append(1)
+        if len(calls) <= times:
+            raise MilkyError('failed', no)
+        return 'ok'
+    return fn, calls
+
+class RetryPolicyTest(unittest.TestCase):
+
+    def _policy(self, **kwargs):
+        clock = Clock()
+        return RetryPolicy(clock=clock, sleep=clock.sleep, **kwargs), clock
+
+    def test_recovered(self):
+        policy, clock = self._policy()
+        fn, calls = _failing(2)
+        self.assertEqual(policy.call('rtm.tasks.getList', False, fn), 'ok')
+        self.assertEqual(len(calls), 3)
+        self.assertEqual(len(clock.sleeps), 2)
+        stats = policy.stats['rtm.tasks.getList']
+        self.assertEqual((stats.calls, stats.retries, stats.recovered,
+            stats.failures), (1, 2, 1, 0))
+
+    def test_max_attempts(self):
+        policy, clock = self._policy(max_attempts=3)
+        fn, calls = _failing(5)
+        self.assertRaises(MilkyError, policy.call, 'm', False, fn)
+        self.assertEqual(len(calls), 3)
+        self.assertEqual(policy.stats['m'].failures, 1)
+
+    def test_not_retryable(self):
+        policy, clock = self._policy()
+        fn, calls = _failing(1, ERRCODE_LOGIN_FAILED)
+        self.assertRaises(MilkyError, policy.call, 'm', False, fn)
+        self.assertEqual(len(calls), 1)
+
+    def test_writes(self):
+        policy, clock = self._policy()
+        fn, calls = _failing(1)
+        self.assertRaises(MilkyError, policy.call, 'm', True, fn)
+        self.assertEqual(len(calls), 1)
+
+        policy, clock = self._policy(retry_writes=True)
+        fn, calls = _failing(1)
+        self.assertEqual(policy.call('m', True, fn), 'ok')
+
+    def test_deadline(self):
+        # Backoffs of 1 s; the third would pass the deadline.
+        policy, clock = self._policy(max_attempts=10, base_delay=1.0,
+                max_delay=1.0, deadline=2.5)
+        policy.backoff = lambda attempt: 1.0
+        fn, calls = _failing(10)
+        self.assertRaises(MilkyError, policy.call, 'm', False, fn)
+        self.assertEqual(clock.sleeps, [1.0, 1.0])
+        self.assertEqual(len(calls), 3)
+
+    def test_backoff(self):
+        policy, clock = self._policy(base_delay=0.5, max_delay=3.0)
+        for attempt, bound in ((1, 0.5), (2, 1.0), (3, 2.0), (6, 3.0)):
+            for i in range(50):
+                self.assertTrue(0 <= policy.backoff(attempt) <= bound)
+
+    def test_async(self):
+        policy, clock = self._policy(base_delay=0.001)
+        fn, calls = _failing(2)
+
+        async def afn():
+            return fn()
+
+        result = asyncio.run(policy.call_async('m', False, afn))
+        self.assertEqual(result, 'ok')
+        self.assertEqual(policy.stats['m'].recovered, 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+
+import hashlib
+import random
+import unittest
+import urllib.parse
+
+from milky.signing import Signer, encode_query, quote
+
+def _reference(secret, params):
+    text = secret + ''.join('%s%s' % (k, params[k])
+            for k in sorted(params, key=str.lower))
+    return hashlib.md5(text.encode('utf-8')).hexdigest()
+
+def _text(r, n):
+    alphabet = u'aZ09 _.-~+&=%/?#ÜéÑ中 \U0001F600\'"\n\t'
+    return u''.join(r.choice(alphabet) for i in range(n))
+
+class SignerTest(unittest.TestCase):
+
+    def test_reference(self):
+        r = random.Random(3)
+        signer = Signer(u'sécret')
+        for n in range(100):
+            params = dict(('k%s' % _text(r, 3), _text(r, r.randint(0, 30)))
+                    for i in range(r.randint(1, 8)))
+            params['Mixed'] = 7
+            self.assertEqual(signer.sign(params),
+                    _reference(u'sécret', params))
+
+    def test_signed(self):
+        signer = Signer('secret')
+        params = {'method': 'rtm.test.echo', 'api_key': 'key', 'b': 1}
+        pairs = signer.signed(params)
+        self.assertEqual([k for (k, v) in pairs],
+                ['api_key', 'b', 'method', 'api_sig'])
+        self.assertEqual(pairs[-1][1], _reference('secret', params))
+
+class QueryTest(unittest.TestCase):
+
+    def test_quote(self):
+        r = random.Random(5)
+        for n in range(500):
+            text = _text(r, r.randint(0, 40))
+            self.assertEqual(quote(text), urllib.parse.quote_plus(text))
+        self.assertEqual(quote(u''), u'')
+        self.assertEqual(quote(u'plain-Text_1.0~'), u'plain-Text_1.0~')
+
+    def test_encode_query(self):
+        pairs = [(u'api_key', u'key'), (u'note_text', u'Ünï code & more'),
+                (u'tags', u'a,b'), (u'api_sig', u'0123')]
+        self.assertEqual(encode_query(pairs), urllib.parse.urlencode(pairs))
+        self.assertEqual(encode_query([]), u'')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+import threading
+import time
+import unittest
+
+from milky.api import API
+from milky.singleflight import SingleFlight, coalescable
+
+def _wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError('timed out')
+        time.sleep(0.001)
+
+class SingleFlightTest(unittest.TestCase):
+
+    def _run(self, flight, fn, callers):
+        """Results of callers threads calling flight.do('k', fn) while
+        the first one is inside fn."""
+
+        results = [None] * callers
+
+        def run(i):
+            try:
+                results[i] = flight.do('k', fn)
+            except Exception as e:
+                results[i] = e
+
+        threads = [threading.Thread(target=run, args=(i, ))
+                for i in range(callers)]
+        for thread in threads:
+            thread.start()
+        _wait_for(lambda: flight.shared == callers - 1)
+        self.release.set()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def setUp(self):
+        self.release = threading.Event()
+        self.runs = 0
+
+    def _fn(self):
+        self.runs += 1
+        self.release.wait()
+        return object()
+
+    def test_shared(self):
+        flight = SingleFlight()
+        results = self._run(flight, self._fn, 4)
+        self.assertEqual(self.runs, 1)
+        self.assertEqual(len(set(id(result) for (result, shared)
+            in results)), 1)
+        self.assertEqual(sorted(shared for (result, shared) in results),
+                [False, True, True, True])
+        # Nothing is kept once the call is over.
+        self.assertEqual(flight.do('k', lambda: 'again'), ('again', False))
+
+    def test_error(self):
+        def fn():
+            self._fn()
+            raise KeyError('boom')
+
+        results = self._run(SingleFlight(), fn, 3)
+        self.assertEqual(self.runs, 1)
+        self.assertTrue(all(isinstance(e, KeyError) for e in results))
+
+    def test_async(self):
+        flight = SingleFlight()
+
+        async def fn():
+            self.runs += 1
+            await asyncio.sleep(0.01)
+            return 'result'
+
+        async def run():
+            cancelled = asyncio.ensure_future(flight.do_async('k', fn))
+            others = [flight.do_async('k', fn) for i in range(3)]
+            await asyncio.sleep(0)
+            # One caller giving up does not cancel the call.
+            cancelled.cancel()
+            return await asyncio.gather(*others)
+
+        results = asyncio.run(run())
+        self.assertEqual(self.runs, 1)
+        self.assertEqual(results, [('result', True)] * 3)
+
+    def test_coalescable(self):
+        self.assertTrue(coalescable({'method': 'rtm.tasks.getList'}))
+        self.assertFalse(coalescable({'method': 'rtm.tasks.add',
+            'timeline': '1'}))
+        self.assertFalse(coalescable({'method': 'rtm.timelines.create'}))
+        self.assertFalse(coalescable({'method': 'rtm.auth.getFrob'}))
+
+class APITest(unittest.TestCase):
+
+    def test_reads_coalesced(self):
+        release = threading.Event()
+        flight = SingleFlight()
+        rtm = API('key', 'secret', token='token', singleflight=flight)
+        requests = []
+
+        def request(method, model_cls, params, event=None):
+            requests.append(method)
+            release.wait()
+            return object(), None
+
+        rtm._request = request
+        results = []
+        threads = [threading.Thread(target=lambda:
+            results.append(rtm.tasks.getList(list_id=1))) for i in range(3)]
+        for thread in threads:
+            thread.start()
+        _wait_for(lambda: flight.shared == 2)
+        release.set()
+        for thread in threads:
+            thread.join()
+        rtm.transport.close()
+        self.assertEqual(requests, ['rtm.tasks.getList'])
+        self.assertEqual(len(set(id(result) for result in results)), 1)
+
+if __name__ == '__main__':
+    unittest.main()
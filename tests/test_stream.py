@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+
+import json
+import random
+import unittest
+
+from milky.stream import ArraySplitter, split_array, TASKS_LIST_PATH
+
+def _document(lists):
+    return json.dumps({'rsp': {'stat': 'ok', 'tasks': {'rev': '1',
+        'list': lists}}})
+
+def _feed(text, sizes):
+    splitter = ArraySplitter(TASKS_LIST_PATH)
+    elements = []
+    pos = 0
+    for size in sizes:
+        elements.extend(splitter.feed(text[pos:pos + size]))
+        pos += size
+    elements.extend(splitter.feed(text[pos:]))
+    splitter.close()
+    return splitter.skeleton, elements
+
+LISTS = [
+    {'id': '1', 'taskseries': [{'id': '10', 'name': 'braces {[ in ]} names',
+        'tags': {'tag': ['a', 'b']}, 'notes': []}]},
+    {'id': '2', 'name': 'quotes \\" and "escapes\\\\', 'taskseries': []},
+    {'id': '3', 'name': u'unicode é中', 'taskseries': [
+        {'id': '11', 'rrule': {'every': '1', '$t': 'FREQ=DAILY'},
+            'task': [{'id': '12', 'due': ''}]}]},
+    {'id': '4', 'list': [[], {}, [[{}]]]}, ]
+
+class ArraySplitterTest(unittest.TestCase):
+
+    def test_whole(self):
+        skeleton, elements = split_array(_document(LISTS), TASKS_LIST_PATH)
+        self.assertEqual([json.loads(e) for e in elements], LISTS)
+        self.assertEqual(json.loads(skeleton), {'rsp': {'stat': 'ok',
+            'tasks': {'rev': '1', 'list': []}}})
+
+    def test_chunks(self):
+        text = _document(LISTS)
+        expected = split_array(text, TASKS_LIST_PATH)
+        r = random.Random(7)
+        for n in range(200):
+            sizes = [r.randint(1, 40) for i in range(len(text) // 10)]
+            self.assertEqual(_feed(text, sizes), expected)
+        self.assertEqual(_feed(text, [1] * len(text)), expected)
+
+    def test_single_object(self):
+        # RTM sends an object instead of a one element array.
+        text = json.dumps({'rsp': {'tasks': {'list': LISTS[0]}}})
+        skeleton, elements = _feed(text, [3] * len(text))
+        self.assertEqual([json.loads(e) for e in elements], [LISTS[0]])
+        self.assertEqual(json.loads(skeleton),
+                {'rsp': {'tasks': {'list': []}}})
+
+    def test_other_arrays(self):
+        # Arrays under other keys, and before the path, are left alone.
+        text = json.dumps({'rsp': {'list': [1, 2], 'tasks': {'rev': '1'},
+            'lists': {'list': [{'id': '1'}]}}})
+        skeleton, elements = split_array(text, TASKS_LIST_PATH)
+        self.assertEqual(elements, [])
+        self.assertEqual(json.loads(skeleton), json.loads(text))
+
+    def test_empty(self):
+        skeleton, elements = split_array(_document([]), TASKS_LIST_PATH)
+        self.assertEqual(elements, [])
+        self.assertEqual(json.loads(skeleton)['rsp']['tasks']['list'], [])
+
+if __name__ == '__main__':
+    unittest.main()
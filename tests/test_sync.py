@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+
+import datetime
+import unittest
+
+from milky.models import Tasks
+from milky.sync import Replica, SyncEngine, CLOCK_MARGIN
+
+def _series():
+    return {'id': '1', 'created': '2011-08-22T10:59:09Z',
+            'modified': '2011-10-16T08:02:42Z', 'name': 'Task 1',
+            'source': 'api', 'url': '', 'location_id': '', 'tags': [],
+            'participants': [], 'notes': [],
+            'task': {'id': '1', 'due': '', 'has_due_time': '0',
+                'added': '2012-03-05T05:42:11Z', 'completed': '',
+                'deleted': '', 'priority': 'N', 'postponed': '0',
+                'estimate': ''}}
+
+def _tasks(*lists):
+    return Tasks._parse({'tasks': {'rev': 'r', 'list': list(lists)}})
+
+class MoveTest(unittest.TestCase):
+    """A task moved between lists comes back as added to the new list and
+    deleted from the old one in the same delta."""
+
+    def _replica(self):
+        replica = Replica()
+        replica.apply(_tasks({'id': '100', 'taskseries': [_series()]},
+            {'id': '101'}))
+        self.assertEqual(len(replica), 1)
+        return replica
+
+    def _deleted(self):
+        series = _series()
+        return {'id': '100', 'current': '2012-01-01T00:00:00Z',
+                'deleted': {'taskseries': {'id': series['id'], 'task': {
+                    'id': series['task']['id'],
+                    'deleted': '2012-01-01T00:00:00Z'}}}}
+
+    def _moved(self):
+        return {'id': '101', 'current': '2012-01-01T00:00:00Z',
+                'taskseries': [_series()]}
+
+    def check(self, replica, result):
+        self.assertEqual(len(replica), 1)
+        self.assertEqual((result.added, result.modified, result.deleted),
+                (0, 1, 0))
+        series = list(replica.taskseries.values())[0]
+        self.assertEqual(series.list_id, 101)
+
+    def test_deleted_after_added(self):
+        replica = self._replica()
+        self.check(replica, replica.apply(_tasks(self._moved(),
+            self._deleted())))
+
+    def test_deleted_before_added(self):
+        replica = self._replica()
+        self.check(replica, replica.apply(_tasks(self._deleted(),
+            self._moved())))
+
+class FakeTasks(object):
+    """api.tasks stand-in answering getList with the given responses."""
+
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.params = []
+
+    def getList(self, **params):
+        self.params.append(params)
+        return self.responses.pop(0)
+
+class FakeAPI(object):
+
+    def __init__(self, *responses):
+        self.tasks = FakeTasks(*responses)
+
+def _utcnow():
+    return datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+
+class LastSyncTest(unittest.TestCase):
+
+    def test_local_time_before_request(self):
+        # RTM's 'current' only echoes the last_sync of the request.
+        api = FakeAPI(_tasks({'id': '100', 'taskseries': [_series()]}),
+                _tasks({'id': '100', 'current': '2030-01-02T03:04:05Z'}),
+                _tasks({'id': '100'}))
+        engine = SyncEngine(api)
+
+        previous = None
+        for n in range(3):
+            before = _utcnow().replace(microsecond=0)
+            engine.sync()
+            after = _utcnow()
+            last_sync = engine.replica.last_sync
+            self.assertTrue(before - CLOCK_MARGIN <= last_sync
+                    <= after - CLOCK_MARGIN)
+            if previous is not None:
+                self.assertTrue(last_sync >= previous)
+                self.assertEqual(api.tasks.params[n]['last_sync'],
+                        previous.strftime('%Y-%m-%dT%H:%M:%SZ'))
+            else:
+                self.assertNotIn('last_sync', api.tasks.params[n])
+            previous = last_sync
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+
+from milky.api import API
+from milky.fakertm import FakeRTM
+from milky.transport import PooledTransport, Response, Validators
+
+def _response(body, status=200, etag='"1"'):
+    return Response(status, 'OK', {'etag': etag}, body)
+
+class ValidatorsTest(unittest.TestCase):
+
+    def test_off_by_default(self):
+        self.assertEqual(PooledTransport().validators, None)
+        self.assertTrue(isinstance(PooledTransport(validators=True)
+            .validators, Validators))
+
+    def test_max_bytes(self):
+        validators = Validators(max_bytes=10)
+        validators.update('a', None, _response(b'x' * 4))
+        validators.update('b', None, _response(b'x' * 4))
+        validators.update('c', None, _response(b'x' * 4))
+        self.assertEqual(validators.get('a'), None)
+        self.assertEqual(validators.bytes, 8)
+        # Too large to keep at all.
+        validators.update('d', None, _response(b'x' * 11))
+        self.assertEqual(validators.get('d'), None)
+        self.assertEqual(validators.bytes, 8)
+        validators.discard('b')
+        self.assertEqual(validators.bytes, 4)
+
+    def test_not_modified(self):
+        validators = Validators()
+        kept = _response(b'body')
+        kept.parsed = 'parsed'
+        validators.update('a', None, kept)
+        served = validators.update('a', kept,
+                Response(304, 'Not Modified', {'etag': '"1"'}, b''))
+        self.assertTrue(served.not_modified)
+        self.assertEqual((served.status, served.body, served.parsed),
+                (200, b'body', 'parsed'))
+        self.assertTrue(validators.get('a') is served)
+
+class ConditionalTest(unittest.TestCase):
+
+    def test_parsed_once(self):
+        with FakeRTM(lists=2, taskseries=5, etags=True) as server:
+            transport = PooledTransport(validators=True)
+            rtm = API(server.api_key, server.shared_secret,
+                    token=server.token, api_url=server.url,
+                    transport=transport)
+            first = rtm.tasks.getList()
+            second = rtm.tasks.getList()
+            transport.close()
+        self.assertEqual(transport.stats.not_modified, 1)
+        # The 304 answer is neither decoded nor parsed again.
+        self.assertTrue(second is first)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,512 @@
+# -*- coding: utf-8 -*-
+
+import io
+import threading
+import time
+import zlib
+from collections import OrderedDict, deque
+
+try:
+    import http.client as httplib
+    from urllib.parse import urlsplit, parse_qs
+except ImportError:
+    import httplib
+    from urlparse import urlsplit, parse_qs
+
+DEFAULT_POOL_SIZE = 4
+DEFAULT_IDLE_TIMEOUT = 30.0
+DEFAULT_TIMEOUT = 30.0
+# Responses kept by Validators for conditional requests, and their most
+# body bytes in total
+DEFAULT_VALIDATORS_SIZE = 64
+DEFAULT_VALIDATORS_BYTES = 16 * 1024 * 1024
+
+# Content codings asked for when compress is on
+ACCEPT_ENCODING = 'gzip, deflate'
+# Body bytes read from the connection at a time while decoding
+READ_SIZE = 64 * 1024
+
+class StaleConnection(IOError):
+    """An idle keep-alive connection was found closed by the server before
+    any byte of the response arrived; error is the original exception."""
+
+    def __init__(self, error):
+        super(StaleConnection, self).__init__(str(error))
+        self.error = error
+
+def resendable(method, query):
+    """Whether a request may be sent again on a new connection after a
+    stale one: never POSTs or timeline writes, which the server may have
+    applied."""
+
+    return method != 'POST' and 'timeline' not in parse_qs(query)
+
+class Response(object):
+    """A fully read HTTP response.
+
+    body - the body with its content coding removed.
+    connect - seconds until the headers arrived, if the transport knows.
+    wire_bytes - body bytes as received (Default: len(body))
+    not_modified - whether the body is the kept copy of a response the
+        server answered with 304 Not Modified.
+    parsed - what the client made of the body, set by the client and
+        handed on to the responses served from this one after a 304.
+    """
+
+    def __init__(self, status, reason, headers, body, connect=None,
+            wire_bytes=None):
+        self.status = status
+        self.reason = reason
+        self.headers = headers
+        self.body = body
+        self.connect = connect
+        if wire_bytes is None:
+            wire_bytes = len(body)
+        self.wire_bytes = wire_bytes
+        self.not_modified = False
+        self.parsed = None
+
+    def __repr__(self):
+        return '<Response - %d %s (%d bytes)>' % (
+                self.status, self.reason, len(self.body))
+
+class StreamResponse(object):
+    """A response whose body is read incrementally.
+
+    close() (or leaving the with block) gives the connection back.
+    """
+
+    def __init__(self, status, reason, headers, fp, release=None):
+        self.status = status
+        self.reason = reason
+        self.headers = headers
+        self._fp = fp
+        self._release = release
+
+    @property
+    def wire_bytes(self):
+        return getattr(self._fp, 'wire_bytes', None)
+
+    @property
+    def decoded_bytes(self):
+        return getattr(self._fp, 'decoded_bytes', None)
+
+    def read(self, size=None):
+        return self._fp.read(size)
+
+    def close(self):
+        release, self._release = self._release, None
+        if release is not None:
+            release()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+class TransportStats(object):
+    """Connection counters of a transport.
+
+    requests - requests sent.
+    created - new connections opened.
+    reused - requests served by an idle keep-alive connection.
+    expired - idle connections dropped because of the idle timeout.
+    not_modified - responses served from Validators after a 304.
+    wire_bytes - response body bytes received.
+    decoded_bytes - response body bytes after decompression, kept
+        bodies served after a 304 included.
+    """
+
+    def __init__(self):
+        self.requests = 0
+        self.created = 0
+        self.reused = 0
+        self.expired = 0
+        self.not_modified = 0
+        self.wire_bytes = 0
+        self.decoded_bytes = 0
+
+    def count(self, wire_bytes, decoded_bytes, not_modified=False):
+        self.wire_bytes += wire_bytes
+        self.decoded_bytes += decoded_bytes
+        if not_modified:
+            self.not_modified += 1
+
+    def __repr__(self):
+        return '<TransportStats - requests=%d, created=%d, reused=%d, ' \
+                'expired=%d, not_modified=%d, wire_bytes=%d, ' \
+                'decoded_bytes=%d>' % (self.requests, self.created,
+                self.reused, self.expired, self.not_modified,
+                self.wire_bytes, self.decoded_bytes)
+
+class Decompressor(object):
+    """Incremental decoder of a gzip or deflate body.
+
+    deflate should be zlib data, but some servers send a raw deflate
+    stream; both are accepted.
+    """
+
+    def __init__(self, coding):
+        self.coding = coding
+        if coding == 'deflate':
+            self._obj = zlib.decompressobj()
+        else:
+            self._obj = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        self._first = coding == 'deflate'
+
+    def decompress(self, data):
+        if self._first and data:
+            self._first = False
+            try:
+                return self._obj.decompress(data)
+            except zlib.error:
+                self._obj = zlib.decompressobj(-zlib.MAX_WBITS)
+        return self._obj.decompress(data)
+
+    def flush(self):
+        return self._obj.flush()
+
+def decompressor(headers):
+    """Decompressor of the Content-Encoding in (lower-cased) response
+    headers, or None for an identity body."""
+
+    coding = headers.get('content-encoding', '').strip().lower()
+    if coding in ('gzip', 'x-gzip', 'deflate'):
+        return Decompressor(coding)
+    return None
+
+class DecodingReader(object):
+    """File-like object decoding the body of fp while it is read.
+
+    wire_bytes and decoded_bytes count what was read so far.
+    """
+
+    def __init__(self, fp, decoder=None):
+        self._fp = fp
+        self._decoder = decoder
+        self._buffer = b''
+        self._pos = 0
+        self._eof = False
+        self.wire_bytes = 0
+        self.decoded_bytes = 0
+
+    def _fill(self):
+        """Decode the next piece of fp into the buffer; False at the end."""
+
+        while not self._eof:
+            data = self._fp.read(READ_SIZE)
+            self.wire_bytes += len(data)
+            if self._decoder is None:
+                decoded = data
+            elif data:
+                decoded = self._decoder.decompress(data)
+            else:
+                decoded = self._decoder.flush()
+            if not data:
+                self._eof = True
+            if decoded:
+                self._buffer = self._buffer[self._pos:] + decoded
+                self._pos = 0
+                return True
+        return False
+
+    def read(self, size=None):
+        if size is None or size < 0:
+            chunks = [self._buffer[self._pos:]]
+            self._buffer = b''
+            self._pos = 0
+            while self._fill():
+                chunks.append(self._buffer)
+                self._buffer = b''
+            data = b''.join(chunks)
+        else:
+            if self._pos >= len(self._buffer):
+                self._fill()
+            data = self._buffer[self._pos:self._pos + size]
+            self._pos += len(data)
+        self.decoded_bytes += len(data)
+        return data
+
+class Validators(object):
+    """ETag and Last-Modified validators of read responses, per request
+    key, for conditional requests.
+
+    A 200 response carrying either validator is kept (the maxsize most
+    recently used ones, with at most max_bytes of bodies). The next
+    request of its key is sent with If-None-Match / If-Modified-Since, and
+    a 304 Not Modified answer is served from the kept response instead of
+    a new body.
+    """
+
+    def __init__(self, maxsize=DEFAULT_VALIDATORS_SIZE,
+            max_bytes=DEFAULT_VALIDATORS_BYTES):
+        self.maxsize = maxsize
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self._responses = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Kept Response of key, or None."""
+
+        with self._lock:
+            response = self._responses.get(key)
+            if response is not None:
+                self._responses.move_to_end(key)
+            return response
+
+    def conditions(self, response):
+        """Request headers revalidating a kept response."""
+
+        headers = {}
+        if 'etag' in response.headers:
+            headers['If-None-Match'] = response.headers['etag']
+        if 'last-modified' in response.headers:
+            headers['If-Modified-Since'] = response.headers['last-modified']
+        return headers
+
+    def update(self, key, kept, response):
+        """The response to give for response to a request of key sent
+        with the validators of kept (or without any when kept is None)."""
+
+        if response.status == 304 and kept is not None:
+            headers = dict(kept.headers)
+            for name in ('etag', 'last-modified', 'date', 'expires',
+                    'cache-control', ):
+                if name in response.headers:
+                    headers[name] = response.headers[name]
+            served = Response(kept.status, kept.reason, headers, kept.body,
+                    response.connect, response.wire_bytes)
+            served.not_modified = True
+            served.parsed = kept.parsed
+            self._set(key, served)
+            return served
+
+        if response.status == 200 and ('etag' in response.headers
+                or 'last-modified' in response.headers):
+            self._set(key, response)
+        elif kept is not None:
+            self.discard(key)
+        return response
+
+    def _set(self, key, response):
+        with self._lock:
+            self._pop(key)
+            if len(response.body) > self.max_bytes:
+                return
+            self._responses[key] = response
+            self.bytes += len(response.body)
+            while len(self._responses) > self.maxsize \
+                    or self.bytes > self.max_bytes:
+                self.bytes -= len(self._responses.popitem(last=False)[1].body)
+
+    def _pop(self, key):
+        response = self._responses.pop(key, None)
+        if response is not None:
+            self.bytes -= len(response.body)
+
+    def discard(self, key):
+        with self._lock:
+            self._pop(key)
+
+    def clear(self):
+        with self._lock:
+            self._responses.clear()
+            self.bytes = 0
+
+class Transport(object):
+    """Base HTTP transport used by API.
+
+    Subclasses send a request and return a fully read Response. A stand-in
+    for tests only has to implement request().
+
+    A transport with a validators attribute (a Validators) also takes a
+    conditional argument: the request key of a read whose response may be
+    revalidated instead of downloaded again. API passes it for reads.
+    """
+
+    validators = None
+
+    def request(self, method, url, body=None, headers=None):
+        raise NotImplementedError
+
+    def stream(self, method, url, body=None, headers=None):
+        """Send a request and return a StreamResponse."""
+
+        response = self.request(method, url, body, headers)
+        return StreamResponse(response.status, response.reason,
+                response.headers, io.BytesIO(response.body))
+
+    def close(self):
+        pass
+
+class PooledTransport(Transport):
+    """Keep-alive transport that reuses connections per host.
+
+    Args:
+        pool_size - Maximum idle connections kept per host.
+        idle_timeout - Seconds an idle connection may be reused.
+        timeout - Socket timeout for new connections.
+        headers - Headers sent with every request.
+        compress - Ask for gzip or deflate responses; they are decoded
+            while they are read (Default: True)
+        validators - Validators revalidating reads the server sent an
+            ETag or Last-Modified for, or True for one per transport
+            (Default: off)
+    """
+
+    def __init__(self, pool_size=DEFAULT_POOL_SIZE,
+            idle_timeout=DEFAULT_IDLE_TIMEOUT, timeout=DEFAULT_TIMEOUT,
+            headers=None, compress=True, validators=None):
+        self.pool_size = pool_size
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout
+        self.headers = dict(headers or {})
+        if compress:
+            self.headers.setdefault('Accept-Encoding', ACCEPT_ENCODING)
+        if validators is True:
+            validators = Validators()
+        self.validators = validators or None
+        self.stats = TransportStats()
+        self._pools = {}
+        self._lock = threading.Lock()
+
+    def _connect(self, key):
+        scheme, host, port = key
+        if scheme == 'https':
+            return httplib.HTTPSConnection(host, port, timeout=self.timeout)
+        return httplib.HTTPConnection(host, port, timeout=self.timeout)
+
+    def _acquire(self, key):
+        """Return (connection, reused) for the host key."""
+
+        now = time.monotonic()
+        with self._lock:
+            self.stats.requests += 1
+            pool = self._pools.get(key)
+            while pool:
+                conn, last_used = pool.pop()
+                if now - last_used <= self.idle_timeout:
+                    self.stats.reused += 1
+                    return conn, True
+                conn.close()
+                self.stats.expired += 1
+            self.stats.created += 1
+        return self._connect(key), False
+
+    def _release(self, key, conn):
+        with self._lock:
+            pool = self._pools.setdefault(key, deque())
+            if len(pool) < self.pool_size:
+                pool.append((conn, time.monotonic()))
+                return
+        conn.close()
+
+    def _send(self, conn, method, path, body, headers):
+        """Response of a request on conn; raises StaleConnection when the
+        server had closed conn before answering."""
+
+        try:
+            conn.request(method, path, body, headers)
+        except (ConnectionResetError, BrokenPipeError) as e:
+            raise StaleConnection(e)
+        try:
+            return conn.getresponse()
+        except httplib.RemoteDisconnected as e:
+            # Empty status line: closed without reading the request.
+            raise StaleConnection(e)
+
+    def _open(self, method, url, body, headers):
+        """Send a request; return (key, connection, response)."""
+
+        parts = urlsplit(url)
+        key = (parts.scheme, parts.hostname, parts.port)
+        path = parts.path or '/'
+        if parts.query:
+            path = '%s?%s' % (path, parts.query)
+        request_headers = dict(self.headers)
+        if headers:
+            request_headers.update(headers)
+
+        conn, reused = self._acquire(key)
+        try:
+            rsp = self._send(conn, method, path, body, request_headers)
+        except StaleConnection as e:
+            conn.close()
+            if not reused or not resendable(method, parts.query):
+                raise e.error
+            # The server closed the idle connection; send once more on a
+            # new one. Timeouts and other errors are never resent, the
+            # request may have been applied.
+            with self._lock:
+                self.stats.created += 1
+            conn = self._connect(key)
+            try:
+                rsp = self._send(conn, method, path, body, request_headers)
+            except StaleConnection as e:
+                conn.close()
+                raise e.error
+            except Exception:
+                conn.close()
+                raise
+        except Exception:
+            conn.close()
+            raise
+        return key, conn, rsp
+
+    def _done(self, key, conn, rsp):
+        if rsp.will_close or not rsp.isclosed():
+            conn.close()
+        else:
+            self._release(key, conn)
+
+    def request(self, method, url, body=None, headers=None,
+            conditional=None):
+        kept = None
+        if conditional is not None and self.validators is not None:
+            kept = self.validators.get(conditional)
+            if kept is not None:
+                headers = dict(headers or {})
+                headers.update(self.validators.conditions(kept))
+
+        started = time.perf_counter()
+        key, conn, rsp = self._open(method, url, body, headers)
+        connect = time.perf_counter() - started
+        rsp_headers = dict((k.lower(), v) for (k, v) in rsp.getheaders())
+        reader = DecodingReader(rsp, decompressor(rsp_headers))
+        try:
+            data = reader.read()
+        except Exception:
+            conn.close()
+            raise
+        self._done(key, conn, rsp)
+
+        response = Response(rsp.status, rsp.reason, rsp_headers, data,
+                connect, reader.wire_bytes)
+        if conditional is not None and self.validators is not None:
+            response = self.validators.update(conditional, kept, response)
+        with self._lock:
+            self.stats.count(response.wire_bytes, len(response.body),
+                    response.not_modified)
+        return response
+
+    def stream(self, method, url, body=None, headers=None):
+        key, conn, rsp = self._open(method, url, body, headers)
+        rsp_headers = dict((k.lower(), v) for (k, v) in rsp.getheaders())
+        reader = DecodingReader(rsp, decompressor(rsp_headers))
+
+        def release():
+            self._done(key, conn, rsp)
+            with self._lock:
+                self.stats.count(reader.wire_bytes, reader.decoded_bytes)
+
+        return StreamResponse(rsp.status, rsp.reason, rsp_headers, reader,
+                release)
+
+    def close(self):
+        with self._lock:
+            pools, self._pools = self._pools, {}
+        for pool in pools.values():
+            for conn, last_used in pool:
+                conn.close()